@@ -101,6 +101,36 @@ DATABASES = {
     }
 }
 
+# Result cache of the RAG search endpoints (core/rag_cache.py)
+# AI_RAG_CACHE_BACKEND: locmem (per process), file (AI_RAG_CACHE_LOCATION is a
+# directory) or redis (AI_RAG_CACHE_LOCATION is a redis:// URL, needs redis-py)
+RAG_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+RAG_CACHE_BACKEND = os.environ.get('AI_RAG_CACHE_BACKEND', 'locmem').lower()
+RAG_CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'rag-results',
+    'file': str(BASE_DIR / 'rag_cache'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'rag': {
+        'BACKEND': RAG_CACHE_BACKENDS.get(RAG_CACHE_BACKEND, RAG_CACHE_BACKENDS['locmem']),
+        'LOCATION': os.environ.get('AI_RAG_CACHE_LOCATION') or RAG_CACHE_DEFAULT_LOCATIONS.get(RAG_CACHE_BACKEND, 'rag-results'),
+        'TIMEOUT': int(os.environ.get('AI_RAG_CACHE_TTL_SEC', '300')),
+        'KEY_PREFIX': 'rag',
+    },
+}
+# Redis evicts by its own maxmemory policy; the other backends cull past MAX_ENTRIES
+if RAG_CACHE_BACKEND != 'redis':
+    CACHES['rag']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('AI_RAG_CACHE_MAX_ENTRIES', '500'))}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
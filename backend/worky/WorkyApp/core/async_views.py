@@ -0,0 +1,403 @@
+"""
+Async (ASGI) versions of the RAG views
+Same parameters and responses as their counterparts in views.py, but Supabase
+and OpenAI are called through httpx without blocking the event loop and the
+scoring of every page runs in the scoring thread pool. Enabled with
+AI_ASYNC_VIEWS=true when served by an ASGI server (uvicorn, daphne...).
+"""
+
+import os
+import json
+import time
+import asyncio
+from contextlib import aclosing
+from urllib.error import HTTPError, URLError
+
+from django.views import View
+
+from .rag_analyzer import analyze_query, resolve_scorer, tokenized_profile_cache
+from .rag_async import afetch_pages, afetch_rows, arequest, arun_blocking, astream_lines, async_stats, run_scoring
+from .circuit import breaker_stats
+from .rag_cache import rag_result_cache, resolve_cache
+from .rag_context import estimate_prompt_tokens
+from .llm_cache import get_llm_cache, resolve_llm_cache
+from .rag_fetch import fetch_stats, pushdown_filter, rag_deadline, resolve_pushdown, track_pages
+from .rag_index import profile_index
+from .rag_parallel import parallel_stats
+from .rag_replica import get_replica
+from .rag_stream import StreamAbort, arespond, aresult_events, json_response, resolve_stream
+from .http_client import http_client, load_env
+from .views import (
+    PROFILE_SELECT,
+    ProfileAIAskView,
+    RankingView,
+    SupabaseAskView,
+    _openai_content,
+    _openai_request,
+    _openai_stream_delta,
+    _ProfileSearch,
+    _profile_url,
+    _supabase_http_error,
+    _VacancyRanking,
+)
+
+# The sync views only provide their (stateless) response helpers here
+_ask_view = SupabaseAskView()
+_profile_ask_view = ProfileAIAskView()
+
+
+def _supabase_headers(key):
+    return {
+        'apikey': key,
+        'Authorization': 'Bearer ' + key,
+    }
+
+
+async def _aprofile_pages(search, base, headers, filters, deadline=None):
+    """
+    Async _profile_pages: replica pages are read in the default executor, the
+    Supabase ones with concurrent range requests. Sets search.replica; id
+    ranges left out go to search.coverage.
+    """
+    replica = get_replica()
+    if replica is not None and replica.ready():
+        search.replica = replica.status()
+        search.pushdown = ''
+        pages = track_pages(replica.pages(filters), search.coverage)
+        while True:
+            rows = await arun_blocking(next, pages, None)
+            if rows is None:
+                return
+            yield rows
+    url = _profile_url(base, PROFILE_SELECT, filters, search.pushdown)
+    async with aclosing(afetch_pages(url, headers, deadline=deadline, coverage=search.coverage)) as pages:
+        async for rows in pages:
+            yield rows
+
+
+async def _aopenai_chat(messages, model='gpt-4.1-mini', temperature=0.2):
+    openai_request = _openai_request(messages, model, temperature)
+    if openai_request is None:
+        return 500, ''
+    url, body, headers = openai_request
+    try:
+        response = await arequest('POST', url, headers, body, timeout=15)
+        return response.status_code, _openai_content(response.json())
+    except HTTPError as e:
+        try:
+            err = e.read().decode('utf-8')
+        except Exception:
+            err = ''
+        return e.code, err
+    except URLError:
+        return 0, ''
+
+
+async def _acached_openai_chat(messages, use_cache, model='gpt-4.1-mini', temperature=0.2):
+    """
+    Async views._cached_openai_chat; the SQLite tier is read in the default executor
+    """
+    if not use_cache:
+        status_code, content = await _aopenai_chat(messages, model, temperature)
+        return status_code, content, None
+    llm_cache = get_llm_cache()
+    key = llm_cache.key(model, temperature, messages)
+    hit = await arun_blocking(llm_cache.get, key)
+    if hit is not None:
+        return 200, hit.pop('content'), dict(hit, hit=True)
+    start = time.time()
+    status_code, content = await _aopenai_chat(messages, model, temperature)
+    latency_ms = (time.time() - start) * 1000
+    if status_code == 200 and content:
+        await arun_blocking(llm_cache.set, key, content, latency_ms)
+    return status_code, content, {'hit': False, 'latency_ms': round(latency_ms, 1)}
+
+
+async def _aopenai_token_events(messages, use_cache, answer, model='gpt-4.1-mini', temperature=0.2):
+    """
+    Async views._openai_token_events. Async generators cannot return a value:
+    (status, content, cache info) is stored in answer['result'].
+    """
+    llm_cache = key = None
+    if use_cache:
+        llm_cache = get_llm_cache()
+        key = llm_cache.key(model, temperature, messages)
+        hit = await arun_blocking(llm_cache.get, key)
+        if hit is not None:
+            content = hit.pop('content')
+            yield 'token', {'text': content}
+            answer['result'] = 200, content, dict(hit, hit=True)
+            return
+    openai_request = _openai_request(messages, model, temperature, stream=True)
+    if openai_request is None:
+        answer['result'] = 500, '', None
+        return
+    url, body, headers = openai_request
+    start = time.time()
+    parts = []
+    try:
+        async with aclosing(astream_lines('POST', url, headers, body, timeout=15)) as lines:
+            async for line in lines:
+                delta = _openai_stream_delta(line)
+                if delta:
+                    parts.append(delta)
+                    yield 'token', {'text': delta}
+    except HTTPError as e:
+        try:
+            err = e.read().decode('utf-8')
+        except Exception:
+            err = ''
+        answer['result'] = e.code, err, None
+        return
+    except URLError:
+        answer['result'] = 0, ''.join(parts), None
+        return
+    content = ''.join(parts)
+    latency_ms = (time.time() - start) * 1000
+    if llm_cache is None:
+        answer['result'] = 200, content, None
+        return
+    if content:
+        await arun_blocking(llm_cache.set, key, content, latency_ms)
+    answer['result'] = 200, content, {'hit': False, 'latency_ms': round(latency_ms, 1)}
+
+
+def _json_body(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+class AsyncSupabaseRagHealthView(View):
+    async def get(self, request):
+        load_env()
+        base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        if not base or not key:
+            return json_response({"ok": False, "env": False}, 500)
+        headers = _supabase_headers(key)
+
+        try:
+            # Company and profile ids are counted concurrently
+            company_rows, profile_rows = await asyncio.gather(
+                afetch_rows(base.rstrip('/') + '/rest/v1/company?select=id', headers),
+                afetch_rows(base.rstrip('/') + '/rest/v1/profile?select=id', headers)
+            )
+            total = len(company_rows[0])
+            profile_total = len(profile_rows[0])
+            return json_response({
+                "ok": True,
+                "env": True,
+                "supabase": True,
+                "company_total": total,
+                "profile_total": profile_total,
+                "total": total + profile_total,
+                "token_cache": tokenized_profile_cache.stats(),
+                "profile_index": profile_index.stats(),
+                "parallel": parallel_stats(),
+                "http": http_client.stats(),
+                "async": async_stats(),
+                "breakers": breaker_stats(),
+                "fetch": fetch_stats(),
+                "result_cache": rag_result_cache.stats()
+            })
+        except Exception as e:
+            return json_response({"ok": False, "env": True, "supabase": False, "error": str(e)}, 502)
+
+
+class AsyncSupabaseAskView(View):
+    async def get(self, request):
+        load_env()
+        base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        q = (request.GET.get('q') or '').strip()
+        limit = int(request.GET.get('limit') or 5)
+        status_f = request.GET.get('status') or 'pending'
+        include_analysis = request.GET.get('analysis', 'true').lower() == 'true'
+        scorer = resolve_scorer(request.GET.get('scorer'))
+        stream = resolve_stream(request, request.GET.get('stream'))
+
+        if not base or not key:
+            return json_response({"error": "Missing Supabase env"}, 500)
+        headers = _supabase_headers(key)
+
+        query_analysis = analyze_query(q)
+        search = _ProfileSearch(query_analysis, scorer, limit, include_analysis, keep_all=not q)
+        if resolve_pushdown(request.GET.get('pushdown')):
+            search.pushdown = pushdown_filter(query_analysis['tokens'])
+
+        # The cache backend and the version probe block: default executor
+        cache_key = version = None
+        if resolve_cache(request.GET.get('cache')):
+            cache_key = _ask_view._cache_key(search, status_f)
+            version = await arun_blocking(rag_result_cache.version, base, headers, 'profile', {'status': status_f})
+            cached = await arun_blocking(rag_result_cache.get, cache_key, version)
+            if cached is not None:
+                return await arespond(aresult_events(cached), stream)
+
+        def match_entry(row, ma):
+            return _ask_view._match_entry(row, ma, include_analysis)
+
+        async def events():
+            deadline = rag_deadline()
+            start_time = time.time()
+            try:
+                async with aclosing(_aprofile_pages(search, base, headers, {'status': status_f}, deadline)) as pages:
+                    async for rows in pages:
+                        await run_scoring(search.feed, rows)
+                        if stream:
+                            yield 'progress', search.progress()
+                        if deadline.expired():
+                            break
+            except Exception as e:
+                search.coverage.fail(e, deadline)
+
+            top_k, scorer_stats = await run_scoring(search.rank, match_entry)
+            response_data = _ask_view._response_data(search, top_k, scorer_stats, q, deadline.expired())
+            if cache_key:
+                response_data['cached'] = False
+            yield 'result', response_data
+
+            if include_analysis:
+                analysis_summary = search.summary_acc.summary(query_analysis, top_k.count, time.time() - start_time)
+                yield 'analysis', analysis_summary
+                response_data = dict(response_data, analysis=analysis_summary)
+
+            if cache_key and not response_data['partial']:
+                await arun_blocking(rag_result_cache.set, cache_key, version, response_data)
+
+        return await arespond(events(), stream)
+
+
+class AsyncProfileAIAskView(View):
+    async def post(self, request):
+        load_env()
+        body = _json_body(request)
+        if body is None:
+            return json_response({'error': 'Invalid JSON body'}, 400)
+        q = (body.get('message') or '').strip()
+        status_f = body.get('status') or 'pending'
+        limit = int(body.get('limit') or 5)
+        include_analysis = body.get('analysis', True)
+        scorer = resolve_scorer(body.get('scorer'))
+        stream = resolve_stream(request, body.get('stream') or request.GET.get('stream'))
+        use_llm_cache = resolve_llm_cache(body.get('llm_cache'))
+
+        if not q:
+            return json_response({'error': 'Missing message'}, 400)
+
+        base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        if not base or not key:
+            return json_response({'error': 'Missing Supabase env'}, 500)
+        headers = _supabase_headers(key)
+
+        query_analysis = analyze_query(q)
+        search = _ProfileSearch(query_analysis, scorer, limit, include_analysis)
+        if resolve_pushdown(body.get('pushdown')):
+            search.pushdown = pushdown_filter(query_analysis['tokens'])
+
+        def match_entry(row, ma):
+            return _profile_ask_view._match_entry(row, ma, include_analysis)
+
+        async def events():
+            deadline = rag_deadline()
+            start_time = time.time()
+            try:
+                async with aclosing(_aprofile_pages(search, base, headers, {'status': status_f}, deadline)) as pages:
+                    async for rows in pages:
+                        await run_scoring(search.feed, rows)
+                        if stream:
+                            yield 'progress', search.progress()
+                        if deadline.expired():
+                            break
+            except HTTPError as e:
+                raise StreamAbort(_supabase_http_error(e), 502)
+            except URLError:
+                raise StreamAbort({"error": "Supabase URLError"}, 502)
+
+            top_k, scorer_stats = await run_scoring(search.rank, match_entry)
+            timed_out = deadline.expired()
+            elapsed_time = time.time() - start_time
+
+            top_matches = top_k.payloads()
+            contexts, packing = _profile_ask_view._contexts(top_matches)
+            messages = _profile_ask_view._messages(q, contexts)
+            packing['prompt_tokens'] = estimate_prompt_tokens(messages)
+            if stream:
+                yield 'ranked', {'matches': [{'id': str(c['id']), 'score': c['score'], 'name': c['name']} for c in contexts]}
+
+            if stream:
+                answer = {}
+                async for event in _aopenai_token_events(messages, use_llm_cache, answer):
+                    yield event
+                status_code, content, llm_cache_info = answer['result']
+            else:
+                status_code, content, llm_cache_info = await _acached_openai_chat(messages, use_llm_cache)
+            response_data = _profile_ask_view._response_data(search, scorer_stats, top_matches, contexts,
+                                                             status_code, content, timed_out)
+            response_data['context'] = packing
+            if llm_cache_info:
+                response_data['llm_cache'] = llm_cache_info
+            yield 'result', response_data
+
+            if include_analysis:
+                yield 'analysis', search.summary_acc.summary(query_analysis, search.total, elapsed_time)
+
+        return await arespond(events(), stream)
+
+
+class AsyncRankingView(View):
+    async def post(self, request):
+        load_env()
+        body = _json_body(request)
+        if body is None:
+            return json_response({'error': 'Invalid JSON body'}, 400)
+        limit = int(body.get('limit') or 5)
+        include_analysis = bool(body.get('analysis', False))
+        vacant_id = body.get('vacant_id')
+        scorer = resolve_scorer(body.get('scorer'))
+        stream = resolve_stream(request, body.get('stream') or request.GET.get('stream'))
+        if not vacant_id:
+            return json_response({'error': 'Missing vacant_id'}, 400)
+        base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        if not base or not key:
+            return json_response({'error': 'Missing Supabase env'}, 500)
+        headers = _supabase_headers(key)
+
+        url_v = base.rstrip('/') + f'/rest/v1/vacant?id=eq.{vacant_id}&select=*&limit=1'
+        deadline = rag_deadline()
+        try:
+            vrows, _ = await afetch_rows(url_v, headers, deadline.timeout())
+        except HTTPError as e:
+            return json_response(_supabase_http_error(e), 502)
+        except URLError:
+            return json_response({'error': 'Supabase URLError'}, 502)
+        vacancy = vrows[0] if vrows else None
+        if not vacancy:
+            return json_response({'error': 'Vacante no encontrada', 'vacant_id': str(vacant_id)}, 404)
+        ranking = _VacancyRanking(vacant_id, vacancy, scorer, limit, include_analysis)
+        if resolve_pushdown(body.get('pushdown')):
+            ranking.pushdown = pushdown_filter(ranking.query['tokens'])
+
+        async def events():
+            start_time = time.time()
+            try:
+                async with aclosing(_aprofile_pages(ranking, base, headers, {'vacant_id': vacant_id}, deadline)) as pages:
+                    async for rows in pages:
+                        await run_scoring(ranking.feed, rows)
+                        if stream:
+                            yield 'progress', ranking.progress()
+                        if deadline.expired():
+                            break
+            except Exception as e:
+                ranking.coverage.fail(e, deadline)
+            timed_out = deadline.expired()
+            response = await run_scoring(ranking.response, RankingView._match_entry, timed_out, time.time() - start_time)
+            async for event in aresult_events(response):
+                yield event
+
+        return await arespond(events(), stream)
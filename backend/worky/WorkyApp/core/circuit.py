@@ -0,0 +1,205 @@
+"""
+Circuit breakers for the external dependencies (Supabase, OpenAI)
+http_client and rag_async consult the breaker of a request's host before
+sending it: while a dependency is known to be down the call fails at once with
+URLError instead of waiting for a timeout. Breakers open after consecutive
+failures or when the health refresher finds the dependency unreachable, and
+let one trial request through once their reset timeout has passed.
+Only outcomes that say something about the dependency count: a timeout
+shortened to the caller's remaining budget, or a request the caller has
+abandoned (the losing hedge request), is neither a failure nor a success.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Iterator, Optional
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+BREAKER_FAILURES = int(os.environ.get('AI_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SEC = float(os.environ.get('AI_BREAKER_RESET_SEC', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(URLError):
+    """
+    Raised instead of sending a request to a dependency whose breaker is open
+    """
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f'{name} unavailable (circuit open, retry in {retry_in:.0f}s)')
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures (or trip()); open ->
+    half_open once `reset_sec` have passed, letting a single trial through;
+    its outcome closes or reopens the breaker
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_sec: float = BREAKER_RESET_SEC,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failures = failures
+        self.reset_sec = reset_sec
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.metrics = {'rejected': 0, 'opened': 0}
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now
+        """
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_sec:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.metrics['rejected'] += 1
+            return False
+
+    def check(self) -> None:
+        """
+        allow() or raise CircuitOpenError
+        """
+        if not self.allow():
+            retry_in = max(0.0, self.reset_sec - (self.clock() - (self.opened_at or self.clock())))
+            raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Any = None) -> None:
+        """
+        A failed request; ignored (see release()) when its caller abandoned it
+        """
+        if request_abandoned():
+            self.release()
+            return
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else self.last_error
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+                self._open()
+
+    def release(self) -> None:
+        """
+        The request ended without telling whether the dependency is up: nothing
+        is counted, but a half-open trial slot is handed back
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def trip(self, error: Any = None) -> None:
+        """
+        Open right away (the health probe saw the dependency down)
+        """
+        with self._lock:
+            self.last_error = str(error) if error is not None else self.last_error
+            self._open()
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            self.metrics['opened'] += 1
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_for_sec': round(self.clock() - self.opened_at, 1) if self.opened_at is not None else None,
+                'last_error': self.last_error,
+                **self.metrics
+            }
+
+
+# Set by the thread (or task) sending a request its caller may stop waiting for
+_abandoned: 'ContextVar[Optional[threading.Event]]' = ContextVar('abandoned', default=None)
+
+
+@contextmanager
+def abandonable(event: Optional[threading.Event]) -> Iterator[None]:
+    """
+    Requests sent inside the block count as abandoned once `event` is set
+    """
+    token = _abandoned.set(event)
+    try:
+        yield
+    finally:
+        _abandoned.reset(token)
+
+
+def request_abandoned() -> bool:
+    event = _abandoned.get()
+    return event is not None and event.is_set()
+
+
+def shortened_timeout(error: BaseException, timeout: float, cap: float, timeout_errors: Any) -> bool:
+    """
+    `error` is a timeout that fired before the full `cap`: the caller's
+    deadline ran out, which says nothing about the dependency
+    """
+    return isinstance(error, timeout_errors) and timeout < cap
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def dependency_urls() -> Dict[str, Optional[str]]:
+    """
+    Base URL of every guarded dependency
+    """
+    return {
+        'supabase': os.environ.get('NEXT_PUBLIC_SUPABASE_URL'),
+        'openai': os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1'),
+    }
+
+
+def breaker_for(url: str) -> Optional[CircuitBreaker]:
+    """
+    Breaker of the dependency `url` belongs to (None for other hosts)
+    """
+    host = urlsplit(url).netloc.lower()
+    for name, base in dependency_urls().items():
+        if base and urlsplit(base).netloc.lower() == host:
+            return get_breaker(name)
+    return None
+
+
+def breaker_stats() -> Dict[str, Any]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
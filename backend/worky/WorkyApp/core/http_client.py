@@ -0,0 +1,257 @@
+"""
+Shared outbound HTTP client for Supabase and OpenAI calls
+Wraps one httpx.Client (the stack rag_async uses too): keep-alive pool per
+host, gzip bodies, HTTP(S)_PROXY / NO_PROXY from the environment, plus
+connection reuse metrics. `urlopen` is a drop-in for urllib's: same Request
+objects, same HTTPError/URLError exceptions.
+"""
+
+import io
+import os
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request
+
+import httpx
+
+from .circuit import breaker_for, shortened_timeout
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """
+    Load the nearest .env file into os.environ (existing variables win).
+    Runs once per process; later calls are no-ops.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        for base in list(Path(__file__).resolve().parents)[1:8]:
+            p = base / '.env'
+            if p.exists():
+                for line in p.read_text(encoding='utf-8').splitlines():
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    if '=' in line:
+                        k, v = line.split('=', 1)
+                        os.environ.setdefault(k.strip(), v.strip())
+                break
+        _env_loaded = True
+
+
+# Errors meaning a pooled keep-alive connection was closed by the server
+# before it answered; the request was not processed and is sent again once
+_STALE_ERRORS = (httpx.RemoteProtocolError, httpx.WriteError)
+
+
+class PooledResponse:
+    """
+    Response of a pooled request, read incrementally. read() returns decoded
+    (gunzipped) bytes and only returns b'' at the end of the body; the
+    connection goes back to the pool once the body is fully read.
+    """
+
+    def __init__(self, response: httpx.Response, url: str):
+        self.response = response
+        self.url = url
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+        self._chunks = response.iter_bytes()
+        self._buffer = b''
+        self._done = False
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.headers.get(name, default)
+
+    def _next_chunk(self) -> bytes:
+        # Decoded bytes as they arrive; b'' (and the connection released) at the end
+        if not self._done:
+            try:
+                for chunk in self._chunks:
+                    if chunk:
+                        return chunk
+            except httpx.HTTPError as e:
+                self.close()
+                raise URLError(e)
+            self.close()
+        return b''
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+            while True:
+                chunk = self._next_chunk()
+                if not chunk:
+                    return data
+                data += chunk
+        # The decompressor can hold output back, so keep reading until amt
+        # bytes are buffered or the body ends
+        while len(self._buffer) < amt:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """
+        Body lines as they arrive (streamed responses such as server-sent
+        events). Lines keep no trailing newline.
+        """
+        pending, self._buffer = self._buffer, b''
+        while True:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            *lines, pending = (pending + chunk).split(b'\n')
+            yield from lines
+        if pending:
+            yield pending
+
+    def close(self) -> None:
+        """
+        Give the connection back if the body was consumed, otherwise drop it
+        """
+        if not self._done:
+            self._done = True
+            self.response.close()
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class HTTPClient:
+    """
+    httpx.Client keeping at most `max_idle` idle connections per host
+    """
+
+    def __init__(self, max_idle: int = 8, default_timeout: float = 8, gzip: bool = True):
+        self.max_idle = max_idle
+        self.default_timeout = default_timeout
+        self.gzip = gzip
+        self.metrics = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'stale_retries': 0, 'errors': 0}
+        # Network streams already seen: a response on one of them reused its connection
+        self._streams: 'weakref.WeakSet[Any]' = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(
+                    limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.max_idle),
+                    timeout=self.default_timeout,
+                    headers={'Accept-Encoding': 'gzip' if self.gzip else 'identity'},
+                    trust_env=True
+                )
+            return self._client
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes], timeout: float) -> httpx.Response:
+        client = self.client
+        request = client.build_request(method, url, headers=headers, content=body, timeout=timeout)
+        try:
+            response = client.send(request, stream=True)
+        except _STALE_ERRORS:
+            # The server dropped the idle connection; retry once on a fresh one
+            with self._lock:
+                self.metrics['stale_retries'] += 1
+            response = client.send(request, stream=True)
+        stream = response.extensions.get('network_stream')
+        with self._lock:
+            if stream is not None and stream in self._streams:
+                self.metrics['connections_reused'] += 1
+            else:
+                self.metrics['connections_opened'] += 1
+                if stream is not None:
+                    self._streams.add(stream)
+        return response
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None,
+                timeout: Optional[float] = None, guard: bool = True) -> PooledResponse:
+        """
+        Send a request on a pooled connection. Raises HTTPError for 4xx/5xx
+        responses and URLError when the host cannot be reached, right away
+        while the host's circuit breaker is open (guard=False skips it).
+        """
+        breaker = breaker_for(url) if guard else None
+        if breaker is not None:
+            breaker.check()
+        timeout = self.default_timeout if timeout is None else timeout
+        with self._lock:
+            self.metrics['requests'] += 1
+        try:
+            response = self._send(method, url, dict(headers or {}), body, timeout)
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            with self._lock:
+                self.metrics['errors'] += 1
+            if breaker is not None:
+                if shortened_timeout(e, timeout, self.default_timeout, httpx.TimeoutException):
+                    breaker.release()
+                else:
+                    breaker.record_failure(e)
+            raise URLError(e)
+
+        result = PooledResponse(response, url)
+        if breaker is not None:
+            # 4xx means the dependency is up; only server errors count against it
+            if result.status >= 500:
+                breaker.record_failure(f'HTTP {result.status}')
+            else:
+                breaker.record_success()
+        if result.status >= 400:
+            try:
+                payload = result.read()
+            except httpx.HTTPError:
+                payload = b''
+            raise HTTPError(url, result.status, result.reason, result.headers, io.BytesIO(payload))
+        return result
+
+    def urlopen(self, req: Any, timeout: Optional[float] = None) -> PooledResponse:
+        """
+        urllib.request.urlopen replacement for Request objects (or plain URLs)
+        """
+        if isinstance(req, str):
+            req = Request(req)
+        return self.request(req.get_method(), req.full_url, dict(req.header_items()), req.data, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            opened = self.metrics['connections_opened']
+            reused = self.metrics['connections_reused']
+            return {
+                **self.metrics,
+                'reuse_ratio': round(reused / (opened + reused), 3) if opened + reused else 0,
+                'max_idle': self.max_idle
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+http_client = HTTPClient(
+    max_idle=int(os.environ.get('AI_HTTP_POOL_SIZE', '8')),
+    default_timeout=float(os.environ.get('AI_HTTP_TIMEOUT_SEC', '8')),
+    gzip=os.environ.get('AI_HTTP_GZIP', 'true').lower() == 'true'
+)
+
+
+def urlopen(req: Any, timeout: Optional[float] = None) -> PooledResponse:
+    return http_client.urlopen(req, timeout)
@@ -0,0 +1,170 @@
+"""
+Response cache for the OpenAI chat completions
+Completions are content-addressed by a hash of model, temperature and
+messages: a bounded in-memory LRU in front of a SQLite file shared by the
+worker processes. Entries expire after a TTL; only successful answers are
+stored. Every hit reports how long the original call took (the latency saved).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+LLM_CACHE_ENABLED = os.environ.get('AI_LLM_CACHE', 'false').lower() == 'true'
+LLM_CACHE_TTL_SEC = float(os.environ.get('AI_LLM_CACHE_TTL_SEC', '86400'))
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get('AI_LLM_CACHE_MEMORY_ENTRIES', '256'))
+# 'off' keeps the cache in memory only
+LLM_CACHE_PATH = os.environ.get('AI_LLM_CACHE_PATH') or str(Path(__file__).resolve().parent.parent / 'llm_cache.sqlite3')
+
+
+def resolve_llm_cache(value: Any) -> bool:
+    """
+    LLM cache switch from a request parameter (llm_cache=false bypasses it),
+    falling back to AI_LLM_CACHE
+    """
+    if not LLM_CACHE_ENABLED:
+        return False
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of completion contents: memory (LRU) then SQLite. A disk
+    hit is promoted to the memory tier.
+    """
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL_SEC,
+                 max_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.path = None if path in (None, '', 'off') else path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (stored_at, latency_ms, content)
+        self.entries: 'OrderedDict[str, Tuple[float, float, str]]' = OrderedDict()
+        self.metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'saved_ms': 0.0}
+        self._lock = threading.Lock()
+        if self.path:
+            with closing(self._connect()) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS completion ('
+                    ' key TEXT PRIMARY KEY, stored_at REAL NOT NULL, latency_ms REAL NOT NULL, content TEXT NOT NULL)'
+                )
+                conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def key(model: str, temperature: float, messages: List[Dict[str, Any]]) -> str:
+        raw = json.dumps([model, temperature, messages], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached content for `key`, with the tier it came from, its age and the
+        latency of the call it saves; None on a miss or an expired entry
+        """
+        now = time.time()
+        tier = 'memory'
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.path:
+            tier = 'disk'
+            with closing(self._connect()) as conn:
+                entry = conn.execute(
+                    'SELECT stored_at, latency_ms, content FROM completion WHERE key = ?', (key,)
+                ).fetchone()
+                if entry is not None and now - entry[0] > self.ttl:
+                    conn.execute('DELETE FROM completion WHERE key = ?', (key,))
+                    conn.commit()
+
+        expired = entry is not None and now - entry[0] > self.ttl
+        with self._lock:
+            if entry is None or expired:
+                self.metrics['misses'] += 1
+                self.metrics['expired'] += int(expired)
+                if expired:
+                    self.entries.pop(key, None)
+                return None
+            stored_at, latency_ms, content = entry
+            self.metrics[f'{tier}_hits'] += 1
+            self.metrics['saved_ms'] += latency_ms
+            if tier == 'disk':
+                self._remember(key, (stored_at, latency_ms, content))
+        return {
+            'content': content,
+            'tier': tier,
+            'age_sec': round(now - stored_at, 1),
+            'saved_ms': round(latency_ms, 1)
+        }
+
+    def set(self, key: str, content: str, latency_ms: float) -> None:
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, (stored_at, latency_ms, content))
+            self.metrics['stores'] += 1
+        if self.path:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO completion (key, stored_at, latency_ms, content) VALUES (?, ?, ?, ?)',
+                    (key, stored_at, latency_ms, content)
+                )
+                conn.execute('DELETE FROM completion WHERE stored_at < ?', (stored_at - self.ttl,))
+                conn.commit()
+
+    def _remember(self, key: str, entry: Tuple[float, float, str]) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+        if self.path:
+            with closing(self._connect()) as conn:
+                conn.execute('DELETE FROM completion')
+                conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.metrics['memory_hits'] + self.metrics['disk_hits']
+            lookups = hits + self.metrics['misses']
+            return {
+                'enabled': LLM_CACHE_ENABLED,
+                'path': self.path,
+                'ttl_sec': self.ttl,
+                'memory_size': len(self.entries),
+                **self.metrics,
+                'saved_ms': round(self.metrics['saved_ms'], 1),
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    Process-wide cache. The SQLite tier (and its file) only exists with
+    AI_LLM_CACHE on; otherwise the cache is memory-only and just reports stats.
+    """
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(LLM_CACHE_PATH if LLM_CACHE_ENABLED else None)
+        return _llm_cache
@@ -0,0 +1,100 @@
+"""
+Throughput benchmark for the RAG ranking paths on synthetic profiles
+
+    python manage.py rag_benchmark --profiles 100000 --queries 20
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.rag_analyzer import analyze_query, analyze_profile_match, rank_profile_index, QueryMatcher, bm25f_rank
+from core.rag_index import ProfileIndex
+from core.rag_sparse import SPARSE_AVAILABLE, SparseScorer
+
+TECH_TERMS = [
+    'python', 'java', 'javascript', 'typescript', 'react', 'angular', 'node', 'django', 'flask',
+    'sql', 'postgresql', 'mongodb', 'docker', 'kubernetes', 'aws', 'azure', 'devops', 'scrum',
+    'backend', 'frontend', 'fullstack', 'desarrollador', 'ingeniero', 'analista', 'datos',
+    'ventas', 'marketing', 'contabilidad', 'gestion', 'proyectos', 'soporte', 'redes',
+]
+
+
+def synthetic_profiles(count, seed=7, vocabulary_size=5000):
+    rng = random.Random(seed)
+    filler = ['term%d' % i for i in range(vocabulary_size)]
+
+    def words(n):
+        return ' '.join(rng.choice(TECH_TERMS) if rng.random() < 0.3 else rng.choice(filler) for _ in range(n))
+
+    for profile_id in range(1, count + 1):
+        yield {
+            'id': profile_id,
+            'personal_information': {'name': 'Profile %d' % profile_id, 'summary': words(12)},
+            'skills': {'technical': words(6).split(), 'languages': ['es', 'en']},
+            'experience': [{'title': words(3), 'company': words(1), 'description': words(20)} for _ in range(2)],
+            'education': [{'degree': words(2), 'institution': words(2)}],
+            'projects': [{'title': words(2), 'description': words(10)}],
+        }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RAG ranking throughput (linear scan, inverted index, BM25F, sparse) on synthetic profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--linear-sample', type=int, default=2000,
+                            help='Profiles scored with analyze_profile_match to extrapolate the linear scan')
+
+    def handle(self, *args, **options):
+        count = options['profiles']
+        limit = options['limit']
+        rng = random.Random(11)
+        queries = [
+            analyze_query(' '.join(rng.sample(TECH_TERMS, rng.randint(2, 6))))
+            for _ in range(options['queries'])
+        ]
+
+        started = time.perf_counter()
+        profiles = list(synthetic_profiles(count))
+        self.stdout.write(f'generated {count} profiles in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        index = ProfileIndex()
+        for profile in profiles:
+            index.add(profile)
+        self.stdout.write(f'indexed in {time.perf_counter() - started:.1f}s ({len(index.vocabulary)} terms)')
+
+        sample = profiles[:options['linear_sample']]
+        started = time.perf_counter()
+        for query_analysis in queries:
+            matcher = QueryMatcher(query_analysis['tokens'])
+            for profile in sample:
+                analyze_profile_match(profile, query_analysis, matcher)
+        per_profile = (time.perf_counter() - started) / (len(queries) * len(sample))
+        self._report('linear scan (extrapolated)', per_profile * count, count)
+
+        self._time('inverted index', count, queries, lambda qa: rank_profile_index(index, qa)[:limit])
+        self._time('bm25f maxscore', count, queries, lambda qa: bm25f_rank(index, qa, limit))
+
+        if not SPARSE_AVAILABLE:
+            self.stdout.write('sparse: numpy/scipy not installed, skipped')
+            return
+        scorer = SparseScorer(index)
+        started = time.perf_counter()
+        scorer.refresh()
+        self.stdout.write(f'sparse matrices built in {time.perf_counter() - started:.1f}s')
+        self._time('sparse', count, queries, lambda qa: scorer.top_k(qa, limit))
+
+    def _time(self, label, count, queries, run):
+        started = time.perf_counter()
+        for query_analysis in queries:
+            run(query_analysis)
+        self._report(label, (time.perf_counter() - started) / len(queries), count)
+
+    def _report(self, label, seconds_per_query, count):
+        throughput = count / seconds_per_query if seconds_per_query else float('inf')
+        self.stdout.write(f'{label:28s} {seconds_per_query * 1000:10.1f} ms/query {throughput:14,.0f} profiles/s')
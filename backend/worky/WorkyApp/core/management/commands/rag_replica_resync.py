@@ -0,0 +1,51 @@
+"""
+Full resync of the local profile replica from Supabase
+
+    python manage.py rag_replica_resync          # whole table, drops rows deleted upstream
+    python manage.py rag_replica_resync --delta  # only rows beyond the id watermark
+    python manage.py rag_replica_resync --loop   # keep syncing (AI_RAG_REPLICA_SYNC=command)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rag_replica import ProfileReplica, REPLICA_PATH, REPLICA_SYNC_SEC, supabase_source, sync_turn
+
+
+class Command(BaseCommand):
+    help = 'Resync the local SQLite replica of the profile table from Supabase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delta', action='store_true', help='Only fetch rows beyond the stored id watermark')
+        parser.add_argument('--path', default=REPLICA_PATH, help='Replica file (default AI_RAG_REPLICA_PATH)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Sync every AI_RAG_REPLICA_SYNC_SEC (full every AI_RAG_REPLICA_FULL_SYNC_SEC)')
+
+    def handle(self, *args, **options):
+        base, headers = supabase_source()
+        if not base:
+            raise CommandError('Missing Supabase env (NEXT_PUBLIC_SUPABASE_URL and a key)')
+        replica = ProfileReplica(options['path'])
+        if options['loop']:
+            self._loop(replica)
+            return
+        started = time.time()
+        try:
+            fetched = replica.sync(base, headers, full=not options['delta'])
+        except Exception as e:
+            raise CommandError(f'Sync failed: {e}')
+        status = replica.status()
+        self.stdout.write(
+            f"{'delta' if options['delta'] else 'full'} sync: {fetched} rows fetched in {time.time() - started:.1f}s, "
+            f"{status['rows']} rows in {replica.path} (watermark id {status['watermark_id']})"
+        )
+
+    def _loop(self, replica):
+        # Waits while another process (an elected web worker) holds the sync lock
+        while True:
+            if sync_turn(replica):
+                status = replica.status()
+                self.stdout.write(f"{status['rows']} rows, watermark id {status['watermark_id']}, "
+                                  f"last error: {status['last_error']}")
+            time.sleep(REPLICA_SYNC_SEC)
@@ -4,9 +4,15 @@ Provides detailed analytics and structured responses for better data understandi
 """
 
 import re
+import os
+import json
+import math
+import heapq
+import hashlib
+import threading
 import unicodedata
-from typing import Dict, List, Any, Optional, Tuple
-from collections import defaultdict
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from collections import OrderedDict
 import time
 
 # Field weights for scoring (customizable)
@@ -100,7 +106,152 @@ def extract_field_text(data: Dict[str, Any], field_name: str) -> str:
     return str(field_data)
 
 
-def analyze_field_match(query_tokens: List[str], field_text: str, field_name: str) -> Dict[str, Any]:
+def profile_signature(profile_data: Dict[str, Any], fields: Optional[List[str]] = None) -> str:
+    """
+    Content hash of the profile fields that feed the analyzer
+    """
+    payload = {field: profile_data.get(field) for field in (fields or FIELD_WEIGHTS.keys())}
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def tokenize_profile(profile_data: Dict[str, Any]) -> Dict[str, Tuple[str, str, List[str]]]:
+    """
+    Extract, normalize and tokenize every weighted field:
+    field -> (field_text, normalized_text, tokens)
+    """
+    fields = {}
+    for field_name in FIELD_WEIGHTS.keys():
+        field_text = extract_field_text(profile_data, field_name)
+        fields[field_name] = (field_text, normalize_text(field_text), tokenize_text(field_text))
+    return fields
+
+
+class TokenizedProfileCache:
+    """
+    Bounded LRU cache of pre-normalized, pre-tokenized profile fields.
+    Entries are keyed by profile id and validated against a content hash,
+    so a changed profile is re-tokenized and replaces its old entry.
+    """
+    
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Any, Tuple[str, Dict[str, Tuple[str, str, List[str]]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def get(self, profile_data: Dict[str, Any]) -> Tuple[str, Dict[str, Tuple[str, str, List[str]]]]:
+        """
+        Return (signature, tokenized fields) for a profile, tokenizing on a miss
+        """
+        profile_id = profile_data.get('id')
+        signature = profile_signature(profile_data)
+        if profile_id is None:
+            return signature, tokenize_profile(profile_data)
+        
+        with self._lock:
+            entry = self.entries.get(profile_id)
+            if entry is not None and entry[0] == signature:
+                self.entries.move_to_end(profile_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        entry = (signature, tokenize_profile(profile_data))
+        with self._lock:
+            self.entries[profile_id] = entry
+            self.entries.move_to_end(profile_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+    
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Shared across requests; sized by AI_RAG_TOKEN_CACHE_SIZE
+tokenized_profile_cache = TokenizedProfileCache(int(os.environ.get('AI_RAG_TOKEN_CACHE_SIZE', '5000')))
+
+
+class QueryMatcher:
+    """
+    Resolves which query tokens each vocabulary term satisfies, once per query.
+    Per-field matching then becomes set lookups instead of a substring scan
+    of every field token for every query token.
+    """
+    
+    def __init__(self, query_tokens: List[str], index: Any = None):
+        self.query_tokens = list(query_tokens)
+        self.unique_tokens = tuple(dict.fromkeys(self.query_tokens))
+        self.index = index
+        self.version = None
+        self.term_hits: Dict[str, frozenset] = {}
+        self.refresh()
+    
+    def refresh(self) -> None:
+        """
+        Pull expansions for terms added to the index since the last snapshot
+        """
+        if self.index is None:
+            return
+        # Version and expansions are read together under the index lock, so
+        # the snapshot matches the vocabulary of that version
+        with self.index.locked():
+            if self.index.version == self.version:
+                return
+            version = self.index.version
+            expanded = self.index.expand_query(self.unique_tokens)
+        for term, hits in expanded.items():
+            self.term_hits[term] = frozenset(hits)
+        self.version = version
+    
+    def hits(self, term: str) -> frozenset:
+        found = self.term_hits.get(term)
+        if found is not None:
+            return found
+        if self.index is not None:
+            # A vocabulary term from the current snapshot that did not expand is a miss
+            with self.index.locked():
+                miss = term in self.index.vocabulary and self.index.version == self.version
+            if miss:
+                found = self.term_hits[term] = frozenset()
+                return found
+        found = frozenset(token for token in self.unique_tokens if token in term)
+        self.term_hits[term] = found
+        return found
+    
+    def match(self, field_tokens: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Split query tokens into (matched, missing) for a tokenized field
+        """
+        hits = set()
+        for term in set(field_tokens):
+            hits.update(self.hits(term))
+        matched_tokens = [token for token in self.query_tokens if token in hits]
+        missing_tokens = [token for token in self.query_tokens if token not in hits]
+        return matched_tokens, missing_tokens
+
+
+def analyze_field_match(query_tokens: List[str], field_text: str, field_name: str, matcher: Optional[QueryMatcher] = None) -> Dict[str, Any]:
     """
     Analyze how well query tokens match a specific field
     """
@@ -115,11 +266,19 @@ def analyze_field_match(query_tokens: List[str], field_text: str, field_name: st
     
     field_tokens = tokenize_text(field_text)
     field_text_norm = normalize_text(field_text)
+    return analyze_tokenized_field(query_tokens, field_tokens, field_text_norm, field_name, matcher)
+
+
+def match_field_tokens(query_tokens: List[str], field_tokens: List[str], matcher: Optional[QueryMatcher] = None) -> Tuple[List[str], List[str]]:
+    """
+    Split query tokens into (matched, missing) for a tokenized field
+    """
+    if matcher is not None:
+        # Resolved once per query: set lookups instead of substring scans
+        return matcher.match(field_tokens)
     
-    # Find matched tokens
     matched_tokens = []
     missing_tokens = []
-    
     for query_token in query_tokens:
         found = False
         # Check for exact match first
@@ -133,6 +292,15 @@ def analyze_field_match(query_tokens: List[str], field_text: str, field_name: st
         
         if not found:
             missing_tokens.append(query_token)
+    return matched_tokens, missing_tokens
+
+
+def analyze_tokenized_field(query_tokens: List[str], field_tokens: List[str], field_text_norm: str, field_name: str, matcher: Optional[QueryMatcher] = None) -> Dict[str, Any]:
+    """
+    Field analysis on already normalized and tokenized text
+    """
+    # Find matched tokens
+    matched_tokens, missing_tokens = match_field_tokens(query_tokens, field_tokens, matcher)
     
     # Calculate coverage
     coverage = len(matched_tokens) / len(query_tokens) if query_tokens else 0
@@ -228,9 +396,11 @@ def analyze_query(query: str) -> Dict[str, Any]:
     }
 
 
-def analyze_profile_match(profile_data: Dict[str, Any], query_analysis: Dict[str, Any]) -> Dict[str, Any]:
+def analyze_profile_match(profile_data: Dict[str, Any], query_analysis: Dict[str, Any], matcher: Optional[QueryMatcher] = None, cache: Optional[TokenizedProfileCache] = None) -> Dict[str, Any]:
     """
-    Analyze how well a profile matches a query with detailed breakdown
+    Analyze how well a profile matches a query with detailed breakdown.
+    Pass a QueryMatcher built for the query to reuse token resolution across profiles,
+    and a TokenizedProfileCache to skip text normalization for unchanged profiles.
     """
     start_time = time.time()
     
@@ -253,9 +423,18 @@ def analyze_profile_match(profile_data: Dict[str, Any], query_analysis: Dict[str
     all_matched_tokens = set()
     all_missing_tokens = set(query_tokens)
     
+    tokenized = cache.get(profile_data)[1] if cache is not None else None
+    
     for field_name in FIELD_WEIGHTS.keys():
-        field_text = extract_field_text(profile_data, field_name)
-        field_analysis = analyze_field_match(query_tokens, field_text, field_name)
+        if tokenized is not None:
+            field_text, field_text_norm, field_tokens = tokenized[field_name]
+            if field_text:
+                field_analysis = analyze_tokenized_field(query_tokens, field_tokens, field_text_norm, field_name, matcher)
+            else:
+                field_analysis = analyze_field_match(query_tokens, field_text, field_name, matcher)
+        else:
+            field_text = extract_field_text(profile_data, field_name)
+            field_analysis = analyze_field_match(query_tokens, field_text, field_name, matcher)
         
         field_scores[field_name] = field_analysis
         field_snippets[field_name] = field_analysis['snippet']
@@ -284,78 +463,525 @@ def analyze_profile_match(profile_data: Dict[str, Any], query_analysis: Dict[str
     }
 
 
-def generate_analysis_summary(all_matches: List[Dict[str, Any]], query_analysis: Dict[str, Any], total_scanned: int, elapsed_time: float) -> Dict[str, Any]:
+def score_profile_match(profile_data: Dict[str, Any], query_analysis: Dict[str, Any], matcher: Optional[QueryMatcher] = None, cache: Optional[TokenizedProfileCache] = None) -> Dict[str, Any]:
     """
-    Generate comprehensive analysis summary
+    Cheap first pass of analyze_profile_match: same total_score, coverage and
+    matched tokens, but no snippets or per-field token lists. Views rank every
+    candidate with this and only run analyze_profile_match on the returned top-k.
+    """
+    start_time = time.time()
+    
+    query_tokens = query_analysis['tokens']
+    if not query_tokens:
+        return {
+            'id': profile_data.get('id'),
+            'total_score': 0,
+            'field_scores': {},
+            'overall_coverage': 0,
+            'matched_tokens': [],
+            'analysis_time_ms': 0
+        }
+    
+    field_scores = {}
+    all_matched_tokens = set()
+    tokenized = cache.get(profile_data)[1] if cache is not None else None
+    
+    for field_name in FIELD_WEIGHTS.keys():
+        if tokenized is not None:
+            field_text, _, field_tokens = tokenized[field_name]
+        else:
+            field_text = extract_field_text(profile_data, field_name)
+            field_tokens = tokenize_text(field_text) if field_text else []
+        
+        if field_text:
+            matched_tokens, _ = match_field_tokens(query_tokens, field_tokens, matcher)
+        else:
+            matched_tokens = []
+        coverage = len(matched_tokens) / len(query_tokens)
+        score = coverage * FIELD_WEIGHTS.get(field_name, 1.0) * len(matched_tokens) if field_text else 0
+        field_scores[field_name] = {
+            'score': score,
+            'coverage': coverage,
+            'matched_count': len(matched_tokens)
+        }
+        all_matched_tokens.update(matched_tokens)
+    
+    total_score = sum(analysis['score'] for analysis in field_scores.values())
+    overall_coverage = len(all_matched_tokens) / len(query_tokens)
+    analysis_time = (time.time() - start_time) * 1000
+    
+    return {
+        'id': profile_data.get('id'),
+        'total_score': total_score,
+        'field_scores': field_scores,
+        'overall_coverage': overall_coverage,
+        'matched_tokens': list(all_matched_tokens),
+        'analysis_time_ms': round(analysis_time, 2)
+    }
+
+
+class SpaceSavingCounter:
+    """
+    Space-Saving heavy-hitters sketch with at most `capacity` counters.
+    While fewer distinct items than `capacity` have been seen the counts are
+    exact; afterwards every count over-estimates by at most its recorded error.
+
+    The smallest counter is found with a lazy min-heap of (count, arrival,
+    item): increments leave stale entries behind, which are re-pushed with the
+    current count when they surface, so an eviction costs O(log capacity)
+    amortized and picks the same victim as a scan in insertion order.
+    """
+    
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+        self.evictions = 0
+        self._heap: List[Tuple[int, int, str]] = []
+        self._arrivals = 0
+    
+    def __len__(self) -> int:
+        return len(self.counts)
+    
+    @property
+    def exact(self) -> bool:
+        return not self.evictions
+    
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        error = 0
+        if len(self.counts) >= self.capacity:
+            # Replace the smallest counter; the newcomer inherits its count as error
+            victim = self._pop_min()
+            error = self.counts.pop(victim)
+            self.errors.pop(victim, None)
+            self.evictions += 1
+        self.counts[item] = error + count
+        if error:
+            self.errors[item] = error
+        self._arrivals += 1
+        heapq.heappush(self._heap, (self.counts[item], self._arrivals, item))
+    
+    def _pop_min(self) -> str:
+        heap = self._heap
+        while True:
+            count, arrival, item = heap[0]
+            current = self.counts.get(item)
+            if current == count:
+                heapq.heappop(heap)
+                return item
+            if current is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (current, arrival, item))
+    
+    def merge(self, other: 'SpaceSavingCounter') -> None:
+        """
+        Fold another sketch in; the combined table is trimmed back to capacity
+        """
+        self.total += other.total
+        self.evictions += other.evictions
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+            error = self.errors.get(item, 0) + other.errors.get(item, 0)
+            if error:
+                self.errors[item] = error
+        if len(self.counts) > self.capacity:
+            kept = sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:self.capacity]
+            self.evictions += len(self.counts) - len(kept)
+            self.counts = dict(kept)
+            self.errors = {item: self.errors[item] for item in self.counts if item in self.errors}
+        self._heap = [(count, arrival, item) for arrival, (item, count) in enumerate(self.counts.items(), 1)]
+        self._arrivals = len(self._heap)
+        heapq.heapify(self._heap)
+    
+    def most_common(self, n: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+class _RunningStats:
+    """
+    Count, sum, min and max of a stream of numbers
+    """
+    
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'positive')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.positive = 0
+    
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if value > 0:
+            self.positive += 1
+    
+    def merge(self, other: '_RunningStats') -> None:
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.positive += other.positive
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+    
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+
+class AnalysisSummaryAccumulator:
     """
-    if not all_matches:
+    Streaming, constant-memory version of generate_analysis_summary.
+    Views feed every scored match with add(); nothing per match is retained,
+    only running coverage/field statistics and a heavy-hitters sketch of the
+    matched tokens. Accumulators over disjoint shards can be merged.
+    """
+    
+    def __init__(self, token_capacity: int = 1000):
+        self.matches = 0
+        self.coverage = _RunningStats()
+        self.coverage_buckets = {'high': 0, 'medium': 0, 'low': 0}
+        self.fields: Dict[str, _RunningStats] = {}
+        self.tokens = SpaceSavingCounter(token_capacity)
+        self.analysis_time_ms = 0
+    
+    def __len__(self) -> int:
+        return self.matches
+    
+    def add(self, match_analysis: Dict[str, Any]) -> None:
+        self.matches += 1
+        coverage = match_analysis.get('overall_coverage', 0)
+        self.coverage.add(coverage)
+        if coverage >= 0.7:
+            self.coverage_buckets['high'] += 1
+        elif coverage >= 0.3:
+            self.coverage_buckets['medium'] += 1
+        else:
+            self.coverage_buckets['low'] += 1
+        for field_name, field_score in match_analysis.get('field_scores', {}).items():
+            stats = self.fields.get(field_name)
+            if stats is None:
+                stats = self.fields[field_name] = _RunningStats()
+            stats.add(field_score.get('score', 0))
+        for token in match_analysis.get('matched_tokens', []):
+            self.tokens.add(token)
+        self.analysis_time_ms += match_analysis.get('analysis_time_ms', 0)
+    
+    def merge(self, other: 'AnalysisSummaryAccumulator') -> None:
+        self.matches += other.matches
+        self.coverage.merge(other.coverage)
+        for bucket, count in other.coverage_buckets.items():
+            self.coverage_buckets[bucket] += count
+        for field_name, stats in other.fields.items():
+            self.fields.setdefault(field_name, _RunningStats()).merge(stats)
+        self.tokens.merge(other.tokens)
+        self.analysis_time_ms += other.analysis_time_ms
+    
+    def summary(self, query_analysis: Dict[str, Any], total_scanned: int, elapsed_time: float) -> Dict[str, Any]:
+        """
+        Same structure (and, below the sketch capacity, same values) as generate_analysis_summary
+        """
+        if not self.matches:
+            return {
+                'total_matches': 0,
+                'total_scanned': total_scanned,
+                'query_analysis': query_analysis,
+                'coverage_stats': {},
+                'field_performance': {},
+                'token_insights': {},
+                'performance': {
+                    'elapsed_ms': round(elapsed_time * 1000, 2),
+                    'avg_match_time_ms': 0
+                }
+            }
+        
+        coverage_stats = {
+            'avg_coverage': round(self.coverage.mean, 3),
+            'max_coverage': round(self.coverage.maximum, 3),
+            'min_coverage': round(self.coverage.minimum, 3),
+            'high_coverage_count': self.coverage_buckets['high'],
+            'medium_coverage_count': self.coverage_buckets['medium'],
+            'low_coverage_count': self.coverage_buckets['low']
+        }
+        
+        field_stats = {}
+        for field_name, stats in self.fields.items():
+            field_stats[field_name] = {
+                'avg_score': round(stats.mean, 2),
+                'max_score': round(stats.maximum, 2),
+                'total_contributions': stats.positive
+            }
+        
+        token_insights = {
+            'most_frequent': self.tokens.most_common(10),
+            'unique_tokens': len(self.tokens),
+            'total_matches': self.tokens.total
+        }
+        if not self.tokens.exact:
+            token_insights['approximate'] = True
+        
         return {
-            'total_matches': 0,
+            'total_matches': self.matches,
             'total_scanned': total_scanned,
             'query_analysis': query_analysis,
-            'coverage_stats': {},
-            'field_performance': {},
-            'token_insights': {},
+            'coverage_stats': coverage_stats,
+            'field_performance': field_stats,
+            'token_insights': token_insights,
             'performance': {
                 'elapsed_ms': round(elapsed_time * 1000, 2),
-                'avg_match_time_ms': 0
+                'avg_match_time_ms': round(self.analysis_time_ms / self.matches, 2),
+                'total_analysis_time_ms': round(self.analysis_time_ms, 2)
             }
         }
-    
-    # Coverage statistics
-    coverages = [match['overall_coverage'] for match in all_matches]
-    coverage_stats = {
-        'avg_coverage': round(sum(coverages) / len(coverages), 3),
-        'max_coverage': round(max(coverages), 3),
-        'min_coverage': round(min(coverages), 3),
-        'high_coverage_count': sum(1 for c in coverages if c >= 0.7),
-        'medium_coverage_count': sum(1 for c in coverages if 0.3 <= c < 0.7),
-        'low_coverage_count': sum(1 for c in coverages if c < 0.3)
-    }
-    
-    # Field performance analysis
-    field_performance = defaultdict(list)
+
+
+def generate_analysis_summary(all_matches: List[Dict[str, Any]], query_analysis: Dict[str, Any], total_scanned: int, elapsed_time: float) -> Dict[str, Any]:
+    """
+    Generate comprehensive analysis summary
+    """
+    accumulator = AnalysisSummaryAccumulator()
     for match in all_matches:
-        for field_name, field_score in match['field_scores'].items():
-            field_performance[field_name].append(field_score['score'])
-    
-    field_stats = {}
-    for field_name, scores in field_performance.items():
-        field_stats[field_name] = {
-            'avg_score': round(sum(scores) / len(scores), 2),
-            'max_score': round(max(scores), 2),
-            'total_contributions': len([s for s in scores if s > 0])
-        }
+        accumulator.add(match)
+    return accumulator.summary(query_analysis, total_scanned, elapsed_time)
+
+
+def rank_profile_index(index: Any, query_analysis: Dict[str, Any], profile_ids: Optional[set] = None, matcher: Optional[QueryMatcher] = None) -> List[Tuple[Any, float]]:
+    """
+    Rank indexed profiles straight from the inverted index postings.
+    Only profiles sharing at least one token with the query are touched,
+    and scores are identical to analyze_profile_match's total_score.
+    """
+    query_tokens = query_analysis['tokens']
+    if not query_tokens:
+        return []
+    
+    if matcher is None:
+        matcher = QueryMatcher(query_tokens, index)
+    else:
+        matcher.refresh()
+    candidates = index.candidates(query_tokens, profile_ids)
+    
+    ranked = []
+    for profile_id in candidates:
+        total_score = 0
+        for field_name in FIELD_WEIGHTS.keys():
+            matched_tokens, _ = matcher.match(index.field_terms(profile_id, field_name))
+            matched_count = len(matched_tokens)
+            if not matched_count:
+                continue
+            coverage = matched_count / len(query_tokens)
+            total_score += coverage * FIELD_WEIGHTS[field_name] * matched_count
+        if total_score > 0:
+            ranked.append((profile_id, total_score))
+    
+    ranked.sort(key=lambda x: (-x[1], x[0] or 0))
+    return ranked
+
+
+SCORERS = ('classic', 'bm25f', 'sparse', 'fts')
+
+# BM25F parameters: term-frequency saturation and per-field length normalization
+BM25F_K1 = 1.2
+BM25F_B = {
+    'skills': 0.3,
+    'personal_information': 0.75,
+    'experience': 0.75,
+    'projects': 0.75,
+    'education': 0.5
+}
+
+
+def resolve_scorer(value: Optional[str]) -> str:
+    """
+    Scorer requested by the client, falling back to AI_RAG_SCORER (default 'classic')
+    """
+    scorer = (value or os.environ.get('AI_RAG_SCORER') or 'classic').strip().lower()
+    return scorer if scorer in SCORERS else 'classic'
+
+
+class _HeapEntry:
+    """
+    Heap entry ordered so the root is the weakest result: lower score first,
+    then higher id (same tie-break as sorting by (-score, id))
+    """
+    __slots__ = ('score', 'id', 'payload')
     
-    # Token insights
-    all_matched_tokens = []
-    for match in all_matches:
-        all_matched_tokens.extend(match['matched_tokens'])
+    def __init__(self, score: float, item_id: Any, payload: Any = None):
+        self.score = score
+        self.id = item_id
+        self.payload = payload
     
-    token_frequency = defaultdict(int)
-    for token in all_matched_tokens:
-        token_frequency[token] += 1
+    def __lt__(self, other: '_HeapEntry') -> bool:
+        if self.score != other.score:
+            return self.score < other.score
+        return (self.id or 0) > (other.id or 0)
+
+
+class TopKCollector:
+    """
+    Bounded streaming top-k selection on (-score, id), the order the views sort by.
+    Payloads are only kept for the current winners, so memory is O(k) and
+    feeding N results costs O(N log k).
+    """
     
-    token_insights = {
-        'most_frequent': sorted(token_frequency.items(), key=lambda x: x[1], reverse=True)[:10],
-        'unique_tokens': len(token_frequency),
-        'total_matches': len(all_matched_tokens)
-    }
+    def __init__(self, k: int):
+        self.k = max(0, k)
+        self.heap: List[_HeapEntry] = []
+        self.count = 0
+    
+    def __len__(self) -> int:
+        return len(self.heap)
+    
+    @property
+    def threshold(self) -> Optional[float]:
+        """
+        Score of the weakest kept result once the collector is full
+        """
+        return self.heap[0].score if self.k and len(self.heap) >= self.k else None
+    
+    def accepts(self, score: float, item_id: Any) -> bool:
+        """
+        Whether (score, id) would enter the top-k; lets callers skip building payloads
+        """
+        if len(self.heap) < self.k:
+            return True
+        return bool(self.k) and self.heap[0] < _HeapEntry(score, item_id)
+    
+    def add(self, score: float, item_id: Any, payload: Any = None) -> bool:
+        """
+        Offer a result; returns True if it is (currently) in the top-k
+        """
+        self.count += 1
+        if not self.k:
+            return False
+        entry = _HeapEntry(score, item_id, payload)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+            return True
+        if self.heap[0] < entry:
+            heapq.heapreplace(self.heap, entry)
+            return True
+        return False
+    
+    def offer(self, score: float, item_id: Any, build_payload: Callable[[], Any]) -> bool:
+        """
+        Like add, but only builds the payload when the result enters the top-k
+        """
+        if not self.accepts(score, item_id):
+            self.count += 1
+            return False
+        return self.add(score, item_id, build_payload())
+    
+    def merge(self, other: 'TopKCollector') -> None:
+        """
+        Fold another collector's winners into this one
+        """
+        count = self.count + other.count
+        for entry in other.heap:
+            self.add(entry.score, entry.id, entry.payload)
+        self.count = count
+    
+    def items(self) -> List[Tuple[Any, float, Any]]:
+        """
+        (id, score, payload) of the winners, best first
+        """
+        ordered = sorted(self.heap, key=lambda e: (-e.score, e.id or 0))
+        return [(entry.id, entry.score, entry.payload) for entry in ordered]
+    
+    def payloads(self) -> List[Any]:
+        return [payload for _, _, payload in self.items()]
+
+
+def bm25f_rank(index: Any, query_analysis: Dict[str, Any], limit: int, profile_ids: Optional[set] = None,
+               k1: float = BM25F_K1) -> Tuple[List[Tuple[Any, float]], Dict[str, Any]]:
+    """
+    BM25F top-`limit` retrieval over a ProfileIndex.
     
-    # Performance metrics
-    match_times = [match.get('analysis_time_ms', 0) for match in all_matches]
-    avg_match_time = sum(match_times) / len(match_times) if match_times else 0
+    Per-field term counts are weighted with FIELD_WEIGHTS and length-normalized
+    against the average field lengths. Document frequencies and average lengths
+    are taken over `profile_ids` (the scanned profiles) when given, otherwise
+    over the whole index. Query tokens keep the
+    analyzer's substring semantics (a token hits every term containing it).
+    MaxScore pruning skips candidates that only contain "non-essential" terms,
+    i.e. terms whose combined upper bound cannot beat the current k-th score.
     
-    return {
-        'total_matches': len(all_matches),
-        'total_scanned': total_scanned,
-        'query_analysis': query_analysis,
-        'coverage_stats': coverage_stats,
-        'field_performance': field_stats,
-        'token_insights': token_insights,
-        'performance': {
-            'elapsed_ms': round(elapsed_time * 1000, 2),
-            'avg_match_time_ms': round(avg_match_time, 2),
-            'total_analysis_time_ms': round(sum(match_times), 2)
-        }
-    }
\ No newline at end of file
+    Returns (ranked [(id, score)], stats)
+    """
+    stats = {'scorer': 'bm25f', 'candidates': 0, 'scored': 0, 'pruned': 0}
+    query_tokens = list(dict.fromkeys(query_analysis['tokens']))
+    total_docs, avg_lengths = index.scope_stats(profile_ids)
+    if not query_tokens or not total_docs or limit <= 0:
+        return [], stats
+    
+    avg_lengths = {field_name: avg_lengths.get(field_name) or 1.0 for field_name in FIELD_WEIGHTS.keys()}
+    
+    terms = []
+    for token in query_tokens:
+        postings = index.term_postings(token, profile_ids)
+        if not postings:
+            continue
+        # Postings are limited to the scope already: one entry per matching profile
+        df = len(postings) if profile_ids is not None else index.document_frequency(token)
+        idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+        # tf/(k1+tf) < 1, so idf * (k1 + 1) bounds the term's contribution
+        terms.append((idf * (k1 + 1), idf, postings))
+    if not terms:
+        return [], stats
+    
+    terms.sort(key=lambda t: t[0])
+    prefix_bounds = []
+    running = 0.0
+    for upper_bound, _, _ in terms:
+        running += upper_bound
+        prefix_bounds.append(running)
+    
+    candidates = set()
+    for _, _, postings in terms:
+        candidates.update(postings)
+    stats['candidates'] = len(candidates)
+    
+    top_k = TopKCollector(limit)
+    essential = 0
+    # Ascending id order: a later candidate that only ties the k-th score ranks below it
+    for profile_id in sorted(candidates, key=lambda x: x or 0):
+        threshold = top_k.threshold
+        if threshold is not None:
+            while essential < len(terms) and prefix_bounds[essential] <= threshold:
+                essential += 1
+            if essential >= len(terms):
+                stats['pruned'] += 1
+                continue
+            if not any(profile_id in terms[i][2] for i in range(essential, len(terms))):
+                stats['pruned'] += 1
+                continue
+        
+        score = 0.0
+        for _, idf, postings in terms:
+            fields = postings.get(profile_id)
+            if not fields:
+                continue
+            tf = 0.0
+            for field_name, count in fields.items():
+                b = BM25F_B.get(field_name, 0.75)
+                norm = 1 - b + b * index.field_length(profile_id, field_name) / avg_lengths[field_name]
+                tf += FIELD_WEIGHTS.get(field_name, 1.0) * count / norm
+            score += idf * tf * (k1 + 1) / (k1 + tf)
+        stats['scored'] += 1
+        top_k.add(score, profile_id)
+    
+    ranked = [(profile_id, score) for profile_id, score, _ in top_k.items()]
+    return ranked, stats
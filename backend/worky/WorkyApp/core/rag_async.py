@@ -0,0 +1,361 @@
+"""
+asyncio I/O for the async RAG views (ASGI)
+One httpx.AsyncClient per event loop (keep-alive pool, gzip) with the same
+HTTPError/URLError surface as http_client, an async counterpart of
+rag_fetch.fetch_pages, and a bounded thread pool for the CPU-bound scoring so
+the event loop keeps serving other requests meanwhile.
+Only the awaiting lives here: range planning, keyset cursors, coverage
+bookkeeping, hedging decisions and JSON streaming are rag_fetch's helpers.
+"""
+
+import io
+import os
+import time
+import asyncio
+import weakref
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, AsyncIterator, Callable, Optional, Tuple, Union
+from urllib.error import HTTPError, URLError
+
+import httpx
+
+from . import rag_fetch
+from .circuit import breaker_for, shortened_timeout
+from .rag_fetch import (
+    PAGE_SIZE, FETCH_WORKERS, RANGE_BUFFER, REQUEST_TIMEOUT_SEC, Deadline, IdSpan, JSONArrayDecoder, KeysetCursor,
+    ScanCoverage, parse_content_range, plan_spans, plans_ranges, request_timeout, _DONE, _hedge_winner,
+    _id_bound_requests, _parse_id_bounds, _should_hedge
+)
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('AI_HTTP_ASYNC_MAX_CONNECTIONS', '100'))
+ASYNC_KEEPALIVE = int(os.environ.get('AI_HTTP_POOL_SIZE', '8'))
+ASYNC_TIMEOUT = float(os.environ.get('AI_HTTP_TIMEOUT_SEC', '8'))
+SCORING_THREADS = int(os.environ.get('AI_RAG_SCORING_THREADS', '4'))
+
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = weakref.WeakKeyDictionary()
+_scoring_executor = None
+_stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0, 'scoring_tasks': 0}
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Shared client of the running event loop (httpx clients cannot cross loops)
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_KEEPALIVE),
+            timeout=ASYNC_TIMEOUT
+        )
+    return client
+
+
+async def arequest(method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+    """
+    Non-blocking request. Raises HTTPError for 4xx/5xx responses and URLError
+    when the host cannot be reached, like http_client.urlopen (including the
+    circuit breaker check).
+    """
+    breaker = breaker_for(url)
+    if breaker is not None:
+        breaker.check()
+    _stats['requests'] += 1
+    _stats['in_flight'] += 1
+    _stats['max_in_flight'] = max(_stats['max_in_flight'], _stats['in_flight'])
+    timeout = ASYNC_TIMEOUT if timeout is None else timeout
+    try:
+        response = await get_async_client().request(method, url, headers=headers, content=body, timeout=timeout)
+    except httpx.HTTPError as e:
+        _stats['errors'] += 1
+        _record_error(breaker, e, timeout)
+        raise URLError(e)
+    except asyncio.CancelledError:
+        # The losing hedge request (or an abandoned scan): no verdict on the host
+        if breaker is not None:
+            breaker.release()
+        raise
+    finally:
+        _stats['in_flight'] -= 1
+    _record_status(breaker, response.status_code)
+    if response.status_code >= 400:
+        raise HTTPError(url, response.status_code, response.reason_phrase, response.headers, io.BytesIO(response.content))
+    return response
+
+
+async def astream_lines(method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None,
+                        timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Lines of a streamed response body as they arrive (server-sent events),
+    with arequest's HTTPError/URLError surface
+    """
+    async for line in _astream(method, url, headers, body, timeout, lines=True):
+        yield line
+
+
+async def astream_bytes(method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None,
+                        timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+    """
+    Decoded (gunzipped) chunks of a streamed response body as they arrive
+    """
+    async for chunk in _astream(method, url, headers, body, timeout, lines=False):
+        yield chunk
+
+
+async def _astream(method: str, url: str, headers: Optional[Dict[str, str]], body: Optional[bytes],
+                   timeout: Optional[float], lines: bool) -> AsyncIterator[Union[str, bytes]]:
+    breaker = breaker_for(url)
+    if breaker is not None:
+        breaker.check()
+    _stats['requests'] += 1
+    _stats['in_flight'] += 1
+    _stats['max_in_flight'] = max(_stats['max_in_flight'], _stats['in_flight'])
+    timeout = ASYNC_TIMEOUT if timeout is None else timeout
+    try:
+        async with get_async_client().stream(method, url, headers=headers, content=body, timeout=timeout) as response:
+            _record_status(breaker, response.status_code)
+            if response.status_code >= 400:
+                content = await response.aread()
+                raise HTTPError(url, response.status_code, response.reason_phrase, response.headers, io.BytesIO(content))
+            async for item in (response.aiter_lines() if lines else response.aiter_bytes()):
+                yield item
+    except httpx.HTTPError as e:
+        _stats['errors'] += 1
+        _record_error(breaker, e, timeout)
+        raise URLError(e)
+    except asyncio.CancelledError:
+        if breaker is not None:
+            breaker.release()
+        raise
+    finally:
+        _stats['in_flight'] -= 1
+
+
+def _record_error(breaker, error: httpx.HTTPError, timeout: float) -> None:
+    # A timeout shortened to the scan's remaining budget is the deadline's doing, not the host's
+    if breaker is None:
+        return
+    if shortened_timeout(error, timeout, ASYNC_TIMEOUT, httpx.TimeoutException):
+        breaker.release()
+    else:
+        breaker.record_failure(error)
+
+
+def _record_status(breaker, status_code: int) -> None:
+    if breaker is None:
+        return
+    if status_code >= 500:
+        breaker.record_failure(f'HTTP {status_code}')
+    else:
+        breaker.record_success()
+
+
+async def afetch_rows(url: str, headers: Dict[str, str], timeout: float = REQUEST_TIMEOUT_SEC) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Rows of one request plus the total count when the response carries it
+    """
+    response = await arequest('GET', url, headers, timeout=timeout)
+    rows = response.json()
+    if not isinstance(rows, list):
+        rows = []
+    return rows, parse_content_range(response.headers.get('Content-Range'))
+
+
+async def _atimed_fetch_rows(url: str, headers: Dict[str, str], timeout: float) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    start = time.time()
+    result = await afetch_rows(url, headers, timeout)
+    rag_fetch.page_latency.record((time.time() - start) * 1000)
+    return result
+
+
+async def afetch_page(url: str, headers: Dict[str, str], deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Async rag_fetch.fetch_page: a page slower than the p95 page latency gets a
+    duplicate request; the first response wins and the other one is cancelled
+    (a task can be, unlike the sync loser's thread)
+    """
+    page_latency = rag_fetch.page_latency
+    delay = page_latency.hedge_delay()
+    if delay is None:
+        return await _atimed_fetch_rows(url, headers, request_timeout(deadline))
+    primary = asyncio.ensure_future(_atimed_fetch_rows(url, headers, request_timeout(deadline)))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if not _should_hedge(bool(done), deadline):
+        return await primary
+    hedge = asyncio.ensure_future(_atimed_fetch_rows(url, headers, request_timeout(deadline)))
+    page_latency.count('hedged')
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = _hedge_winner(done, hedge)
+            if winner is not None:
+                return winner.result()
+        # Both failed: report the original request's error
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _astream_rows(url: str, headers: Dict[str, str], batch_size: int,
+                        timeout: float = REQUEST_TIMEOUT_SEC) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Async rag_fetch._stream_rows
+    """
+    decoder = JSONArrayDecoder()
+    batch = []
+    async for chunk in astream_bytes('GET', url, headers, timeout=timeout):
+        for row in decoder.feed(chunk):
+            if not isinstance(row, dict):
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    for row in decoder.close():
+        if isinstance(row, dict):
+            batch.append(row)
+    if batch:
+        yield batch
+
+
+async def aiter_keyset(url: str, headers: Dict[str, str], page_size: int = PAGE_SIZE, after_id: Any = None,
+                       before_id: Any = None, deadline: Union[Deadline, float, None] = None,
+                       span: Optional[IdSpan] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Async rag_fetch.iter_keyset, AI_RAG_STREAM_JSON batches included
+    """
+    deadline = Deadline.coerce(deadline)
+    cursor = KeysetCursor(url, page_size, after_id, before_id)
+    while deadline is None or not deadline.expired():
+        page_url = cursor.next_url()
+        if rag_fetch.STREAM_JSON:
+            async for rows in _astream_rows(page_url, headers, rag_fetch.STREAM_BATCH, request_timeout(deadline)):
+                cursor.advance(rows)
+                yield rows
+        else:
+            rows, _ = await afetch_page(page_url, headers, deadline)
+            cursor.advance(rows)
+            if rows:
+                yield rows
+        if cursor.exhausted():
+            if span is not None:
+                span.fetched_all = True
+            return
+
+
+async def aid_bounds(url: str, headers: Dict[str, str], after_id: Any = None,
+                     deadline: Optional[Deadline] = None) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    Async rag_fetch.id_bounds; both ends are fetched concurrently
+    """
+    (first, total), (last, _) = await asyncio.gather(*(
+        afetch_rows(bound_url, bound_headers, request_timeout(deadline))
+        for bound_url, bound_headers in _id_bound_requests(url, headers, after_id)
+    ))
+    return _parse_id_bounds(first, last, total)
+
+
+async def _aproduce(pages: asyncio.Queue, url: str, headers: Dict[str, str], page_size: int,
+                    span: IdSpan, deadline: Optional[Deadline]) -> None:
+    try:
+        async for page in aiter_keyset(url, headers, page_size, span.after_id, span.before_id, deadline, span):
+            await pages.put(page)
+        await pages.put(_DONE)
+    except Exception as e:
+        await pages.put(e)
+
+
+async def _adrain(buffer: asyncio.Queue) -> AsyncIterator[List[Dict[str, Any]]]:
+    while True:
+        page = await buffer.get()
+        if page is _DONE:
+            return
+        if isinstance(page, Exception):
+            raise page
+        yield page
+
+
+async def _awalk(pages: AsyncIterator[List[Dict[str, Any]]], span: IdSpan, coverage: Optional[ScanCoverage],
+                 deadline: Optional[Deadline]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Async rag_fetch._walk
+    """
+    try:
+        async for page in pages:
+            span.advance(page)
+            yield page
+    except Exception as e:
+        if coverage is None:
+            raise
+        coverage.skip(span, e, deadline)
+        return
+    span.consumed = span.fetched_all
+
+
+async def afetch_pages(url: str, headers: Dict[str, str], page_size: int = PAGE_SIZE,
+                       deadline: Union[Deadline, float, None] = None, workers: Optional[int] = None, after_id: Any = None,
+                       coverage: Optional[ScanCoverage] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Async rag_fetch.fetch_pages: id ranges are walked by concurrent tasks and
+    their pages yielded range by range, in id order
+    """
+    deadline = Deadline.coerce(deadline)
+    coverage_given = coverage is not None
+    coverage = coverage if coverage_given else ScanCoverage()
+    yielded = False
+    workers = FETCH_WORKERS if workers is None else workers
+    bounds = await aid_bounds(url, headers, after_id, deadline) if plans_ranges(workers) else None
+    spans = plan_spans(coverage, bounds, after_id, page_size, workers)
+
+    if len(spans) == 1:
+        span = spans[0]
+        pages = aiter_keyset(url, headers, page_size, span.after_id, span.before_id, deadline, span)
+        async for page in _awalk(pages, span, coverage if coverage_given else None, deadline):
+            yielded = True
+            yield page
+    else:
+        buffers = [asyncio.Queue(maxsize=RANGE_BUFFER) for _ in spans]
+        tasks = [
+            asyncio.ensure_future(_aproduce(buffer, url, headers, page_size, span, deadline))
+            for buffer, span in zip(buffers, spans)
+        ]
+        try:
+            for buffer, span in zip(buffers, spans):
+                async for page in _awalk(_adrain(buffer), span, coverage if coverage_given else None, deadline):
+                    yielded = True
+                    yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+    if coverage.errors and not yielded:
+        raise coverage.errors[0]
+
+
+def scoring_executor() -> ThreadPoolExecutor:
+    global _scoring_executor
+    if _scoring_executor is None:
+        _scoring_executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='rag-scoring')
+    return _scoring_executor
+
+
+async def run_scoring(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Run CPU-bound work (scoring a page, ranking, summaries) off the event loop
+    """
+    _stats['scoring_tasks'] += 1
+    return await asyncio.get_running_loop().run_in_executor(scoring_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def arun_blocking(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking call (SQLite replica, cache backend) in the default executor
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def async_stats() -> Dict[str, Any]:
+    return {'scoring_threads': SCORING_THREADS, 'max_connections': ASYNC_MAX_CONNECTIONS, **_stats}
@@ -0,0 +1,141 @@
+"""
+Result cache for the RAG search endpoints
+Responses live in the 'rag' cache of settings.CACHES (local memory, file or
+Redis) with a TTL and bounded size. Every entry records the version of the
+table it was computed from (row count and max id of the scanned rows) and is
+dropped as soon as the current version differs.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from django.core.cache import caches
+
+from .rag_fetch import fetch_rows
+from .rag_replica import get_replica
+
+CACHE_ENABLED = os.environ.get('AI_RAG_CACHE', 'false').lower() == 'true'
+# Table versions are probed at most this often per (table, filters)
+VERSION_TTL_SEC = float(os.environ.get('AI_RAG_CACHE_VERSION_SEC', '2'))
+
+
+def resolve_cache(value: Any) -> bool:
+    """
+    Cache switch from a request parameter (cache=false bypasses it), falling
+    back to AI_RAG_CACHE
+    """
+    if not CACHE_ENABLED:
+        return False
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+class RAGResultCache:
+    """
+    Versioned response cache on top of a Django cache alias
+    """
+
+    def __init__(self, alias: str = 'rag'):
+        self.alias = alias
+        self.metrics = {'hits': 0, 'misses': 0, 'invalidations': 0, 'stores': 0, 'version_probes': 0}
+        self._versions: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def key(self, view: str, query_analysis: Dict[str, Any], **params: Any) -> str:
+        """
+        Cache key of a request: the normalized query plus the parameters that
+        change the response (status, limit, analysis flag, scorer...)
+        """
+        raw = '|'.join([view, (query_analysis.get('normalized') or '').strip()] +
+                       [f'{name}={params[name]}' for name in sorted(params)])
+        return f'{view}:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def version(self, base: str, headers: Dict[str, str], table: str,
+                filters: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        'count:max id' of the rows the view would scan, from the replica when
+        it is synced, else one PostgREST request. None if it cannot be read.
+        """
+        filters = filters or {}
+        memo_key = (table, repr(sorted(filters.items())))
+        now = time.time()
+        with self._lock:
+            memo = self._versions.get(memo_key)
+            if memo is not None and memo[0] > now:
+                return memo[1]
+
+        version = None
+        replica = get_replica() if table == 'profile' else None
+        try:
+            if replica is not None and replica.ready():
+                count, max_id = replica.version(filters)
+                version = f'{count}:{max_id}'
+            else:
+                params = '?select=id'
+                for column, value in filters.items():
+                    params += f'&{column}=eq.{value}'
+                rows, total = fetch_rows(
+                    base.rstrip('/') + f'/rest/v1/{table}{params}&order=id.desc&limit=1',
+                    dict(headers, Prefer='count=exact')
+                )
+                if total is not None:
+                    version = f'{total}:{rows[0].get("id") if rows else None}'
+        except Exception:
+            return None
+
+        with self._lock:
+            self.metrics['version_probes'] += 1
+            if version is not None:
+                self._versions[memo_key] = (now + VERSION_TTL_SEC, version)
+        return version
+
+    def get(self, key: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Cached response for `key` if it was computed at `version`, flagged
+        with cached=True and its age
+        """
+        if version is None:
+            return None
+        entry = self.backend.get(key)
+        stale = entry is not None and entry['version'] != version
+        with self._lock:
+            if entry is None or stale:
+                self.metrics['misses'] += 1
+                self.metrics['invalidations'] += int(stale)
+            else:
+                self.metrics['hits'] += 1
+        if stale:
+            self.backend.delete(key)
+        if entry is None or stale:
+            return None
+        return dict(entry['data'], cached=True, cache_age_sec=round(time.time() - entry['stored_at'], 1))
+
+    def set(self, key: str, version: Optional[str], data: Dict[str, Any]) -> None:
+        if version is None:
+            return
+        self.backend.set(key, {'version': version, 'stored_at': time.time(), 'data': data})
+        with self._lock:
+            self.metrics['stores'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['misses']
+            return {
+                'enabled': CACHE_ENABLED,
+                'backend': type(self.backend).__name__,
+                **self.metrics,
+                'hit_rate': round(self.metrics['hits'] / lookups, 3) if lookups else 0.0
+            }
+
+
+rag_result_cache = RAGResultCache()
@@ -0,0 +1,127 @@
+"""
+Token-budgeted context packing for the LLM prompts
+The ranked profiles are cut into field snippets (the analyzer's field_snippets)
+and the prompt context is filled greedily with the highest-scoring ones until
+the token budget is spent. Repeated text is sent once. Token counts are a local
+estimate (no tokenizer download), close to what BPE tokenizers produce for
+English/Spanish prose.
+"""
+
+import os
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+from .rag_analyzer import FIELD_WEIGHTS, normalize_text
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('AI_LLM_CONTEXT_TOKENS', '1500'))
+# Matching snippets come first; the rest of a profile only fills leftover budget
+UNMATCHED_SNIPPET_TOKENS = int(os.environ.get('AI_LLM_UNMATCHED_SNIPPET_TOKENS', '40'))
+
+_WORD_RE = re.compile(r'\w+')
+_SYMBOL_RE = re.compile(r'[^\w\s]')
+
+FIELD_LABELS = {
+    'personal_information': 'Profile',
+    'skills': 'Skills',
+    'experience': 'Experience',
+    'projects': 'Projects',
+    'education': 'Education',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count: about one token per four characters of a word
+    (short words are one token) plus one per punctuation mark
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(word) - 1) // 4 for word in _WORD_RE.findall(text)) + len(_SYMBOL_RE.findall(text))
+
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    words = []
+    used = 0
+    for word in text.split():
+        cost = estimate_tokens(word)
+        if used + cost > max_tokens:
+            return ' '.join(words) + '...'
+        words.append(word)
+        used += cost
+    return text
+
+
+def _profile_name(match: Dict[str, Any]) -> str:
+    personal_information = match.get('personal_information')
+    if isinstance(personal_information, dict):
+        return personal_information.get('name') or 'Unknown'
+    return 'Unknown'
+
+
+def pack_contexts(matches: List[Dict[str, Any]], budget: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Pack ranked matches (payloads carrying field_scores / field_snippets, as
+    built from analyze_profile_match) into at most `budget` estimated tokens.
+    Snippets are taken by field score (the profile score breaks ties); a
+    profile's header line is paid for with its first snippet.
+    Returns (contexts in ranking order [{id, name, score, text}], stats).
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    candidates = []
+    for rank, match in enumerate(matches):
+        field_scores = match.get('field_scores') or {}
+        field_snippets = match.get('field_snippets') or {}
+        for field_name in FIELD_WEIGHTS:
+            snippet = (field_snippets.get(field_name) or (field_scores.get(field_name) or {}).get('snippet') or '').strip()
+            if not snippet:
+                continue
+            field_score = (field_scores.get(field_name) or {}).get('score', 0) or 0
+            if field_score <= 0:
+                snippet = _truncate_tokens(snippet, UNMATCHED_SNIPPET_TOKENS)
+            candidates.append((field_score > 0, field_score, match.get('score', 0) or 0, -rank, field_name, snippet))
+    candidates.sort(key=lambda candidate: candidate[:4], reverse=True)
+
+    stats = {'budget': budget, 'tokens': 0, 'snippets': 0, 'duplicates': 0, 'dropped': 0}
+    packed: Dict[int, Dict[str, Any]] = {}
+    seen = set()
+    for _, _, _, neg_rank, field_name, snippet in candidates:
+        key = normalize_text(snippet).strip(' .')
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        rank = -neg_rank
+        line = f'{FIELD_LABELS.get(field_name, field_name)}: {snippet}'
+        cost = estimate_tokens(' | ' + line)
+        if rank not in packed:
+            header = f'{_profile_name(matches[rank])} (id {matches[rank].get("id")})'
+            cost += estimate_tokens(header)
+        if stats['tokens'] + cost > budget:
+            stats['dropped'] += 1
+            continue
+        seen.add(key)
+        if rank not in packed:
+            packed[rank] = {'header': header, 'lines': {}}
+        packed[rank]['lines'][field_name] = line
+        stats['tokens'] += cost
+        stats['snippets'] += 1
+
+    contexts = []
+    for rank in sorted(packed):
+        match = matches[rank]
+        entry = packed[rank]
+        lines = [entry['lines'][field_name] for field_name in FIELD_WEIGHTS if field_name in entry['lines']]
+        contexts.append({
+            'id': match.get('id'),
+            'name': _profile_name(match),
+            'score': match.get('score', 0),
+            'text': ' | '.join([entry['header']] + lines),
+        })
+    stats['profiles'] = len(contexts)
+    return contexts, stats
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Estimated prompt size of chat messages (a few tokens of framing each)
+    """
+    return sum(4 + estimate_tokens(message.get('content') or '') for message in messages)
@@ -0,0 +1,706 @@
+"""
+Page fetching for Supabase (PostgREST) scans
+Keyset pagination (id=gt.<last id>&order=id) instead of OFFSET. For parallel
+scans the id space is split into ranges, each walked by its own worker, and
+pages are handed to the caller in id order.
+A scan carries its request's Deadline: every page request times out with the
+budget that is left, straggler pages get a hedged duplicate request, and a
+ScanCoverage records which id ranges never reached the caller.
+"""
+
+import os
+import json
+import codecs
+import math
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple, Union
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.request import Request
+
+from .circuit import abandonable
+from .http_client import urlopen
+
+PAGE_SIZE = 1000
+FETCH_WORKERS = int(os.environ.get('AI_RAG_FETCH_WORKERS', '4'))
+# exact | planned | estimated (PostgREST count modes), or off to skip range planning
+COUNT_MODE = os.environ.get('AI_RAG_COUNT_MODE', 'exact')
+# Decode pages row by row from the socket and hand them over in small batches
+STREAM_JSON = os.environ.get('AI_RAG_STREAM_JSON', 'false').lower() == 'true'
+STREAM_BATCH = int(os.environ.get('AI_RAG_STREAM_BATCH', '100'))
+STREAM_CHUNK = 64 * 1024
+# Predicate pushdown: only rows that can score > 0 are transferred
+PUSHDOWN = os.environ.get('AI_RAG_PUSHDOWN', 'false').lower() == 'true'
+PUSHDOWN_MAX_TOKENS = int(os.environ.get('AI_RAG_PUSHDOWN_MAX_TOKENS', '12'))
+# Column holding the profile text folded like rag_analyzer.normalize_text
+# (NFKD, non-ASCII dropped, lowercase); pushdown is off without it, since
+# ilike on the raw JSON misses accented text the scorer matches. In Postgres:
+#   lower(regexp_replace(normalize(concat_ws(' ', personal_information::text, experience::text,
+#         education::text, skills::text, projects::text), NFKD), '[^\x01-\x7f]', '', 'g'))
+# kept current by a trigger.
+PUSHDOWN_COLUMN = os.environ.get('AI_RAG_PUSHDOWN_COLUMN', '')
+# Pages buffered per range worker before it waits for the consumer
+RANGE_BUFFER = int(os.environ.get('AI_RAG_RANGE_BUFFER', '8'))
+# Per-request timeout cap; inside a scan it shrinks to the budget left
+REQUEST_TIMEOUT_SEC = float(os.environ.get('AI_HTTP_TIMEOUT_SEC', '8'))
+MIN_REQUEST_TIMEOUT_SEC = 0.05
+# Hedged page requests: a duplicate is sent when a page takes longer than the
+# p95 of recent page latencies (and at least AI_RAG_HEDGE_MIN_MS)
+HEDGE = os.environ.get('AI_RAG_HEDGE', 'true').lower() == 'true'
+HEDGE_PERCENTILE = float(os.environ.get('AI_RAG_HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_MS = float(os.environ.get('AI_RAG_HEDGE_MIN_MS', '50'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('AI_RAG_HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WORKERS = int(os.environ.get('AI_RAG_HEDGE_WORKERS', '16'))
+
+
+class Deadline:
+    """
+    Time budget of one request, carried through every fetch of its scan:
+    no request starts once it has expired and each one times out with the
+    time left (capped at REQUEST_TIMEOUT_SEC)
+    """
+
+    def __init__(self, budget_sec: float):
+        self.expires_at = time.time() + budget_sec
+
+    @classmethod
+    def coerce(cls, value: Union['Deadline', float, None]) -> Optional['Deadline']:
+        """
+        Deadline from a Deadline, an epoch timestamp or None
+        """
+        if value is None or isinstance(value, Deadline):
+            return value
+        deadline = cls(0)
+        deadline.expires_at = float(value)
+        return deadline
+
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    def expired(self) -> bool:
+        return time.time() > self.expires_at
+
+    def timeout(self, cap: float = REQUEST_TIMEOUT_SEC) -> float:
+        return max(MIN_REQUEST_TIMEOUT_SEC, min(cap, self.remaining()))
+
+
+def rag_deadline() -> Deadline:
+    """
+    Deadline of one RAG request: AI_RAG_BUDGET_SEC from now (read per request,
+    after load_env)
+    """
+    return Deadline(float(os.environ.get('AI_RAG_BUDGET_SEC', '8')))
+
+
+def request_timeout(deadline: Optional[Deadline]) -> float:
+    return REQUEST_TIMEOUT_SEC if deadline is None else deadline.timeout()
+
+
+def skip_reason(error: BaseException, deadline: Optional[Deadline] = None) -> str:
+    """
+    Why a range was left unscanned, for the `skipped` report
+    """
+    if deadline is not None and deadline.remaining() <= MIN_REQUEST_TIMEOUT_SEC:
+        return 'deadline'
+    if isinstance(error, HTTPError):
+        return f'HTTP {error.code}'
+    if isinstance(error, URLError):
+        return f'unreachable: {error.reason}'
+    return f'error: {error}'
+
+
+class IdSpan:
+    """
+    One keyset range of a scan (after_id < id < before_id, None = unbounded)
+    and how far it got to the caller
+    """
+
+    def __init__(self, after_id: Any = None, before_id: Any = None):
+        self.after_id = after_id
+        self.before_id = before_id
+        # Last id handed to the caller
+        self.last_id = after_id
+        # The fetcher reached the end of the range / the caller received all of it
+        self.fetched_all = False
+        self.consumed = False
+        self.reason: Optional[str] = None
+
+    def advance(self, page: List[Dict[str, Any]]) -> None:
+        """
+        `page` was handed to the caller
+        """
+        if page:
+            self.last_id = page[-1].get('id')
+
+
+class ScanCoverage:
+    """
+    Id ranges of a scan; skipped() lists the parts that were never handed to
+    the caller (deadline, failed requests, abandoned scan) with the reason
+    """
+
+    def __init__(self):
+        self.spans: List[IdSpan] = []
+        self.errors: List[BaseException] = []
+
+    def add_span(self, after_id: Any = None, before_id: Any = None) -> IdSpan:
+        span = IdSpan(after_id, before_id)
+        self.spans.append(span)
+        return span
+
+    def skip(self, span: IdSpan, error: BaseException, deadline: Optional[Deadline] = None) -> None:
+        """
+        `span` stopped on `error`; the rest of the scan goes on
+        """
+        span.reason = skip_reason(error, deadline)
+        self.errors.append(error)
+
+    def fail(self, error: BaseException, deadline: Optional[Deadline] = None) -> None:
+        """
+        The scan stopped on `error`: every unfinished range is skipped for it
+        """
+        self.errors.append(error)
+        if not self.spans:
+            self.add_span()
+        for span in self.spans:
+            if not span.consumed and span.reason is None:
+                span.reason = skip_reason(error, deadline)
+
+    def skipped(self) -> List[Dict[str, Any]]:
+        return [
+            {'after_id': span.last_id, 'before_id': span.before_id, 'reason': span.reason or 'deadline'}
+            for span in self.spans if not span.consumed
+        ]
+
+
+def track_pages(pages: Iterable[List[Dict[str, Any]]], coverage: Optional[ScanCoverage]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Pages of an id-ordered scan not planned by fetch_pages (replica, single
+    keyset walk), recorded in `coverage` as one range
+    """
+    span = coverage.add_span() if coverage is not None else None
+    for page in pages:
+        if span is not None:
+            span.advance(page)
+        yield page
+    if span is not None:
+        span.fetched_all = span.consumed = True
+
+
+class LatencyTracker:
+    """
+    Recent page latencies; the hedging delay is their p95
+    """
+
+    def __init__(self, window: int = 200):
+        self.samples: 'deque[float]' = deque(maxlen=window)
+        self.metrics = {'pages': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self.samples.append(latency_ms)
+            self.metrics['pages'] += 1
+
+    def count(self, metric: str) -> None:
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(math.ceil(p / 100 * len(samples))) - 1)]
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait for a page before hedging it; None while warming up
+        """
+        if not HEDGE or len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_MS, self.percentile(HEDGE_PERCENTILE)) / 1000
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.percentile(95)
+        return {'hedge': HEDGE, **self.metrics, 'p95_ms': round(p95, 1) if p95 is not None else None}
+
+
+page_latency = LatencyTracker()
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='rag-hedge')
+        return _hedge_pool
+
+
+def fetch_stats() -> Dict[str, Any]:
+    return page_latency.stats()
+
+
+def parse_content_range(value: Optional[str]) -> Optional[int]:
+    """
+    Total row count from a Content-Range header ("0-999/20000", "*/0"); None if unknown
+    """
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def resolve_pushdown(value: Any) -> bool:
+    """
+    Pushdown switch from a request parameter, falling back to AI_RAG_PUSHDOWN
+    """
+    if value is None or value == '':
+        return PUSHDOWN
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def pushdown_filter(query_tokens: List[str]) -> str:
+    """
+    PostgREST `or=` filter on AI_RAG_PUSHDOWN_COLUMN keeping only rows where
+    the profile text contains some query token, i.e. rows that can have
+    total_score > 0. The filter is a superset of the matching rows (Python
+    scoring still decides); '' when the query cannot be pushed down (no
+    normalized column, no tokens, or too many for a useful filter).
+    """
+    tokens = list(dict.fromkeys(query_tokens))
+    if not PUSHDOWN_COLUMN or not tokens or len(tokens) > PUSHDOWN_MAX_TOKENS:
+        return ''
+    return '&or=(' + ','.join(f'{PUSHDOWN_COLUMN}.ilike.*{token}*' for token in tokens) + ')'
+
+
+def fetch_rows(url: str, headers: Dict[str, str], timeout: float = REQUEST_TIMEOUT_SEC) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Rows of one request plus the total count when the response carries it
+    """
+    with urlopen(Request(url, headers=headers), timeout=timeout) as r:
+        rows = json.loads(r.read().decode('utf-8'))
+        total = parse_content_range(r.getheader('Content-Range'))
+    if not isinstance(rows, list):
+        rows = []
+    return rows, total
+
+
+def _timed_fetch_rows(url: str, headers: Dict[str, str], timeout: float,
+                      abandoned: Optional[threading.Event] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    start = time.time()
+    with abandonable(abandoned):
+        result = fetch_rows(url, headers, timeout)
+    page_latency.record((time.time() - start) * 1000)
+    return result
+
+
+# Hedging decisions shared by fetch_page and rag_async.afetch_page; the
+# requests are concurrent futures there and asyncio tasks here
+
+def _should_hedge(primary_done: bool, deadline: Optional[Deadline]) -> bool:
+    """
+    The primary request outlived the hedge delay and there is budget left for a duplicate
+    """
+    return not primary_done and not (deadline is not None and deadline.expired())
+
+
+def _hedge_winner(done: Iterable[Any], hedge: Any) -> Any:
+    """
+    First request in `done` that succeeded (None if all failed), counting hedge wins
+    """
+    for request in done:
+        if request.exception() is None:
+            if request is hedge:
+                page_latency.count('hedge_wins')
+            return request
+    return None
+
+
+def fetch_page(url: str, headers: Dict[str, str], deadline: Optional[Deadline] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    fetch_rows for scan pages: times out with the budget left and, once the
+    page outlives the p95 page latency, races a duplicate request against it
+    (the first response wins). The losing request is cancelled if it has not
+    started; a running thread cannot be interrupted, so unlike in rag_async it
+    finishes in the background, marked abandoned so its failure does not count
+    against the circuit breaker, and its result is dropped.
+    """
+    delay = page_latency.hedge_delay()
+    if delay is None:
+        return _timed_fetch_rows(url, headers, request_timeout(deadline))
+    pool = _get_hedge_pool()
+    primary_abandoned, hedge_abandoned = threading.Event(), threading.Event()
+    primary = pool.submit(_timed_fetch_rows, url, headers, request_timeout(deadline), primary_abandoned)
+    done, _ = wait([primary], timeout=delay)
+    if not _should_hedge(bool(done), deadline):
+        return primary.result()
+    hedge = pool.submit(_timed_fetch_rows, url, headers, request_timeout(deadline), hedge_abandoned)
+    abandoned = {primary: primary_abandoned, hedge: hedge_abandoned}
+    page_latency.count('hedged')
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = _hedge_winner(done, hedge)
+            if winner is not None:
+                return winner.result()
+        # Both failed: report the original request's error
+        return primary.result()
+    finally:
+        for future in pending:
+            future.cancel()
+            abandoned[future].set()
+
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JSONArrayDecoder:
+    """
+    Push parser for a JSON array: feed() it bytes as they arrive and get back
+    the elements completed so far, holding about one element at a time.
+    Shared by the blocking and the asyncio page streams.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self.started = False
+        # The closing bracket was read; anything after it is ignored
+        self.done = False
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        buf = self._buf + self._utf8.decode(chunk, final=final)
+        pos = 0
+        values = []
+        while not self.done:
+            # Whitespace, and the commas between elements
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or (self.started and buf[pos] == ',')):
+                pos += 1
+            if pos == len(buf):
+                break
+            if not self.started:
+                if buf[pos] != '[':
+                    raise ValueError('expected a JSON array')
+                self.started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                self.done = True
+                pos += 1
+                break
+            try:
+                value, end = self._decoder.raw_decode(buf, pos)
+            except ValueError:
+                if final:
+                    raise ValueError('truncated JSON array')
+                break
+            # A value ending exactly at the buffer edge may be cut short (numbers)
+            if end == len(buf) and not final:
+                break
+            values.append(value)
+            pos = end
+        self._buf = buf[pos:]
+        return values
+
+    def close(self) -> List[Any]:
+        """
+        Elements left at the end of the input; raises ValueError if the array is incomplete
+        """
+        values = self.feed(b'', final=True)
+        if self.started and not self.done:
+            raise ValueError('unterminated JSON array')
+        return values
+
+
+def iter_json_array(stream: Any, chunk_size: int = STREAM_CHUNK) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array read incrementally from a binary
+    stream (anything with read(n)), holding about one element at a time
+    """
+    decoder = JSONArrayDecoder()
+    while not decoder.done:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            yield from decoder.close()
+            return
+        yield from decoder.feed(chunk)
+
+
+def _stream_rows(url: str, headers: Dict[str, str], batch_size: int, timeout: float = REQUEST_TIMEOUT_SEC) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Rows of one request, decoded while they arrive, in batches of `batch_size`
+    """
+    batch = []
+    with urlopen(Request(url, headers=headers), timeout=timeout) as r:
+        for row in iter_json_array(r):
+            if not isinstance(row, dict):
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class KeysetCursor:
+    """
+    Position of one keyset walk (after_id < id < before_id): the URL of the
+    next page and whether the range is exhausted. Shared by iter_keyset and
+    rag_async.aiter_keyset.
+    """
+
+    def __init__(self, url: str, page_size: int, after_id: Any = None, before_id: Any = None):
+        self.url = url
+        self.page_size = page_size
+        self.last_id = after_id
+        self.before_id = before_id
+        # Rows received for the current page (over several batches when streamed)
+        self.received = 0
+
+    def next_url(self) -> str:
+        self.received = 0
+        page_url = f'{self.url}&order=id&limit={self.page_size}'
+        if self.last_id is not None:
+            page_url += f'&id=gt.{self.last_id}'
+        if self.before_id is not None:
+            page_url += f'&id=lt.{self.before_id}'
+        return page_url
+
+    def advance(self, rows: List[Dict[str, Any]]) -> None:
+        self.received += len(rows)
+        if rows:
+            self.last_id = rows[-1].get('id')
+
+    def exhausted(self) -> bool:
+        """
+        The current page came back short: the range has no rows left
+        """
+        return self.received < self.page_size or self.last_id is None
+
+
+def iter_keyset(url: str, headers: Dict[str, str], page_size: int = PAGE_SIZE, after_id: Any = None,
+                before_id: Any = None, deadline: Union[Deadline, float, None] = None,
+                span: Optional[IdSpan] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield pages of a PostgREST query (url with its filters, no order/limit)
+    ordered by id, starting after `after_id` and stopping before `before_id`.
+    With AI_RAG_STREAM_JSON each page arrives as several smaller batches.
+    `span.fetched_all` is set once the end of the range is reached.
+    """
+    deadline = Deadline.coerce(deadline)
+    cursor = KeysetCursor(url, page_size, after_id, before_id)
+    while deadline is None or not deadline.expired():
+        page_url = cursor.next_url()
+        if STREAM_JSON:
+            # Batches of the page are yielded while the rest is still arriving
+            # (streamed pages are not hedged)
+            for rows in _stream_rows(page_url, headers, STREAM_BATCH, request_timeout(deadline)):
+                cursor.advance(rows)
+                yield rows
+        else:
+            rows, _ = fetch_page(page_url, headers, deadline)
+            cursor.advance(rows)
+            if rows:
+                yield rows
+        if cursor.exhausted():
+            if span is not None:
+                span.fetched_all = True
+            return
+
+
+def iter_rows(url: str, headers: Dict[str, str], **kwargs) -> Iterator[Dict[str, Any]]:
+    """
+    Row-by-row view of iter_keyset
+    """
+    for page in iter_keyset(url, headers, **kwargs):
+        yield from page
+
+
+def _id_query(url: str, order: str) -> str:
+    parts = urlsplit(url)
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'select']
+    params = [('select', 'id')] + params + [('order', order), ('limit', '1')]
+    return urlunsplit(parts._replace(query=urlencode(params, safe='(),.*:')))
+
+
+def id_bounds(url: str, headers: Dict[str, str], after_id: Any = None,
+              deadline: Optional[Deadline] = None) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    (min id, max id, row count) of the query, or None when ids are not integers
+    """
+    (first_url, count_headers), (last_url, _) = _id_bound_requests(url, headers, after_id)
+    first, total = fetch_rows(first_url, count_headers, request_timeout(deadline))
+    last, _ = fetch_rows(last_url, headers, request_timeout(deadline))
+    return _parse_id_bounds(first, last, total)
+
+
+def _id_bound_requests(url: str, headers: Dict[str, str], after_id: Any) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    (url, headers) of the lowest-id request, which carries the count, and of the highest-id one
+    """
+    if after_id is not None:
+        url += f'&id=gt.{after_id}'
+    count_headers = dict(headers)
+    if COUNT_MODE != 'off':
+        count_headers['Prefer'] = f'count={COUNT_MODE}'
+    return [(_id_query(url, 'id.asc'), count_headers), (_id_query(url, 'id.desc'), headers)]
+
+
+def _parse_id_bounds(first: List[Dict[str, Any]], last: List[Dict[str, Any]],
+                     total: Optional[int]) -> Optional[Tuple[int, int, Optional[int]]]:
+    if not first or not last:
+        return None
+    low, high = first[0].get('id'), last[0].get('id')
+    if not isinstance(low, int) or not isinstance(high, int):
+        return None
+    return low, high, total
+
+
+def split_id_range(low: int, high: int, parts: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    Split [low, high] into `parts` (after_id, before_id) keyset ranges. The
+    last range is left open so rows inserted during the scan are still seen.
+    """
+    parts = max(1, min(parts, high - low + 1))
+    step = (high - low + 1) / parts
+    edges = [low + int(round(step * i)) for i in range(parts)]
+    ranges = []
+    for i, start in enumerate(edges):
+        before_id = edges[i + 1] if i + 1 < len(edges) else None
+        ranges.append((start - 1, before_id))
+    return ranges
+
+
+def plans_ranges(workers: int) -> bool:
+    """
+    A scan with `workers` is split into id ranges (which needs id_bounds first)
+    """
+    return workers > 1 and COUNT_MODE != 'off'
+
+
+def plan_spans(coverage: ScanCoverage, bounds: Optional[Tuple[int, int, Optional[int]]], after_id: Any,
+               page_size: int, workers: int) -> List[IdSpan]:
+    """
+    The id ranges of a scan, added to `coverage`: one per worker (at most one
+    per page of rows) when the bounds are known, else a single open range
+    """
+    if bounds is None:
+        ranges = [(after_id, None)]
+    else:
+        low, high, total = bounds
+        parts = min(workers, math.ceil(total / page_size)) if total is not None else workers
+        ranges = split_id_range(low, high, parts) if parts > 1 else [(low - 1, None)]
+    return [coverage.add_span(range_after, range_before) for range_after, range_before in ranges]
+
+
+_DONE = object()
+
+
+def _put(pages: queue.Queue, stop: threading.Event, item: Any) -> bool:
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(pages: queue.Queue, stop: threading.Event, url: str, headers: Dict[str, str], page_size: int,
+             span: IdSpan, deadline: Optional[Deadline]) -> None:
+    try:
+        for page in iter_keyset(url, headers, page_size, span.after_id, span.before_id, deadline, span):
+            if not _put(pages, stop, page):
+                return
+        _put(pages, stop, _DONE)
+    except Exception as e:
+        _put(pages, stop, e)
+
+
+def _walk(pages: Iterator[List[Dict[str, Any]]], span: IdSpan, coverage: Optional[ScanCoverage],
+          deadline: Optional[Deadline]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Pages of one range handed to the caller, recorded in `span`. With a
+    coverage, a failed range is recorded as skipped instead of raised.
+    """
+    try:
+        for page in pages:
+            span.advance(page)
+            yield page
+    except Exception as e:
+        if coverage is None:
+            raise
+        coverage.skip(span, e, deadline)
+        return
+    span.consumed = span.fetched_all
+
+
+def fetch_pages(url: str, headers: Dict[str, str], page_size: int = PAGE_SIZE,
+                deadline: Union[Deadline, float, None] = None, workers: Optional[int] = None, after_id: Any = None,
+                coverage: Optional[ScanCoverage] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the pages of a PostgREST query (url with its filters, no order/limit)
+    in id order, resuming after `after_id` if given.
+
+    With workers > 1 and more than one page of rows, the id space is split into
+    ranges walked concurrently; pages are still yielded range by range, so the
+    result does not depend on arrival order. No new requests are started after
+    `deadline` and each one times out with the budget left.
+
+    Without `coverage`, HTTP errors propagate to the caller when the failed
+    page is reached. With it, a failed range is skipped and the scan goes on;
+    coverage.skipped() then lists every id range the caller did not get
+    (errors only propagate when no page could be fetched at all).
+    """
+    deadline = Deadline.coerce(deadline)
+    coverage_given = coverage is not None
+    coverage = coverage if coverage_given else ScanCoverage()
+    yielded = False
+    workers = FETCH_WORKERS if workers is None else workers
+    bounds = id_bounds(url, headers, after_id, deadline) if plans_ranges(workers) else None
+    spans = plan_spans(coverage, bounds, after_id, page_size, workers)
+
+    if len(spans) == 1:
+        span = spans[0]
+        pages = iter_keyset(url, headers, page_size, span.after_id, span.before_id, deadline, span)
+        for page in _walk(pages, span, coverage if coverage_given else None, deadline):
+            yielded = True
+            yield page
+    else:
+        stop = threading.Event()
+        buffers = [queue.Queue(maxsize=RANGE_BUFFER) for _ in spans]
+        pool = ThreadPoolExecutor(max_workers=len(spans))
+        try:
+            for buffer, span in zip(buffers, spans):
+                pool.submit(_produce, buffer, stop, url, headers, page_size, span, deadline)
+            for buffer, span in zip(buffers, spans):
+                for page in _walk(_drain(buffer), span, coverage if coverage_given else None, deadline):
+                    yielded = True
+                    yield page
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+    if coverage.errors and not yielded:
+        raise coverage.errors[0]
+
+
+def _drain(buffer: queue.Queue) -> Iterator[List[Dict[str, Any]]]:
+    while True:
+        page = buffer.get()
+        if page is _DONE:
+            return
+        if isinstance(page, Exception):
+            raise page
+        yield page
@@ -0,0 +1,197 @@
+"""
+SQLite FTS5 search backend for RAG ranking
+Profile and company documents are loaded into FTS5 tables with one column per
+FIELD_WEIGHTS field; queries are ranked by bm25() with the field weights and
+come back with a snippet() of the best matching column, so tokenization and
+ranking run inside SQLite. Each table holds at most AI_RAG_FTS_MAX_DOCS
+documents; the least recently scanned ones are dropped first.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from .rag_analyzer import FIELD_WEIGHTS, profile_signature, tokenize_profile
+
+# Own connection rather than Django's: its ':memory:' database is per thread
+FTS_PATH = os.environ.get('AI_RAG_FTS_PATH', ':memory:')
+FTS_COLUMNS = tuple(FIELD_WEIGHTS.keys())
+# trigram keeps the analyzer's substring semantics (SQLite >= 3.34);
+# unicode61 with prefix queries is the fallback for older builds
+FTS_TOKENIZERS = ('trigram', 'unicode61 remove_diacritics 2')
+SNIPPET_TOKENS = int(os.environ.get('AI_RAG_FTS_SNIPPET_TOKENS', '24'))
+# Should exceed the largest single scan, like AI_RAG_INDEX_MAX_PROFILES
+FTS_MAX_DOCS = int(os.environ.get('AI_RAG_FTS_MAX_DOCS', '50000'))
+
+_conn = None
+_conn_lock = threading.Lock()
+# One connection shared by every index, so every statement runs under one lock
+_db_lock = threading.Lock()
+_indexes: Dict[str, 'FTSIndex'] = {}
+
+
+class FTSIndex:
+    """
+    FTS5 table `<name>_fts` (rowid = document id) plus `<name>_doc` holding the
+    content signature of every loaded document, so unchanged rows are skipped,
+    and when it was last loaded: past `max_docs` documents the least recently
+    loaded ones (profiles deleted upstream among them) are evicted.
+    Columns hold the analyzer's normalized text (lowercase, no accents).
+    """
+
+    def __init__(self, name: str, conn: sqlite3.Connection, lock: threading.Lock, max_docs: Optional[int] = None):
+        self.name = name
+        self.conn = conn
+        self.max_docs = max_docs
+        self.evictions = 0
+        self._lock = lock
+        self.tokenizer = None
+        with self._lock:
+            for tokenizer in FTS_TOKENIZERS:
+                try:
+                    conn.execute(
+                        f'CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5('
+                        f'{", ".join(FTS_COLUMNS)}, tokenize="{tokenizer}")'
+                    )
+                except sqlite3.OperationalError:
+                    continue
+                self.tokenizer = tokenizer.split()[0]
+                break
+            if self.tokenizer is None:
+                raise RuntimeError('SQLite was built without FTS5')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {name}_doc ('
+                f' id INTEGER PRIMARY KEY, signature TEXT NOT NULL, seen INTEGER NOT NULL DEFAULT 0)'
+            )
+            if 'seen' not in [column[1] for column in conn.execute(f'PRAGMA table_info({name}_doc)')]:
+                # Table created by an older version in an on-disk AI_RAG_FTS_PATH
+                conn.execute(f'ALTER TABLE {name}_doc ADD COLUMN seen INTEGER NOT NULL DEFAULT 0')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_doc_seen ON {name}_doc (seen)')
+            # Load counter: documents with the lowest `seen` are evicted first
+            self._tick = conn.execute(f'SELECT COALESCE(MAX(seen), 0) FROM {name}_doc').fetchone()[0]
+            conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS {name}_scope (id INTEGER PRIMARY KEY)')
+            conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM {self.name}_doc').fetchone()[0]
+
+    def add_many(self, documents: Iterable[Tuple[Any, Dict[str, Any]]]) -> int:
+        """
+        Load (id, document) pairs, documents in profile format. Returns how many
+        were inserted or replaced; non-integer ids are ignored. Unchanged
+        documents only count as recently loaded.
+        """
+        loaded = 0
+        with self._lock:
+            for doc_id, document in documents:
+                if not isinstance(doc_id, int):
+                    continue
+                self._tick += 1
+                signature = profile_signature(document)
+                current = self.conn.execute(f'SELECT signature FROM {self.name}_doc WHERE id = ?', (doc_id,)).fetchone()
+                if current is not None and current[0] == signature:
+                    self.conn.execute(f'UPDATE {self.name}_doc SET seen = ? WHERE id = ?', (self._tick, doc_id))
+                    continue
+                fields = tokenize_profile(document)
+                self.conn.execute(f'DELETE FROM {self.name}_fts WHERE rowid = ?', (doc_id,))
+                self.conn.execute(
+                    f'INSERT INTO {self.name}_fts (rowid, {", ".join(FTS_COLUMNS)}) '
+                    f'VALUES (?{", ?" * len(FTS_COLUMNS)})',
+                    [doc_id] + [fields[column][1] for column in FTS_COLUMNS]
+                )
+                self.conn.execute(
+                    f'INSERT OR REPLACE INTO {self.name}_doc (id, signature, seen) VALUES (?, ?, ?)',
+                    (doc_id, signature, self._tick)
+                )
+                loaded += 1
+            self._evict()
+            self.conn.commit()
+        return loaded
+
+    def _evict(self) -> None:
+        if self.max_docs is None:
+            return
+        excess = self.conn.execute(f'SELECT COUNT(*) FROM {self.name}_doc').fetchone()[0] - self.max_docs
+        if excess <= 0:
+            return
+        evicted = self.conn.execute(
+            f'SELECT id FROM {self.name}_doc ORDER BY seen LIMIT ?', (excess,)
+        ).fetchall()
+        self.conn.executemany(f'DELETE FROM {self.name}_fts WHERE rowid = ?', evicted)
+        self.conn.executemany(f'DELETE FROM {self.name}_doc WHERE id = ?', evicted)
+        self.evictions += len(evicted)
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        return self.add_many((row.get('id'), row) for row in rows)
+
+    def match_expression(self, query_tokens: List[str]) -> str:
+        """
+        FTS5 query matching documents that contain any of the tokens
+        """
+        suffix = '' if self.tokenizer == 'trigram' else '*'
+        return ' OR '.join('"' + token.replace('"', '""') + '"' + suffix for token in dict.fromkeys(query_tokens))
+
+    def search(self, query_analysis: Dict[str, Any], limit: int,
+               doc_ids: Optional[Iterable[Any]] = None) -> Tuple[List[Tuple[Any, float, str]], Dict[str, Any]]:
+        """
+        Top-`limit` documents by bm25() with FIELD_WEIGHTS as column weights,
+        optionally restricted to `doc_ids`. Scores are negated bm25 values
+        (higher is better). Returns ([(id, score, snippet)], stats).
+        """
+        stats = {'scorer': 'fts', 'tokenizer': self.tokenizer, 'candidates': 0, 'scored': 0}
+        # The trigram tokenizer cannot match anything shorter than 3 characters
+        query_tokens = [token for token in query_analysis['tokens'] if len(token) >= 3]
+        if not query_tokens or limit <= 0:
+            return [], stats
+        weights = ', '.join(str(FIELD_WEIGHTS[column]) for column in FTS_COLUMNS)
+        where = f'{self.name}_fts MATCH ?'
+        with self._lock:
+            if doc_ids is not None:
+                self.conn.execute(f'DELETE FROM {self.name}_scope')
+                self.conn.executemany(
+                    f'INSERT OR IGNORE INTO {self.name}_scope (id) VALUES (?)',
+                    [(doc_id,) for doc_id in doc_ids if isinstance(doc_id, int)]
+                )
+                where += f' AND rowid IN (SELECT id FROM {self.name}_scope)'
+            match = self.match_expression(query_tokens)
+            stats['candidates'] = self.conn.execute(
+                f'SELECT COUNT(*) FROM {self.name}_fts WHERE {where}', (match,)
+            ).fetchone()[0]
+            fetched = self.conn.execute(
+                f'SELECT rowid, -bm25({self.name}_fts, {weights}) AS score, '
+                f"snippet({self.name}_fts, -1, '[', ']', '...', {SNIPPET_TOKENS}) "
+                f'FROM {self.name}_fts WHERE {where} ORDER BY score DESC, rowid LIMIT ?',
+                (match, limit)
+            ).fetchall()
+        stats['scored'] = stats['candidates']
+        return [(doc_id, score, snippet) for doc_id, score, snippet in fetched], stats
+
+    def stats(self) -> Dict[str, Any]:
+        return {'documents': len(self), 'max_docs': self.max_docs, 'evictions': self.evictions}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.conn.execute(f'DELETE FROM {self.name}_fts')
+            self.conn.execute(f'DELETE FROM {self.name}_doc')
+            self.conn.commit()
+
+
+def get_fts_index(name: str) -> Optional[FTSIndex]:
+    """
+    Shared FTS index for a document kind ('profile', 'company'), or None when
+    this SQLite build has no FTS5
+    """
+    global _conn
+    with _conn_lock:
+        if name in _indexes:
+            return _indexes[name]
+        if _conn is None:
+            _conn = sqlite3.connect(FTS_PATH, check_same_thread=False)
+        try:
+            index = FTSIndex(name, _conn, _db_lock, max_docs=FTS_MAX_DOCS)
+        except (RuntimeError, sqlite3.OperationalError):
+            return None
+        _indexes[name] = index
+        return index
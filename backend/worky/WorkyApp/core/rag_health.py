@@ -0,0 +1,146 @@
+"""
+Cached dependency health for the health endpoints
+A background thread probes OpenAI and Supabase every AI_HEALTH_REFRESH_SEC and
+the health views serve the last result at once. The probes cost no tokens
+(OpenAI's model list, one Supabase id) and feed the circuit breakers: an
+unreachable dependency trips its breaker, a healthy probe closes it.
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, Any, Optional
+from urllib.error import HTTPError, URLError
+
+from .circuit import get_breaker
+from .http_client import http_client, load_env
+
+HEALTH_REFRESH_SEC = float(os.environ.get('AI_HEALTH_REFRESH_SEC', '15'))
+HEALTH_TIMEOUT_SEC = float(os.environ.get('AI_HEALTH_TIMEOUT_SEC', '5'))
+
+
+def _probe(url: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    start = time.time()
+    error = None
+    try:
+        # guard=False: the probe is what tells an open breaker the dependency is back
+        with http_client.request('GET', url, headers, timeout=HEALTH_TIMEOUT_SEC, guard=False) as r:
+            r.read()
+            status_code = r.status
+    except HTTPError as e:
+        status_code = e.code
+        error = f'HTTP {e.code}'
+    except URLError as e:
+        status_code = 0
+        error = str(e.reason)
+    return {
+        'ok': 200 <= status_code < 300,
+        'status_code': status_code,
+        'latency_ms': round((time.time() - start) * 1000, 1),
+        'error': error
+    }
+
+
+def probe_openai() -> Dict[str, Any]:
+    """
+    Authenticated model listing: checks reachability and the key, bills nothing
+    """
+    load_env()
+    key = os.environ.get('OPENAI_API_KEY')
+    if not key:
+        return {'ok': False, 'status_code': 500, 'latency_ms': 0.0, 'error': 'Missing OPENAI_API_KEY'}
+    base = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+    return _probe(base + '/models', {'Authorization': 'Bearer ' + key})
+
+
+def probe_supabase() -> Dict[str, Any]:
+    load_env()
+    base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+    key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+    if not base or not key:
+        return {'ok': False, 'status_code': 500, 'latency_ms': 0.0, 'error': 'Missing Supabase env'}
+    url = base.rstrip('/') + '/rest/v1/profile?select=id&limit=1'
+    return _probe(url, {'apikey': key, 'Authorization': 'Bearer ' + key})
+
+
+PROBES: Dict[str, Callable[[], Dict[str, Any]]] = {
+    'openai': probe_openai,
+    'supabase': probe_supabase,
+}
+
+
+class HealthMonitor:
+    """
+    Last probe result of every dependency, refreshed by a daemon thread
+    """
+
+    def __init__(self, probes: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None,
+                 interval: float = HEALTH_REFRESH_SEC):
+        self.probes = PROBES if probes is None else probes
+        self.interval = interval
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def refresh(self) -> None:
+        for name, probe in self.probes.items():
+            try:
+                result = probe()
+            except Exception as e:
+                result = {'ok': False, 'status_code': 0, 'latency_ms': 0.0, 'error': str(e)}
+            result['checked_at'] = time.time()
+            breaker = get_breaker(name)
+            if result['ok']:
+                breaker.record_success()
+            elif result['status_code'] == 0 or result['status_code'] >= 500:
+                # Unreachable or failing; a 4xx (bad key) is a config problem, not an outage
+                breaker.trip(result['error'])
+            with self._lock:
+                self.results[name] = result
+        with self._lock:
+            self.refreshes += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._loop, name='rag-health', daemon=True)
+            self._worker.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def status(self, name: str) -> Dict[str, Any]:
+        """
+        Cached result for a dependency, with its age and breaker state
+        """
+        with self._lock:
+            result = dict(self.results.get(name) or {'ok': False, 'status_code': 0, 'error': 'not checked yet'})
+        if 'checked_at' in result:
+            result['age_sec'] = round(time.time() - result['checked_at'], 1)
+        result['breaker'] = get_breaker(name).stats()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: self.status(name) for name in self.probes}
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    Shared monitor; the first call probes once inline (so there is a status
+    to serve) and starts the refresher
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = HealthMonitor()
+            _monitor.refresh()
+            _monitor.start()
+        return _monitor
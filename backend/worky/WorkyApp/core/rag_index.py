@@ -0,0 +1,335 @@
+"""
+In-memory inverted index for RAG profile search
+Keeps per-field postings so a search only touches profiles sharing query tokens.
+The shared index is bounded: the least recently scanned profiles are evicted.
+"""
+
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Any, Optional, Set, Iterable, Tuple
+
+from .rag_analyzer import (
+    FIELD_WEIGHTS,
+    extract_field_text,
+    tokenize_text,
+    profile_signature,
+    TokenizedProfileCache,
+    tokenized_profile_cache
+)
+
+
+class TrigramIndex:
+    """
+    Character-trigram index over vocabulary terms.
+    Answers "which terms contain this token" without scanning the vocabulary.
+    """
+
+    def __init__(self):
+        self.grams: Dict[str, Set[str]] = {}
+        self.terms: Set[str] = set()
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, term: str) -> None:
+        if term in self.terms:
+            return
+        self.terms.add(term)
+        for gram in self.trigrams(term):
+            self.grams.setdefault(gram, set()).add(term)
+
+    def remove(self, term: str) -> None:
+        if term not in self.terms:
+            return
+        self.terms.discard(term)
+        for gram in self.trigrams(term):
+            terms = self.grams.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self.grams[gram]
+
+    def search(self, token: str) -> Set[str]:
+        """
+        Terms containing token as a substring
+        """
+        if len(token) < 3:
+            return {term for term in self.terms if token in term}
+        postings = []
+        for gram in self.trigrams(token):
+            terms = self.grams.get(gram)
+            if not terms:
+                return set()
+            postings.append(terms)
+        postings.sort(key=len)
+        found = set(postings[0])
+        for terms in postings[1:]:
+            found &= terms
+            if not found:
+                return found
+        # Trigrams can match out of order, so verify the actual substring
+        return {term for term in found if token in term}
+
+
+class ProfileIndex:
+    """
+    Per-field inverted index: field -> token -> {profile_id: term_count}
+
+    Profiles can be added, updated and removed one at a time so the index
+    stays current without full rebuilds. With a TokenizedProfileCache the
+    index shares tokenization (and content signatures) with the analyzer.
+    With `max_profiles` the profiles least recently added (or re-added
+    unchanged) are evicted, so rows that stopped coming back from Supabase
+    eventually leave the index.
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None, cache: Optional[TokenizedProfileCache] = None,
+                 max_profiles: Optional[int] = None):
+        self.fields = tuple(fields or FIELD_WEIGHTS.keys())
+        self.cache = cache
+        self.max_profiles = max_profiles
+        self.evictions = 0
+        self.postings: Dict[str, Dict[str, Dict[Any, int]]] = {field: {} for field in self.fields}
+        # Least recently added first (eviction order)
+        self.documents: 'OrderedDict[Any, Dict[str, Counter]]' = OrderedDict()
+        self.signatures: Dict[Any, str] = {}
+        # term -> number of (field, profile) postings referencing it
+        self.vocabulary: Dict[str, int] = {}
+        self.trigrams = TrigramIndex()
+        # BM25F statistics, maintained incrementally
+        self.doc_freq: Dict[str, int] = {}
+        self.lengths: Dict[Any, Dict[str, int]] = {}
+        self.length_totals: Dict[str, int] = {field: 0 for field in self.fields}
+        # Bumped before every vocabulary change so matchers can tell a stale snapshot
+        self.version = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __contains__(self, profile_id: Any) -> bool:
+        return profile_id in self.documents
+
+    def add(self, profile_data: Dict[str, Any]) -> bool:
+        """
+        Index a profile (insert or update). Returns False when the indexed
+        content did not change and nothing had to be done.
+        """
+        profile_id = profile_data.get('id')
+        if profile_id is None:
+            return False
+
+        tokenized = {}
+        if self.cache is not None:
+            signature, tokenized = self.cache.get(profile_data)
+        else:
+            signature = profile_signature(profile_data, list(self.fields))
+        with self._lock:
+            if self.signatures.get(profile_id) == signature:
+                self.documents.move_to_end(profile_id)
+                return False
+            self.version += 1
+            if profile_id in self.documents:
+                self._remove_postings(profile_id)
+
+            doc_fields = {}
+            doc_terms = set()
+            lengths = {}
+            for field_name in self.fields:
+                if field_name in tokenized:
+                    counts = Counter(tokenized[field_name][2])
+                else:
+                    counts = Counter(tokenize_text(extract_field_text(profile_data, field_name)))
+                doc_fields[field_name] = counts
+                field_postings = self.postings[field_name]
+                for token, count in counts.items():
+                    field_postings.setdefault(token, {})[profile_id] = count
+                    if token not in self.vocabulary:
+                        self.trigrams.add(token)
+                    self.vocabulary[token] = self.vocabulary.get(token, 0) + 1
+                doc_terms.update(counts)
+                lengths[field_name] = sum(counts.values())
+                self.length_totals[field_name] += lengths[field_name]
+
+            for token in doc_terms:
+                self.doc_freq[token] = self.doc_freq.get(token, 0) + 1
+            self.documents[profile_id] = doc_fields
+            self.lengths[profile_id] = lengths
+            self.signatures[profile_id] = signature
+            if self.max_profiles is not None:
+                while len(self.documents) > self.max_profiles:
+                    self._remove_postings(next(iter(self.documents)))
+                    self.evictions += 1
+            return True
+
+    # Updates are plain re-adds: old postings are dropped first
+    update = add
+
+    def remove(self, profile_id: Any) -> bool:
+        """
+        Drop a profile from the index. Returns False if it was not indexed.
+        """
+        with self._lock:
+            if profile_id not in self.documents:
+                return False
+            self.version += 1
+            self._remove_postings(profile_id)
+            return True
+
+    def _remove_postings(self, profile_id: Any) -> None:
+        doc_fields = self.documents.pop(profile_id)
+        self.signatures.pop(profile_id, None)
+        for field_name, length in self.lengths.pop(profile_id, {}).items():
+            self.length_totals[field_name] -= length
+        doc_terms = set()
+        for counts in doc_fields.values():
+            doc_terms.update(counts)
+        for token in doc_terms:
+            remaining = self.doc_freq.get(token, 0) - 1
+            if remaining > 0:
+                self.doc_freq[token] = remaining
+            else:
+                self.doc_freq.pop(token, None)
+        for field_name, counts in doc_fields.items():
+            field_postings = self.postings[field_name]
+            for token in counts:
+                docs = field_postings.get(token)
+                if docs is not None:
+                    docs.pop(profile_id, None)
+                    if not docs:
+                        del field_postings[token]
+                remaining = self.vocabulary.get(token, 0) - 1
+                if remaining > 0:
+                    self.vocabulary[token] = remaining
+                else:
+                    self.vocabulary.pop(token, None)
+                    self.trigrams.remove(token)
+
+    def locked(self):
+        """
+        Context manager holding the index lock, for readers walking postings directly
+        """
+        return self._lock
+
+    def expand(self, query_token: str) -> Set[str]:
+        """
+        Vocabulary terms containing the query token (same substring
+        semantics as analyze_field_match)
+        """
+        with self._lock:
+            return self.trigrams.search(query_token)
+
+    def expand_query(self, query_tokens: List[str]) -> Dict[str, Set[str]]:
+        """
+        Map every vocabulary term hit by the query to the query tokens it satisfies
+        """
+        term_hits: Dict[str, Set[str]] = {}
+        with self._lock:
+            for query_token in dict.fromkeys(query_tokens):
+                for term in self.trigrams.search(query_token):
+                    term_hits.setdefault(term, set()).add(query_token)
+        return term_hits
+
+    def candidates(self, query_tokens: List[str], profile_ids: Optional[Set[Any]] = None) -> Set[Any]:
+        """
+        Ids of indexed profiles sharing at least one (expanded) token with the query
+        """
+        term_hits = self.expand_query(query_tokens)
+        found: Set[Any] = set()
+        with self._lock:
+            for field_postings in self.postings.values():
+                for term in term_hits:
+                    docs = field_postings.get(term)
+                    if docs:
+                        found.update(docs)
+        if profile_ids is not None:
+            found &= profile_ids
+        return found
+
+    def scope_stats(self, profile_ids: Optional[Set[Any]] = None) -> Tuple[int, Dict[str, float]]:
+        """
+        (profile count, average length per field) over the indexed profiles in
+        `profile_ids` (every indexed profile when None)
+        """
+        with self._lock:
+            if profile_ids is None:
+                count = len(self.documents)
+                totals = dict(self.length_totals)
+            else:
+                count = 0
+                totals = {field_name: 0 for field_name in self.fields}
+                for profile_id in profile_ids:
+                    lengths = self.lengths.get(profile_id)
+                    if lengths is None:
+                        continue
+                    count += 1
+                    for field_name, length in lengths.items():
+                        totals[field_name] += length
+        return count, {field_name: (totals[field_name] / count if count else 0.0) for field_name in self.fields}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'profiles': len(self.documents),
+                'max_profiles': self.max_profiles,
+                'terms': len(self.vocabulary),
+                'evictions': self.evictions
+            }
+
+    def avg_field_length(self, field_name: str) -> float:
+        with self._lock:
+            if not self.documents:
+                return 0.0
+            return self.length_totals.get(field_name, 0) / len(self.documents)
+
+    def field_length(self, profile_id: Any, field_name: str) -> int:
+        with self._lock:
+            return self.lengths.get(profile_id, {}).get(field_name, 0)
+
+    def document_frequency(self, query_token: str) -> int:
+        """
+        Number of indexed profiles containing any term that contains the query token
+        """
+        with self._lock:
+            terms = self.trigrams.search(query_token)
+            if len(terms) == 1:
+                return self.doc_freq.get(next(iter(terms)), 0)
+            docs = set()
+            for term in terms:
+                for field_postings in self.postings.values():
+                    docs.update(field_postings.get(term, ()))
+            return len(docs)
+
+    def term_postings(self, query_token: str, profile_ids: Optional[Set[Any]] = None) -> Dict[Any, Dict[str, int]]:
+        """
+        profile_id -> {field: term count} for every vocabulary term containing
+        the query token, summed per field
+        """
+        found: Dict[Any, Dict[str, int]] = {}
+        with self._lock:
+            for term in self.trigrams.search(query_token):
+                for field_name, field_postings in self.postings.items():
+                    for profile_id, count in field_postings.get(term, {}).items():
+                        if profile_ids is not None and profile_id not in profile_ids:
+                            continue
+                        fields = found.setdefault(profile_id, {})
+                        fields[field_name] = fields.get(field_name, 0) + count
+        return found
+
+    def field_terms(self, profile_id: Any, field_name: str) -> Counter:
+        """
+        Term counts of one field of an indexed profile
+        """
+        with self._lock:
+            doc_fields = self.documents.get(profile_id)
+            if not doc_fields:
+                return Counter()
+            return doc_fields.get(field_name, Counter())
+
+
+# Shared index kept current by the RAG views as they scan Supabase; sized by
+# AI_RAG_INDEX_MAX_PROFILES, which should exceed the largest single scan
+profile_index = ProfileIndex(cache=tokenized_profile_cache,
+                             max_profiles=int(os.environ.get('AI_RAG_INDEX_MAX_PROFILES', '50000')))
@@ -0,0 +1,243 @@
+"""
+Multi-process scoring for large RAG pages
+Shards a fetched batch across a persistent process pool; every worker returns
+its own top-k (and summary accumulator) and the request thread merges them.
+Query tokens reach the workers once, through shared memory the pool
+initializer hands them, so shard tasks only carry rows and a slot reference.
+"""
+
+import os
+import json
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional, Tuple
+
+from .rag_analyzer import (
+    QueryMatcher,
+    TokenizedProfileCache,
+    TopKCollector,
+    AnalysisSummaryAccumulator,
+    score_profile_match
+)
+
+# 0/1 disables the pool; pages smaller than the threshold are scored in-process
+PARALLEL_WORKERS = int(os.environ.get('AI_RAG_WORKERS', '0'))
+PARALLEL_MIN_ROWS = int(os.environ.get('AI_RAG_PARALLEL_MIN_ROWS', '500'))
+PARALLEL_START_METHOD = os.environ.get('AI_RAG_MP_START', 'spawn')
+# Shared-memory slots for the token lists of queries being scored
+QUERY_SLOTS = int(os.environ.get('AI_RAG_QUERY_SLOTS', '32'))
+QUERY_SLOT_BYTES = 4096
+
+_executor = None
+_query_slots = None
+_executor_lock = threading.Lock()
+_stats = {'pages': 0, 'rows': 0, 'fallbacks': 0, 'restarts': 0}
+
+
+# ---- worker side -----------------------------------------------------------
+
+# Workers live across requests: compiled matchers and tokenized profiles are reused
+_worker_matchers: 'OrderedDict[Tuple[str, ...], QueryMatcher]' = OrderedDict()
+_worker_cache = None
+# (data, lengths) shared arrays of the query slots, set by the pool initializer
+_worker_slots = None
+_worker_queries: 'OrderedDict[Tuple[int, int], Tuple[str, ...]]' = OrderedDict()
+
+
+def _init_worker(data: Any, lengths: Any) -> None:
+    global _worker_slots
+    _worker_slots = (data, lengths)
+
+
+def _worker_query(slot_ref: Tuple[int, int]) -> Tuple[str, ...]:
+    """
+    Token tuple published in a query slot; (slot, generation) names one write,
+    so it is read from shared memory once per worker
+    """
+    query_tokens = _worker_queries.get(slot_ref)
+    if query_tokens is None:
+        data, lengths = _worker_slots
+        start = slot_ref[0] * QUERY_SLOT_BYTES
+        query_tokens = tuple(json.loads(data[start:start + lengths[slot_ref[0]]].decode('utf-8')))
+        _worker_queries[slot_ref] = query_tokens
+        while len(_worker_queries) > 2 * QUERY_SLOTS:
+            _worker_queries.popitem(last=False)
+    return query_tokens
+
+
+def _worker_matcher(query_tokens: Tuple[str, ...]) -> QueryMatcher:
+    matcher = _worker_matchers.get(query_tokens)
+    if matcher is None:
+        matcher = _worker_matchers[query_tokens] = QueryMatcher(list(query_tokens))
+        while len(_worker_matchers) > 32:
+            _worker_matchers.popitem(last=False)
+    else:
+        _worker_matchers.move_to_end(query_tokens)
+    return matcher
+
+
+def _score_shard(slot_ref: Optional[Tuple[int, int]], query_tokens: Optional[Tuple[str, ...]], rows: List[Dict[str, Any]],
+                 k: int, keep_all: bool, with_summary: bool) -> Tuple[TopKCollector, Optional[AnalysisSummaryAccumulator]]:
+    """
+    Score one shard of the query in `slot_ref` (or `query_tokens` when it could
+    not be published); top-k payloads are positions in `rows` so only ids and
+    scores travel back to the parent
+    """
+    global _worker_cache
+    if _worker_cache is None:
+        _worker_cache = TokenizedProfileCache(int(os.environ.get('AI_RAG_TOKEN_CACHE_SIZE', '5000')))
+    if slot_ref is not None:
+        query_tokens = _worker_query(slot_ref)
+    matcher = _worker_matcher(query_tokens)
+    query_analysis = {'tokens': list(query_tokens)}
+    top_k = TopKCollector(k)
+    summary_acc = AnalysisSummaryAccumulator() if with_summary else None
+    for position, row in enumerate(rows):
+        match_score = score_profile_match(row, query_analysis, matcher, _worker_cache)
+        if match_score['total_score'] > 0 or keep_all:
+            if summary_acc is not None:
+                summary_acc.add(match_score)
+            top_k.add(match_score['total_score'], row.get('id'), position)
+    return top_k, summary_acc
+
+
+# ---- request side ----------------------------------------------------------
+
+class _QuerySlots:
+    """
+    Fixed table of shared-memory slots holding JSON token lists. A slot is
+    pinned while a batch of its query is being scored and is only rewritten
+    (least recently used first) once unpinned.
+    """
+
+    def __init__(self, context: Any):
+        self.data = context.RawArray('c', QUERY_SLOTS * QUERY_SLOT_BYTES)
+        self.lengths = context.RawArray('i', QUERY_SLOTS)
+        self.generations = [0] * QUERY_SLOTS
+        self.pinned = [0] * QUERY_SLOTS
+        self.slots: 'OrderedDict[Tuple[str, ...], int]' = OrderedDict()
+        self.free = list(range(QUERY_SLOTS))
+        self._lock = threading.Lock()
+
+    def acquire(self, query_tokens: Tuple[str, ...]) -> Optional[Tuple[int, int]]:
+        """
+        Pinned (slot, generation) holding the query, or None when it is too
+        long or every slot is pinned
+        """
+        payload = json.dumps(query_tokens).encode('utf-8')
+        if len(payload) > QUERY_SLOT_BYTES:
+            return None
+        with self._lock:
+            slot = self.slots.get(query_tokens)
+            if slot is None:
+                if self.free:
+                    slot = self.free.pop()
+                else:
+                    evicted = next((tokens for tokens, used in self.slots.items() if not self.pinned[used]), None)
+                    if evicted is None:
+                        return None
+                    slot = self.slots.pop(evicted)
+                start = slot * QUERY_SLOT_BYTES
+                self.data[start:start + len(payload)] = payload
+                self.lengths[slot] = len(payload)
+                self.generations[slot] += 1
+                self.slots[query_tokens] = slot
+            else:
+                self.slots.move_to_end(query_tokens)
+            self.pinned[slot] += 1
+            return slot, self.generations[slot]
+
+    def release(self, slot_ref: Tuple[int, int]) -> None:
+        with self._lock:
+            self.pinned[slot_ref[0]] -= 1
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Shared process pool, created on first use; None when parallel scoring is off
+    """
+    global _executor, _query_slots
+    if PARALLEL_WORKERS <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            context = multiprocessing.get_context(PARALLEL_START_METHOD)
+            _query_slots = _QuerySlots(context)
+            _executor = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS, mp_context=context, initializer=_init_worker,
+                                            initargs=(_query_slots.data, _query_slots.lengths))
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor, _query_slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+            _query_slots = None
+            _stats['restarts'] += 1
+
+
+def parallel_batch_size() -> int:
+    """
+    Rows worth sending to the pool at once; 0 when parallel scoring is off.
+    Callers fed small pages accumulate rows up to this size.
+    """
+    return PARALLEL_MIN_ROWS if PARALLEL_WORKERS > 1 else 0
+
+
+def score_rows_parallel(rows: List[Dict[str, Any]], query_analysis: Dict[str, Any], top_k: TopKCollector,
+                        summary_acc: Optional[AnalysisSummaryAccumulator] = None, keep_all: bool = False) -> bool:
+    """
+    Score `rows` on the process pool and merge the results into `top_k` (payload:
+    the row) and `summary_acc`. Returns False, without touching either, when the
+    batch should be scored in-process instead (pool off, small batch, pool failure).
+    """
+    executor = get_executor()
+    if executor is None or len(rows) < PARALLEL_MIN_ROWS:
+        return False
+
+    query_tokens = tuple(query_analysis['tokens'])
+    slots = _query_slots
+    slot_ref = slots.acquire(query_tokens) if slots is not None else None
+    shard_size = -(-len(rows) // PARALLEL_WORKERS)
+    shards = [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+    try:
+        futures = [
+            executor.submit(_score_shard, slot_ref, None if slot_ref else query_tokens, shard, top_k.k, keep_all,
+                            summary_acc is not None)
+            for shard in shards
+        ]
+        results = [future.result() for future in futures]
+    except BrokenProcessPool:
+        _reset_executor()
+        _stats['fallbacks'] += 1
+        return False
+    except Exception:
+        _stats['fallbacks'] += 1
+        return False
+    finally:
+        if slot_ref is not None:
+            slots.release(slot_ref)
+
+    for shard, (shard_top_k, shard_summary) in zip(shards, results):
+        for entry in shard_top_k.heap:
+            entry.payload = shard[entry.payload]
+        top_k.merge(shard_top_k)
+        if summary_acc is not None and shard_summary is not None:
+            summary_acc.merge(shard_summary)
+    _stats['pages'] += 1
+    _stats['rows'] += len(rows)
+    return True
+
+
+def parallel_stats() -> Dict[str, Any]:
+    return {
+        'workers': PARALLEL_WORKERS if PARALLEL_WORKERS > 1 else 0,
+        'min_rows': PARALLEL_MIN_ROWS,
+        'running': _executor is not None,
+        **_stats
+    }
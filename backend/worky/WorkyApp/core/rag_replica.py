@@ -0,0 +1,336 @@
+"""
+Local SQLite replica of the Supabase `profile` table
+One sync process keeps it current: delta syncs fetch rows beyond the stored
+id watermark, periodic full resyncs pick up edits and deletions. That is
+either the background worker of the process holding the replica's sync lock
+(every other worker process only reads) or `manage.py rag_replica_resync
+--loop`. The RAG views scan the replica instead of the network once it is ready.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from .http_client import load_env
+from .rag_fetch import fetch_pages, PAGE_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+REPLICA_ENABLED = os.environ.get('AI_RAG_REPLICA', 'false').lower() == 'true'
+REPLICA_PATH = os.environ.get('AI_RAG_REPLICA_PATH') or str(Path(__file__).resolve().parent.parent / 'rag_replica.sqlite3')
+REPLICA_SYNC_SEC = float(os.environ.get('AI_RAG_REPLICA_SYNC_SEC', '30'))
+REPLICA_FULL_SYNC_SEC = float(os.environ.get('AI_RAG_REPLICA_FULL_SYNC_SEC', '3600'))
+# worker: the process elected by the sync lock syncs in the background;
+# command: no in-process sync, `manage.py rag_replica_resync --loop` runs it
+REPLICA_SYNC_MODE = os.environ.get('AI_RAG_REPLICA_SYNC', 'worker')
+# status()/ready() run on every RAG request; other processes' syncs show up
+# after at most this long
+REPLICA_STATUS_TTL_SEC = float(os.environ.get('AI_RAG_REPLICA_STATUS_TTL_SEC', '1'))
+
+# Columns filtered on by the views; everything else lives in the JSON payload
+INDEXED_COLUMNS = ('status', 'vacant_id')
+PROFILE_SELECT = 'id,status,vacant_id,created_at,personal_information,experience,education,skills,projects'
+
+
+class SyncLock:
+    """
+    Non-blocking inter-process lock on `<replica>.sync.lock` electing the one
+    process that syncs the replica. Held until release() or process exit, so
+    another process takes over when the syncing one dies.
+    """
+
+    def __init__(self, replica_path: str):
+        self.path = replica_path + '.sync.lock'
+        self._handle = None
+
+    @property
+    def held(self) -> bool:
+        return self._handle is not None
+
+    def acquire(self) -> bool:
+        if self._handle is not None:
+            return True
+        handle = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return False
+        self._handle = handle
+        return True
+
+    def release(self) -> None:
+        handle, self._handle = self._handle, None
+        if handle is not None:
+            # Closing the file drops the lock
+            handle.close()
+
+
+class ProfileReplica:
+    """
+    SQLite copy of the profile rows. Readers and the sync worker use their own
+    connections (WAL mode), so scans never wait for a sync to finish.
+    """
+
+    def __init__(self, path: str = REPLICA_PATH):
+        self.path = path
+        self._sync_lock = threading.Lock()
+        self.sync_lock = SyncLock(path)
+        self.last_error: Optional[str] = None
+        # (meta, monotonic read time), dropped by every sync of this process
+        self._meta_cache: Optional[Tuple[Dict[str, str], float]] = None
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS profile ('
+                ' id INTEGER PRIMARY KEY, status TEXT, vacant_id TEXT, created_at TEXT, data TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS profile_status ON profile (status, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS profile_vacant ON profile (vacant_id, id)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # A pages() scan may be resumed from another thread (async views read it
+        # through an executor); each connection still has a single user at a time
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+
+    # ---- metadata ----------------------------------------------------------
+
+    def _meta(self, conn: sqlite3.Connection) -> Dict[str, str]:
+        return dict(conn.execute('SELECT key, value FROM meta').fetchall())
+
+    def _set_meta(self, conn: sqlite3.Connection, **values: Any) -> None:
+        conn.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def _cached_meta(self) -> Dict[str, str]:
+        cached = self._meta_cache
+        if cached is not None and time.monotonic() - cached[1] <= REPLICA_STATUS_TTL_SEC:
+            return cached[0]
+        with closing(self._connect()) as conn:
+            meta = self._meta(conn)
+            if 'rows' not in meta:
+                # Replica synced before the row count was kept in meta
+                meta['rows'] = str(conn.execute('SELECT COUNT(*) FROM profile').fetchone()[0])
+        self._meta_cache = (meta, time.monotonic())
+        return meta
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Replica freshness, reported in the RAG responses. Read from the meta
+        table (row count as of the last completed sync), at most once per
+        AI_RAG_REPLICA_STATUS_TTL_SEC.
+        """
+        meta = self._cached_meta()
+        synced_at = float(meta['synced_at']) if 'synced_at' in meta else None
+        return {
+            'rows': int(meta['rows']),
+            'watermark_id': int(meta['watermark_id']) if meta.get('watermark_id') else None,
+            'watermark_created_at': meta.get('watermark_created_at') or None,
+            'synced_at': synced_at,
+            'staleness_sec': round(time.time() - synced_at, 1) if synced_at else None,
+            'full_synced_at': float(meta['full_synced_at']) if 'full_synced_at' in meta else None,
+            'sync_leader': self.sync_lock.held,
+            'last_error': self.last_error
+        }
+
+    def ready(self) -> bool:
+        """
+        True once a full sync has completed
+        """
+        return 'full_synced_at' in self._cached_meta()
+
+    # ---- sync --------------------------------------------------------------
+
+    def _upsert(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]]) -> None:
+        conn.executemany(
+            'INSERT INTO profile (id, status, vacant_id, created_at, data) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET status = excluded.status, vacant_id = excluded.vacant_id, '
+            'created_at = excluded.created_at, data = excluded.data',
+            [
+                (row['id'], _text(row.get('status')), _text(row.get('vacant_id')), _text(row.get('created_at')),
+                 json.dumps(row, ensure_ascii=False))
+                for row in rows if isinstance(row.get('id'), int)
+            ]
+        )
+
+    def sync(self, base: str, headers: Dict[str, str], full: bool = False) -> int:
+        """
+        Pull rows from Supabase: everything beyond the id watermark, or with
+        full=True the whole table (rows gone upstream are dropped). Returns
+        the number of rows fetched.
+        """
+        url = base.rstrip('/') + f'/rest/v1/profile?select={PROFILE_SELECT}'
+        with self._sync_lock:
+            with closing(self._connect()) as conn:
+                meta = self._meta(conn)
+            watermark = None if full or not meta.get('watermark_id') else int(meta['watermark_id'])
+            fetched = 0
+            max_created = meta.get('watermark_created_at') or ''
+            try:
+                conn = self._connect()
+                try:
+                    if full:
+                        conn.execute('CREATE TEMP TABLE seen (id INTEGER PRIMARY KEY)')
+                    for rows in fetch_pages(url, headers, after_id=watermark):
+                        self._upsert(conn, rows)
+                        ids = [row['id'] for row in rows if isinstance(row.get('id'), int)]
+                        if full:
+                            conn.executemany('INSERT OR IGNORE INTO seen (id) VALUES (?)', [(i,) for i in ids])
+                        if ids:
+                            watermark = max(ids) if watermark is None else max(watermark, max(ids))
+                        for row in rows:
+                            created = _text(row.get('created_at')) or ''
+                            if created > max_created:
+                                max_created = created
+                        fetched += len(rows)
+                        conn.commit()
+                    now = time.time()
+                    if full:
+                        conn.execute('DELETE FROM profile WHERE id NOT IN (SELECT id FROM seen)')
+                        self._set_meta(conn, full_synced_at=now)
+                    rows = conn.execute('SELECT COUNT(*) FROM profile').fetchone()[0]
+                    self._set_meta(conn, synced_at=now, watermark_id=watermark if watermark is not None else '',
+                                   watermark_created_at=max_created, rows=rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                self._meta_cache = None
+            return fetched
+
+    # ---- reads -------------------------------------------------------------
+
+    def _where(self, filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        clauses, args = [], []
+        for column, value in (filters or {}).items():
+            if column not in INDEXED_COLUMNS:
+                raise ValueError(f'cannot filter the replica on {column!r}')
+            if isinstance(value, (list, tuple, set)):
+                values = [_text(v) for v in value]
+                clauses.append(f'{column} IN ({",".join("?" * len(values))})')
+                args.extend(values)
+            else:
+                clauses.append(f'{column} = ?')
+                args.append(_text(value))
+        return ''.join(f' AND {clause}' for clause in clauses), args
+
+    def version(self, filters: Optional[Dict[str, Any]] = None) -> Tuple[int, Optional[int]]:
+        """
+        (row count, max id) of the rows matching `filters`
+        """
+        where, args = self._where(filters)
+        with closing(self._connect()) as conn:
+            count, max_id = conn.execute(f'SELECT COUNT(*), MAX(id) FROM profile WHERE 1 = 1{where}', args).fetchone()
+        return count, max_id
+
+    def pages(self, filters: Optional[Dict[str, Any]] = None, page_size: int = PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Replica rows matching `filters` ({column: value or list of values}, on
+        status/vacant_id), in id order, in pages like fetch_pages
+        """
+        where, args = self._where(filters)
+        last_id = -1
+        conn = self._connect()
+        try:
+            while True:
+                cursor = conn.execute(
+                    f'SELECT id, data FROM profile WHERE id > ?{where} ORDER BY id LIMIT ?',
+                    [last_id] + args + [page_size]
+                )
+                fetched = cursor.fetchall()
+                if not fetched:
+                    return
+                yield [json.loads(data) for _, data in fetched]
+                last_id = fetched[-1][0]
+                if len(fetched) < page_size:
+                    return
+        finally:
+            conn.close()
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def supabase_source():
+    load_env()
+    base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+    key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+    if not base or not key:
+        return None, None
+    return base, {'apikey': key, 'Authorization': 'Bearer ' + key}
+
+
+_replica = None
+_replica_lock = threading.Lock()
+_worker = None
+
+
+def get_replica(start_worker: bool = True) -> Optional[ProfileReplica]:
+    """
+    Shared replica when AI_RAG_REPLICA is on (None otherwise); the first call
+    also starts the background sync worker (AI_RAG_REPLICA_SYNC=worker)
+    """
+    global _replica
+    if not REPLICA_ENABLED:
+        return None
+    with _replica_lock:
+        if _replica is None:
+            _replica = ProfileReplica()
+    if start_worker and REPLICA_SYNC_MODE == 'worker':
+        start_sync_worker(_replica)
+    return _replica
+
+
+def start_sync_worker(replica: ProfileReplica) -> None:
+    global _worker
+    with _replica_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_sync_loop, args=(replica,), name='rag-replica-sync', daemon=True)
+        _worker.start()
+
+
+def sync_turn(replica: ProfileReplica) -> bool:
+    """
+    One round of the sync schedule: a full resync when the last one is older
+    than AI_RAG_REPLICA_FULL_SYNC_SEC, else a delta. Only the process holding
+    the sync lock syncs; returns False in every other one.
+    """
+    if not replica.sync_lock.acquire():
+        return False
+    base, headers = supabase_source()
+    if base:
+        status = replica.status()
+        full = status['full_synced_at'] is None or time.time() - status['full_synced_at'] > REPLICA_FULL_SYNC_SEC
+        try:
+            replica.sync(base, headers, full=full)
+        except Exception:
+            pass  # recorded in replica.last_error, retried next round
+    return True
+
+
+def _sync_loop(replica: ProfileReplica) -> None:
+    while True:
+        sync_turn(replica)
+        time.sleep(REPLICA_SYNC_SEC)
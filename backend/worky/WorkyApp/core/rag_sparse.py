@@ -0,0 +1,206 @@
+"""
+Vectorized bulk scoring for RAG ranking (optional NumPy/SciPy engine)
+Keeps the indexed corpus as sparse term-by-profile matrices and computes the
+classic analyzer score for every profile with sparse matrix products
+"""
+
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from .rag_analyzer import FIELD_WEIGHTS
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency, views fall back to the pure Python path
+    np = None
+    sparse = None
+
+SPARSE_AVAILABLE = np is not None and sparse is not None
+
+
+class SparseScorer:
+    """
+    Classic-score engine over a ProfileIndex.
+
+    Per field the corpus is a CSR float32 matrix (terms x profiles). A query is
+    compiled into a sparse (query tokens x terms) expansion matrix, so one sparse
+    product per field yields which query tokens every profile matches. Scores are
+    then combined with the analyzer's formula (coverage * weight * matched) and
+    the top-k is picked with argpartition.
+
+    Matrices follow the index version incrementally: each profile's (term id,
+    count) arrays are kept per field and only profiles whose signature changed
+    are re-read, the matrices are then reassembled with vectorized concatenation.
+    Term ids are append-only; once most of them are dead the next refresh starts
+    over from scratch.
+    """
+
+    def __init__(self, index: Any):
+        if not SPARSE_AVAILABLE:
+            raise RuntimeError('numpy and scipy are required for the sparse scorer')
+        self.index = index
+        self.version = None
+        self.doc_ids: List[Any] = []
+        self.doc_positions: Dict[Any, int] = {}
+        self.term_ids: Dict[str, int] = {}
+        self.matrices: Dict[str, Any] = {}
+        self.builds = {'full': 0, 'incremental': 0}
+        # profile_id -> (signature, {field: (term ids, counts)})
+        self._entries: Dict[Any, Tuple[str, Dict[str, Tuple[Any, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """
+        Bring the matrices up to the index version. Returns True if they were
+        rebuilt; concurrent callers wait for a single rebuild.
+        """
+        with self._lock:
+            if self.version == self.index.version and self.matrices:
+                return False
+            full = not self.matrices or len(self.term_ids) > 2 * max(len(self.index.vocabulary), 1024)
+            if full:
+                self.term_ids = {}
+                self._entries = {}
+            term_ids = dict(self.term_ids)
+            entries = {}
+            with self.index.locked():
+                version = self.index.version
+                doc_ids = list(self.index.documents)
+                for profile_id in doc_ids:
+                    signature = self.index.signatures.get(profile_id)
+                    cached = self._entries.get(profile_id)
+                    if cached is not None and cached[0] == signature:
+                        entries[profile_id] = cached
+                        continue
+                    fields = {}
+                    for field_name, counts in self.index.documents[profile_id].items():
+                        if field_name not in FIELD_WEIGHTS or not counts:
+                            continue
+                        ids = [term_ids.setdefault(term, len(term_ids)) for term in counts]
+                        fields[field_name] = (np.asarray(ids, dtype=np.int32), np.asarray(list(counts.values()), dtype=np.float32))
+                    entries[profile_id] = (signature, fields)
+
+            doc_positions = {profile_id: i for i, profile_id in enumerate(doc_ids)}
+            matrices = {}
+            for field_name in FIELD_WEIGHTS.keys():
+                rows, cols, data = [], [], []
+                for position, profile_id in enumerate(doc_ids):
+                    arrays = entries[profile_id][1].get(field_name)
+                    if arrays is None:
+                        continue
+                    rows.append(arrays[0])
+                    cols.append(np.full(arrays[0].shape[0], position, dtype=np.int32))
+                    data.append(arrays[1])
+                if rows:
+                    coordinates = (np.concatenate(rows), np.concatenate(cols))
+                    values = np.concatenate(data)
+                else:
+                    coordinates = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+                    values = np.zeros(0, dtype=np.float32)
+                matrices[field_name] = sparse.csr_matrix((values, coordinates), shape=(len(term_ids), len(doc_ids)))
+
+            self.builds['full' if full else 'incremental'] += 1
+            self.version = version
+            self.doc_ids = doc_ids
+            self.doc_positions = doc_positions
+            self.term_ids = term_ids
+            self.matrices = matrices
+            self._entries = entries
+            return True
+
+    def snapshot(self) -> Tuple[List[Any], Dict[Any, int], Dict[str, int], Dict[str, Any]]:
+        """
+        Current (doc_ids, doc_positions, term_ids, matrices), read together
+        """
+        self.refresh()
+        with self._lock:
+            return self.doc_ids, self.doc_positions, self.term_ids, self.matrices
+
+    def score_all(self, query_analysis: Dict[str, Any]) -> Any:
+        """
+        Classic total_score for every indexed profile (dense float64 vector
+        aligned with self.doc_ids)
+        """
+        return self._score_all(query_analysis, self.snapshot())
+
+    def _score_all(self, query_analysis: Dict[str, Any], snapshot: Tuple[List[Any], Dict[Any, int], Dict[str, int], Dict[str, Any]]) -> Any:
+        doc_ids, _, term_ids, matrices = snapshot
+        query_tokens = query_analysis['tokens']
+        scores = np.zeros(len(doc_ids), dtype=np.float64)
+        if not query_tokens or not doc_ids:
+            return scores
+
+        unique_tokens = list(dict.fromkeys(query_tokens))
+        token_ids = {token: i for i, token in enumerate(unique_tokens)}
+        # Duplicate query tokens count once per occurrence, as in analyze_field_match
+        multiplicity = np.zeros(len(unique_tokens), dtype=np.float64)
+        for token in query_tokens:
+            multiplicity[token_ids[token]] += 1
+
+        rows, cols = [], []
+        for term, hits in self.index.expand_query(unique_tokens).items():
+            term_id = term_ids.get(term)
+            if term_id is None:
+                continue
+            for token in hits:
+                rows.append(token_ids[token])
+                cols.append(term_id)
+        if not rows:
+            return scores
+        expansion = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(unique_tokens), len(term_ids))
+        )
+
+        query_count = len(query_tokens)
+        for field_name, weight in FIELD_WEIGHTS.items():
+            matched = expansion @ matrices[field_name]
+            if not matched.nnz:
+                continue
+            matched.data[:] = 1.0
+            matched_count = np.asarray(matched.T @ multiplicity).ravel()
+            scores += (matched_count / query_count) * weight * matched_count
+        return scores
+
+    def top_k(self, query_analysis: Dict[str, Any], limit: int, profile_ids: Optional[set] = None) -> Tuple[List[Tuple[Any, float]], Dict[str, Any]]:
+        """
+        Top-`limit` (id, score) pairs, ordered like the views: score desc, then id
+        """
+        snapshot = self.snapshot()
+        doc_ids, doc_positions = snapshot[0], snapshot[1]
+        scores = self._score_all(query_analysis, snapshot)
+        stats = {'scorer': 'sparse', 'candidates': 0, 'scored': int(scores.shape[0])}
+        if profile_ids is not None:
+            mask = np.zeros(scores.shape[0], dtype=bool)
+            positions = [doc_positions[profile_id] for profile_id in profile_ids if profile_id in doc_positions]
+            mask[positions] = True
+            scores = np.where(mask, scores, 0.0)
+        positive = int(np.count_nonzero(scores > 0))
+        stats['candidates'] = positive
+        k = min(limit, positive)
+        if k <= 0:
+            return [], stats
+
+        # Everything tied with the k-th score is kept so the id tie-break stays exact
+        kth = np.partition(scores, scores.shape[0] - k)[scores.shape[0] - k]
+        selected = np.flatnonzero(scores >= kth)
+        ranked = sorted(((doc_ids[i], float(scores[i])) for i in selected), key=lambda x: (-x[1], x[0] or 0))
+        return ranked[:k], stats
+
+
+_sparse_scorer = None
+_sparse_scorer_lock = threading.Lock()
+
+
+def get_sparse_scorer(index: Any) -> Optional[SparseScorer]:
+    """
+    Shared SparseScorer for the given index, or None without numpy/scipy
+    """
+    global _sparse_scorer
+    if not SPARSE_AVAILABLE:
+        return None
+    with _sparse_scorer_lock:
+        if _sparse_scorer is None or _sparse_scorer.index is not index:
+            _sparse_scorer = SparseScorer(index)
+        return _sparse_scorer
@@ -0,0 +1,195 @@
+"""
+Streaming responses for the RAG views
+A view describes its work as a sequence of (event, data) pairs: `progress`
+while the profiles are scanned, `result` with the ranked response, then
+`analysis` with the summary. The same events are either streamed as NDJSON /
+Server-Sent Events or collected into the usual single JSON response.
+"""
+
+import json
+from typing import Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+STREAM_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+Event = Tuple[str, Any]
+
+
+class StreamAbort(Exception):
+    """
+    Raised by an event generator to end the request with an error response
+    (an `error` event once streaming has started)
+    """
+
+    def __init__(self, data: Dict[str, Any], status: int):
+        super().__init__(data.get('error'))
+        self.data = data
+        self.status = status
+
+
+def resolve_stream(request: Any, value: Any = None) -> Optional[str]:
+    """
+    Streaming format asked for with ?stream=ndjson|sse (or the body's
+    `stream`) or an Accept header; None for a regular JSON response
+    """
+    value = str(value or '').strip().lower()
+    if value in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if value in ('sse', 'event-stream', 'text/event-stream'):
+        return 'sse'
+    if value:
+        return None
+    accept = request.META.get('HTTP_ACCEPT', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+
+def encode_event(fmt: str, event: str, data: Any) -> bytes:
+    if fmt == 'sse':
+        payload = json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+        return f'event: {event}\ndata: {payload}\n\n'.encode('utf-8')
+    return (json.dumps({'event': event, 'data': data}, cls=JSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def progress_payload(scanned: int, matched: int, top_k: Any = None) -> Dict[str, Any]:
+    """
+    Progress event: rows scanned so far, rows matched and, when the ranking
+    is built while scanning, the current best-k (ids and scores only)
+    """
+    payload = {'scanned': scanned, 'matched': matched}
+    if top_k is not None:
+        payload['top'] = [{'id': str(item_id), 'score': score} for item_id, score, _ in top_k.items()]
+    return payload
+
+
+def result_events(data: Dict[str, Any]) -> Iterator[Event]:
+    """
+    `result` and `analysis` events of an already complete response
+    """
+    result = {key: value for key, value in data.items() if key != 'analysis'}
+    yield 'result', result
+    if data.get('analysis') is not None:
+        yield 'analysis', data['analysis']
+
+
+def stream_response(events: Iterator[Event], fmt: str) -> StreamingHttpResponse:
+    def body():
+        try:
+            for event, data in events:
+                yield encode_event(fmt, event, data)
+        except StreamAbort as e:
+            yield encode_event(fmt, 'error', dict(e.data, status_code=e.status))
+        yield encode_event(fmt, 'done', {})
+
+    response = StreamingHttpResponse(body(), content_type=STREAM_CONTENT_TYPES[fmt] + '; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def collect_response(events: Iterator[Event]) -> Response:
+    """
+    Regular JSON response from the events: `result` with `analysis` merged in
+    """
+    data = {}
+    try:
+        for event, payload in events:
+            if event == 'result':
+                data = dict(payload)
+            elif event == 'analysis':
+                data['analysis'] = payload
+    except StreamAbort as e:
+        return Response(e.data, status=e.status)
+    return Response(data)
+
+
+def respond(events: Iterator[Event], fmt: Optional[str]):
+    return stream_response(events, fmt) if fmt else collect_response(events)
+
+
+# ---- async views (plain Django views, no DRF renderers) -----------------------
+
+def json_response(data: Any, status: int = 200) -> JsonResponse:
+    """
+    JsonResponse encoded like DRF's JSONRenderer (compact, unescaped unicode)
+    """
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def astream_response(events: AsyncIterator[Event], fmt: str) -> StreamingHttpResponse:
+    async def body():
+        try:
+            async for event, data in events:
+                yield encode_event(fmt, event, data)
+        except StreamAbort as e:
+            yield encode_event(fmt, 'error', dict(e.data, status_code=e.status))
+        yield encode_event(fmt, 'done', {})
+
+    response = StreamingHttpResponse(body(), content_type=STREAM_CONTENT_TYPES[fmt] + '; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def acollect_response(events: AsyncIterator[Event]) -> JsonResponse:
+    data = {}
+    try:
+        async for event, payload in events:
+            if event == 'result':
+                data = dict(payload)
+            elif event == 'analysis':
+                data['analysis'] = payload
+    except StreamAbort as e:
+        return json_response(e.data, e.status)
+    return json_response(data)
+
+
+async def arespond(events: AsyncIterator[Event], fmt: Optional[str]):
+    return astream_response(events, fmt) if fmt else await acollect_response(events)
+
+
+async def aresult_events(data: Dict[str, Any]) -> AsyncIterator[Event]:
+    for event in result_events(data):
+        yield event
+
+
+class _EventRenderer(BaseRenderer):
+    """
+    Renders the non-streamed responses (validation errors...) of a request
+    that asked for a stream as one event, instead of failing with 406
+    """
+    charset = 'utf-8'
+    stream_format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        event = 'error' if response is not None and response.status_code >= 400 else 'result'
+        return encode_event(self.stream_format, event, data)
+
+
+class EventStreamRenderer(_EventRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    stream_format = 'sse'
+
+
+class NDJSONRenderer(_EventRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    stream_format = 'ndjson'
+
+
+STREAM_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EventStreamRenderer, NDJSONRenderer]
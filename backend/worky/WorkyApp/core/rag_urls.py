@@ -1,14 +1,31 @@
+import os
+
 from django.urls import path
-from .views import SupabaseRagSearchView, SupabaseRagHealthView, SupabaseAskView, AIHealthView, AIAskView, ProfileAIAskView, RankingView
+from django.views.decorators.csrf import csrf_exempt
+from .views import SupabaseRagSearchView, SupabaseRagHealthView, SupabaseAskView, AIHealthView, AIAskView, ProfileAIAskView, RankingView, RankingBatchView
+
+rag_health_view = SupabaseRagHealthView.as_view()
+rag_ask_view = SupabaseAskView.as_view()
+profile_ask_view = ProfileAIAskView.as_view()
+ranking_view = RankingView.as_view()
+
+# Async versions for ASGI deployments (uvicorn WorkyApp.asgi:application)
+if os.environ.get('AI_ASYNC_VIEWS', 'false').lower() == 'true':
+    from .async_views import AsyncSupabaseRagHealthView, AsyncSupabaseAskView, AsyncProfileAIAskView, AsyncRankingView
+    rag_health_view = AsyncSupabaseRagHealthView.as_view()
+    rag_ask_view = AsyncSupabaseAskView.as_view()
+    profile_ask_view = csrf_exempt(AsyncProfileAIAskView.as_view())
+    ranking_view = csrf_exempt(AsyncRankingView.as_view())
 
 # URLs solo para funcionalidad RAG - no requieren base de datos
 urlpatterns = [
     path('rag/search/', SupabaseRagSearchView.as_view(), name='rag_search'),
-    path('rag/health/', SupabaseRagHealthView.as_view(), name='rag_health'),
-    path('rag/ask/', SupabaseAskView.as_view(), name='rag_ask'),
+    path('rag/health/', rag_health_view, name='rag_health'),
+    path('rag/ask/', rag_ask_view, name='rag_ask'),
     path('ai/health/', AIHealthView.as_view(), name='ai_health'),
     path('ai/ask/', AIAskView.as_view(), name='ai_ask'),
-    path('profile/ask/', ProfileAIAskView.as_view(), name='profile_ai_ask'),
-    path('profile/ask', ProfileAIAskView.as_view(), name='profile_ai_ask_no_slash'),
-    path('ranking/', RankingView.as_view(), name='ranking'),
-]
\ No newline at end of file
+    path('profile/ask/', profile_ask_view, name='profile_ai_ask'),
+    path('profile/ask', profile_ask_view, name='profile_ai_ask_no_slash'),
+    path('ranking/', ranking_view, name='ranking'),
+    path('ranking/batch/', RankingBatchView.as_view(), name='ranking_batch'),
+]
@@ -1,3 +1,1739 @@
-from django.test import TestCase
+import io
+import os
+import re
+import gzip
+import json
+import math
+import random
+import sqlite3
+import time
+import tempfile
+import threading
+import unicodedata
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from .async_views import AsyncProfileAIAskView, AsyncRankingView, AsyncSupabaseAskView, AsyncSupabaseRagHealthView
+from .rag_analyzer import (
+    BM25F_B,
+    BM25F_K1,
+    AnalysisSummaryAccumulator,
+    FIELD_WEIGHTS,
+    QueryMatcher,
+    SpaceSavingCounter,
+    TokenizedProfileCache,
+    TopKCollector,
+    analyze_field_match,
+    analyze_profile_match,
+    analyze_query,
+    bm25f_rank,
+    extract_field_text,
+    generate_analysis_summary,
+    rank_profile_index,
+    score_profile_match,
+)
+from .circuit import CircuitBreaker, CircuitOpenError, get_breaker
+from .http_client import HTTPClient, http_client
+from .llm_cache import LLMResponseCache, get_llm_cache
+from .rag_cache import RAGResultCache
+from .rag_context import estimate_tokens, pack_contexts
+from . import rag_fetch
+from .rag_async import afetch_pages
+from .rag_fetch import (
+    Deadline,
+    JSONArrayDecoder,
+    LatencyTracker,
+    ScanCoverage,
+    fetch_page,
+    fetch_pages,
+    id_bounds,
+    iter_json_array,
+    split_id_range,
+)
+from .rag_fts import FTSIndex, get_fts_index
+from .rag_health import HealthMonitor
+from .rag_index import ProfileIndex, TrigramIndex
+from .rag_replica import PROFILE_SELECT, ProfileReplica, SyncLock, supabase_source, sync_turn
+from . import rag_parallel
+from .rag_sparse import SPARSE_AVAILABLE, SparseScorer
+from .rag_stream import StreamAbort, collect_response, stream_response
+from .views import ProfileAIAskView, _ProfileSearch, _openai_chat, _openai_token_events, _score_page
+
+
+_module_patches = []
+
+
+def setUpModule():
+    # Views under test must not leave an llm_cache.sqlite3 next to the project
+    tmp = tempfile.TemporaryDirectory()
+    _module_patches.extend([
+        tmp,
+        mock.patch('core.llm_cache.LLM_CACHE_PATH', os.path.join(tmp.name, 'llm_cache.sqlite3')),
+        mock.patch('core.llm_cache._llm_cache', None),
+    ])
+    for patcher in _module_patches[1:]:
+        patcher.start()
+
+
+def tearDownModule():
+    for patcher in reversed(_module_patches[1:]):
+        patcher.stop()
+    _module_patches[0].cleanup()
+    _module_patches.clear()
+
+
+WORDS = [
+    'python', 'java', 'javascript', 'typescript', 'script', 'react', 'reactjs',
+    'django', 'node', 'nodejs', 'sql', 'postgresql', 'docker', 'backend',
+    'frontend', 'developer', 'desarrollador', 'ingeniero', 'análisis', 'datos',
+    'programación', 'gestión', 'aws', 'devops', 'kubernetes', 'scrum',
+]
+
+
+def make_profile(rng, profile_id):
+    def words(n):
+        return ' '.join(rng.choice(WORDS) for _ in range(n))
+    return {
+        'id': profile_id,
+        'personal_information': {'name': words(2), 'summary': words(6)},
+        'skills': [words(1) for _ in range(rng.randint(0, 4))],
+        'experience': [{'title': words(2), 'description': words(8)}],
+        'education': [{'institution': words(2)}] if rng.random() < 0.7 else [],
+        'projects': [{'name': words(2), 'technologies': words(3)}],
+    }
+
+
+class SubstringParityTests(SimpleTestCase):
+    """The trigram/matcher path must return exactly what the substring scan returns"""
+
+    def setUp(self):
+        self.rng = random.Random(42)
+        self.profiles = [make_profile(self.rng, i) for i in range(200)]
+        self.queries = [
+            'java script developer',
+            'python python django',
+            'node análisis de datos',
+            'programacion gestion scrum',
+            'ava ode ing',
+            'cobol fortran',
+        ]
+
+    def test_trigram_search_matches_linear_scan(self):
+        trigrams = TrigramIndex()
+        vocabulary = set()
+        for word in WORDS + ['ab', 'xyzzy']:
+            trigrams.add(word)
+            vocabulary.add(word)
+        trigrams.remove('xyzzy')
+        vocabulary.discard('xyzzy')
+        for token in ['java', 'script', 'ode', 'ab', 'zz', 'yacc', 'a']:
+            self.assertEqual(trigrams.search(token), {w for w in vocabulary if token in w})
+
+    def test_field_match_parity(self):
+        index = ProfileIndex()
+        for profile in self.profiles[:100]:
+            index.add(profile)
+        for query in self.queries:
+            tokens = analyze_query(query)['tokens']
+            # Half the profiles are indexed, half fall back to per-term resolution
+            matcher = QueryMatcher(tokens, index)
+            plain = QueryMatcher(tokens)
+            for profile in self.profiles:
+                for field_name in FIELD_WEIGHTS:
+                    text = extract_field_text(profile, field_name)
+                    expected = analyze_field_match(tokens, text, field_name)
+                    self.assertEqual(analyze_field_match(tokens, text, field_name, matcher), expected)
+                    self.assertEqual(analyze_field_match(tokens, text, field_name, plain), expected)
+
+    def test_matcher_parity_while_the_index_changes(self):
+        # A writer keeps adding (and evicting) profiles while matchers read the index
+        index = ProfileIndex(max_profiles=40)
+        stop = threading.Event()
+        rng = random.Random(8)
+
+        def writer():
+            profile_id = 1000
+            while not stop.is_set():
+                profile = make_profile(rng, profile_id)
+                profile['skills'].append(f'tool{profile_id}')
+                index.add(profile)
+                profile_id += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for query in self.queries * 3:
+                tokens = analyze_query(query)['tokens'] + ['tool10']
+                matcher = QueryMatcher(tokens, index)
+                plain = QueryMatcher(tokens)
+                for profile in self.profiles[:40]:
+                    matcher.refresh()
+                    for field_name in FIELD_WEIGHTS:
+                        text = extract_field_text(profile, field_name)
+                        expected = analyze_field_match(tokens, text, field_name)
+                        self.assertEqual(analyze_field_match(tokens, text, field_name, matcher), expected)
+                for term in list(plain.unique_tokens) + [f'tool{i}' for i in range(1000, 1100)]:
+                    self.assertEqual(matcher.hits(term), plain.hits(term))
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_index_ranking_parity(self):
+        index = ProfileIndex()
+        for profile in self.profiles:
+            index.add(profile)
+        # Updates and removals must keep postings and the trigram index in sync
+        for profile in self.profiles[:20]:
+            profile['skills'] = ['cobol', 'fortran']
+            index.update(profile)
+        index.remove(self.profiles[-1]['id'])
+        live = self.profiles[:-1]
+        for query in self.queries:
+            query_analysis = analyze_query(query)
+            expected = []
+            for profile in live:
+                score = analyze_profile_match(profile, query_analysis)['total_score']
+                if score > 0:
+                    expected.append((profile['id'], score))
+            expected.sort(key=lambda x: (-x[1], x[0]))
+            self.assertEqual(rank_profile_index(index, query_analysis), expected)
+
+    def test_score_only_pass_matches_full_analysis(self):
+        for query in self.queries:
+            query_analysis = analyze_query(query)
+            for profile in self.profiles:
+                full = analyze_profile_match(profile, query_analysis)
+                light = score_profile_match(profile, query_analysis)
+                self.assertEqual(light['total_score'], full['total_score'])
+                self.assertEqual(light['overall_coverage'], full['overall_coverage'])
+                self.assertEqual(sorted(light['matched_tokens']), sorted(full['matched_tokens']))
+
+
+class ProfileIndexTests(SimpleTestCase):
+
+    @staticmethod
+    def snapshot(index):
+        postings = {field_name: {term: dict(docs) for term, docs in terms.items()}
+                    for field_name, terms in index.postings.items()}
+        return (postings, dict(index.doc_freq), dict(index.length_totals), dict(index.vocabulary),
+                set(index.trigrams.terms), set(index.documents))
+
+    def test_add_update_remove_match_a_fresh_build(self):
+        rng = random.Random(3)
+        profiles = {i: make_profile(rng, i) for i in range(60)}
+        index = ProfileIndex()
+        for profile in profiles.values():
+            self.assertTrue(index.add(profile))
+        self.assertFalse(index.add(profiles[0]))
+        for i in range(10):
+            profiles[i] = dict(profiles[i], skills=['cobol', f'fortran{i}'])
+            self.assertTrue(index.update(profiles[i]))
+        for i in range(50, 60):
+            self.assertTrue(index.remove(i))
+            del profiles[i]
+        self.assertFalse(index.remove(55))
+
+        fresh = ProfileIndex()
+        for profile in profiles.values():
+            fresh.add(profile)
+        self.assertEqual(self.snapshot(index), self.snapshot(fresh))
+        self.assertEqual(index.term_postings('fortran3'), {3: {'skills': 1}})
+        self.assertEqual(index.candidates(['fortran5']), {5})
+
+    def test_least_recently_added_profiles_are_evicted(self):
+        rng = random.Random(4)
+        profiles = [make_profile(rng, i) for i in range(5)]
+        index = ProfileIndex(max_profiles=3)
+        for profile in profiles[:3]:
+            index.add(profile)
+        # Re-adding an unchanged profile refreshes it
+        index.add(profiles[0])
+        index.add(profiles[3])
+        index.add(profiles[4])
+        self.assertEqual(list(index.documents), [0, 3, 4])
+        self.assertEqual(index.stats()['evictions'], 2)
+        fresh = ProfileIndex()
+        for i in (0, 3, 4):
+            fresh.add(profiles[i])
+        self.assertEqual(self.snapshot(index), self.snapshot(fresh))
+
+    def test_scope_stats(self):
+        index = ProfileIndex()
+        index.add({'id': 1, 'skills': ['python django react']})
+        index.add({'id': 2, 'skills': ['java']})
+        index.add({'id': 3, 'skills': ['golang']})
+        count, averages = index.scope_stats({1, 2, 99})
+        self.assertEqual((count, averages['skills']), (2, 2.0))
+        count, averages = index.scope_stats()
+        self.assertEqual((count, averages['skills']), (3, 5 / 3))
+
+
+class BM25FTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(11)
+        self.profiles = [make_profile(rng, 20000 + i) for i in range(300)]
+        self.index = ProfileIndex()
+        for profile in self.profiles:
+            self.index.add(profile)
+
+    def brute_force(self, query_analysis, profile_ids):
+        """Every profile in scope scored with the plain BM25F formula, no pruning"""
+        count, averages = self.index.scope_stats(profile_ids)
+        scores = {}
+        for token in dict.fromkeys(query_analysis['tokens']):
+            postings = self.index.term_postings(token, profile_ids)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for profile_id, fields in postings.items():
+                tf = 0.0
+                for field_name, term_count in fields.items():
+                    b = BM25F_B.get(field_name, 0.75)
+                    norm = 1 - b + b * self.index.field_length(profile_id, field_name) / (averages[field_name] or 1.0)
+                    tf += FIELD_WEIGHTS[field_name] * term_count / norm
+                scores[profile_id] = scores.get(profile_id, 0.0) + idf * tf * (BM25F_K1 + 1) / (BM25F_K1 + tf)
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0])), len(scores)
+
+    def test_maxscore_matches_brute_force(self):
+        scopes = [{p['id'] for p in self.profiles}, {p['id'] for p in self.profiles[::3]}]
+        pruned = 0
+        for query in ['python django', 'java script developer sql', 'ava ode ing', 'datos', 'cobol']:
+            query_analysis = analyze_query(query)
+            for scope in scopes:
+                expected, matching = self.brute_force(query_analysis, scope)
+                for limit in (1, 5, 20):
+                    ranked, stats = bm25f_rank(self.index, query_analysis, limit, scope)
+                    self.assertEqual([profile_id for profile_id, _ in ranked], [profile_id for profile_id, _ in expected[:limit]])
+                    for (_, score), (_, expected_score) in zip(ranked, expected):
+                        self.assertAlmostEqual(score, expected_score, places=9)
+                    self.assertEqual(stats['candidates'], matching)
+                    pruned += stats['pruned']
+        self.assertGreater(pruned, 0)
+
+    def test_index_scorer_reports_every_match(self):
+        query_analysis = analyze_query('python developer datos')
+        searches = {scorer: _ProfileSearch(query_analysis, scorer, 5, True) for scorer in ('classic', 'bm25f')}
+        for search in searches.values():
+            for start in range(0, len(self.profiles), 100):
+                search.feed(self.profiles[start:start + 100])
+        counts = {}
+        summaries = {}
+        for scorer, search in searches.items():
+            top_k, _ = search.rank(lambda row, ma: {'id': row['id'], 'score': ma['total_score']})
+            counts[scorer] = top_k.count
+            summaries[scorer] = search.summary_acc.summary(query_analysis, top_k.count, 0)
+            summaries[scorer].pop('performance')
+        self.assertGreater(counts['classic'], 5)
+        self.assertEqual(counts['bm25f'], counts['classic'])
+        self.assertEqual(summaries['bm25f'], summaries['classic'])
+
+
+@unittest.skipUnless(SPARSE_AVAILABLE, 'numpy and scipy are not installed')
+class SparseScorerTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(5)
+        self.profiles = [make_profile(rng, i) for i in range(500)]
+        self.index = ProfileIndex()
+        for profile in self.profiles:
+            self.index.add(profile)
+        self.queries = [analyze_query(query) for query in (
+            'java script developer', 'python python django', 'node análisis de datos',
+            'programacion gestion scrum', 'cobol fortran',
+        )]
+
+    def assert_parity(self, scorer):
+        for query_analysis in self.queries:
+            expected = rank_profile_index(self.index, query_analysis)
+            for limit in (1, 5, 20, 100):
+                ranked, stats = scorer.top_k(query_analysis, limit)
+                self.assertEqual(ranked, expected[:limit])
+                self.assertEqual(stats['candidates'], len(expected))
+
+    def test_top_k_matches_index_ranking(self):
+        self.assert_parity(SparseScorer(self.index))
+
+    def test_incremental_refresh_matches_a_fresh_build(self):
+        scorer = SparseScorer(self.index)
+        scorer.refresh()
+        for profile in self.profiles[:30]:
+            self.index.update(dict(profile, skills=['cobol', 'fortran']))
+        for profile in self.profiles[-20:]:
+            self.index.remove(profile['id'])
+        self.index.add({'id': 900, 'skills': ['python fortran']})
+        self.assert_parity(scorer)
+        self.assertEqual(scorer.builds, {'full': 1, 'incremental': 1})
+        fresh = SparseScorer(self.index)
+        fresh.refresh()
+        for query_analysis in self.queries:
+            self.assertEqual(list(scorer.score_all(query_analysis)), list(fresh.score_all(query_analysis)))
+
+    def test_concurrent_callers_share_one_rebuild(self):
+        scorer = SparseScorer(self.index)
+        scorer.refresh()
+        self.index.add({'id': 901, 'skills': ['kubernetes']})
+        barrier = threading.Barrier(8)
+
+        def run():
+            barrier.wait()
+            scorer.top_k(self.queries[0], 10)
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(scorer.builds, {'full': 1, 'incremental': 1})
+
+
+class TokenizedProfileCacheTests(SimpleTestCase):
+
+    def test_hits_misses_and_eviction(self):
+        rng = random.Random(7)
+        profiles = [make_profile(rng, i) for i in range(3)]
+        cache = TokenizedProfileCache(max_entries=2)
+        query_analysis = analyze_query('python developer datos')
+        for profile in profiles[:2]:
+            expected = analyze_profile_match(profile, query_analysis)
+            for _ in range(2):
+                got = analyze_profile_match(profile, query_analysis, cache=cache)
+                got['analysis_time_ms'] = expected['analysis_time_ms']
+                self.assertEqual(got, expected)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        # A changed payload is re-tokenized under the same id
+        profiles[0]['skills'] = ['cobol']
+        cache.get(profiles[0])
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(len(cache), 2)
+
+        # Least recently used entry (profile 1) is evicted first
+        cache.get(profiles[2])
+        self.assertEqual(cache.evictions, 1)
+        self.assertNotIn(1, cache.entries)
+
+
+class TopKCollectorTests(SimpleTestCase):
+
+    def test_matches_full_sort(self):
+        rng = random.Random(3)
+        # Coarse scores force plenty of ties so the id tie-break is exercised
+        results = [(rng.randint(0, 20) / 2, i) for i in rng.sample(range(1000), 500)]
+        expected = sorted(results, key=lambda x: (-x[0], x[1]))
+        for k in (0, 1, 7, 500, 600):
+            collector = TopKCollector(k)
+            for score, item_id in results:
+                collector.offer(score, item_id, lambda: {'id': item_id})
+            self.assertEqual([(score, item_id) for item_id, score, _ in collector.items()], expected[:k])
+            self.assertEqual(collector.count, len(results))
+
+    def test_merge(self):
+        left, right = TopKCollector(3), TopKCollector(3)
+        for score, item_id in [(1.0, 1), (5.0, 2), (3.0, 3)]:
+            left.add(score, item_id)
+        for score, item_id in [(5.0, 0), (2.0, 4), (4.0, 5)]:
+            right.add(score, item_id)
+        left.merge(right)
+        self.assertEqual([item_id for item_id, _, _ in left.items()], [0, 2, 5])
+        self.assertEqual(left.count, 6)
+
+
+class AnalysisSummaryAccumulatorTests(SimpleTestCase):
+
+    def test_merged_shards_match_single_pass(self):
+        rng = random.Random(5)
+        query_analysis = analyze_query('python java node datos scrum')
+        matches = [analyze_profile_match(make_profile(rng, i), query_analysis) for i in range(300)]
+        matches = [m for m in matches if m['total_score'] > 0]
+        for m in matches:
+            m['analysis_time_ms'] = 1
+        expected = generate_analysis_summary(matches, query_analysis, 300, 0.5)
+        shards = [AnalysisSummaryAccumulator() for _ in range(3)]
+        for i, match in enumerate(matches):
+            shards[i % 3].add(match)
+        merged = shards[0]
+        for shard in shards[1:]:
+            merged.merge(shard)
+        got = merged.summary(query_analysis, 300, 0.5)
+        # Shard order only changes float summation order
+        self.assertAlmostEqual(got['coverage_stats'].pop('avg_coverage'), expected['coverage_stats'].pop('avg_coverage'), places=2)
+        for field_name, stats in expected['field_performance'].items():
+            self.assertAlmostEqual(got['field_performance'][field_name].pop('avg_score'), stats.pop('avg_score'), places=1)
+        self.assertEqual(got, expected)
+
+    def test_space_saving_bounds(self):
+        rng = random.Random(11)
+        stream = [rng.choice('aaaaabbbcdefghij') for _ in range(2000)]
+        sketch = SpaceSavingCounter(capacity=4)
+        for item in stream:
+            sketch.add(item)
+        self.assertEqual(len(sketch), 4)
+        self.assertFalse(sketch.exact)
+        for item, count in sketch.counts.items():
+            true_count = stream.count(item)
+            self.assertGreaterEqual(count, true_count)
+            self.assertLessEqual(count - sketch.errors.get(item, 0), true_count)
+        self.assertEqual(sketch.most_common(1)[0][0], 'a')
+
+    def test_space_saving_evicts_like_a_linear_scan(self):
+        rng = random.Random(12)
+        sketch = SpaceSavingCounter(capacity=8)
+        counts, errors = {}, {}
+        for _ in range(3000):
+            item = rng.choice('abcdefghijklmnopqrstuvwxyz'[:rng.randint(4, 26)])
+            sketch.add(item)
+            if item in counts:
+                counts[item] += 1
+                continue
+            error = 0
+            if len(counts) >= 8:
+                victim = min(counts, key=counts.get)
+                error = counts.pop(victim)
+                errors.pop(victim, None)
+            counts[item] = error + 1
+            if error:
+                errors[item] = error
+        self.assertEqual(sketch.counts, counts)
+        self.assertEqual(sketch.errors, errors)
+        self.assertLessEqual(len(sketch._heap), 2 * sketch.capacity)
+
+
+class ParallelScoringTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(21)
+        self.rows = [make_profile(rng, i) for i in range(400)]
+        self.query_analysis = analyze_query('python developer análisis')
+
+    def tearDown(self):
+        rag_parallel._reset_executor()
+
+    def in_process(self, keep_all=False):
+        top_k = TopKCollector(10)
+        summary_acc = AnalysisSummaryAccumulator()
+        for row in self.rows:
+            match_score = score_profile_match(row, self.query_analysis)
+            if match_score['total_score'] > 0 or keep_all:
+                summary_acc.add(match_score)
+                top_k.add(match_score['total_score'], row['id'], row)
+        return top_k, summary_acc
+
+    @staticmethod
+    def result(top_k, summary_acc):
+        # Merged shard sums can differ in the last float bits from a single pass
+        fields = {name: (stats.count, stats.positive, stats.minimum, stats.maximum, round(stats.total, 6))
+                  for name, stats in summary_acc.fields.items()}
+        summary = (summary_acc.matches, summary_acc.coverage_buckets, round(summary_acc.coverage.total, 6),
+                   summary_acc.tokens.most_common(20), fields)
+        return [(profile_id, score, row['id']) for profile_id, score, row in top_k.items()], top_k.count, summary
+
+    def test_pool_matches_in_process_scoring(self):
+        with mock.patch.object(rag_parallel, 'PARALLEL_WORKERS', 2), mock.patch.object(rag_parallel, 'PARALLEL_MIN_ROWS', 50):
+            for keep_all in (False, True):
+                top_k = TopKCollector(10)
+                summary_acc = AnalysisSummaryAccumulator()
+                self.assertTrue(rag_parallel.score_rows_parallel(self.rows, self.query_analysis, top_k, summary_acc, keep_all))
+                self.assertEqual(self.result(top_k, summary_acc), self.result(*self.in_process(keep_all)))
+            # Small pages stay in-process
+            self.assertFalse(rag_parallel.score_rows_parallel(self.rows[:10], self.query_analysis, TopKCollector(10)))
+
+    def test_query_reaches_workers_through_the_initializer(self):
+        with mock.patch.object(rag_parallel, 'PARALLEL_WORKERS', 2), mock.patch.object(rag_parallel, 'PARALLEL_MIN_ROWS', 50):
+            executor = rag_parallel.get_executor()
+            with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+                top_k = TopKCollector(10)
+                summary_acc = AnalysisSummaryAccumulator()
+                self.assertTrue(rag_parallel.score_rows_parallel(self.rows, self.query_analysis, top_k, summary_acc))
+            self.assertEqual(self.result(top_k, summary_acc), self.result(*self.in_process()))
+            for call in submit.call_args_list:
+                slot_ref, query_tokens = call.args[1:3]
+                self.assertIsInstance(slot_ref, tuple)
+                self.assertIsNone(query_tokens)
+            self.assertEqual(rag_parallel._query_slots.pinned, [0] * rag_parallel.QUERY_SLOTS)
+
+    def test_query_slots_are_not_rewritten_while_pinned(self):
+        with mock.patch.object(rag_parallel, 'QUERY_SLOTS', 2):
+            slots = rag_parallel._QuerySlots(rag_parallel.multiprocessing.get_context('spawn'))
+            first = slots.acquire(('python',))
+            self.assertEqual(slots.acquire(('python',)), first)
+            second = slots.acquire(('java',))
+            self.assertIsNone(slots.acquire(('rust',)))
+            self.assertIsNone(slots.acquire(('x' * rag_parallel.QUERY_SLOT_BYTES,)))
+            slots.release(second)
+            third = slots.acquire(('rust',))
+            self.assertEqual(third, (second[0], second[1] + 1))
+            start = third[0] * rag_parallel.QUERY_SLOT_BYTES
+            self.assertEqual(json.loads(slots.data[start:start + slots.lengths[third[0]]]), ['rust'])
+
+    def test_small_pages_are_batched_for_the_pool(self):
+        stats = rag_parallel.parallel_stats()
+        with mock.patch.object(rag_parallel, 'PARALLEL_WORKERS', 2), mock.patch.object(rag_parallel, 'PARALLEL_MIN_ROWS', 150):
+            search = _ProfileSearch(self.query_analysis, 'classic', 10, True)
+            for start in range(0, len(self.rows), 100):
+                search.feed(self.rows[start:start + 100])
+            self.assertEqual(rag_parallel.parallel_stats()['pages'], stats['pages'] + 2)
+            top_k, _ = search.rank(lambda row, ma: row)
+        expected = self.in_process()
+        # Rows sharing no token with the query are skipped before batching
+        self.assertEqual(rag_parallel.parallel_stats()['rows'], stats['rows'] + expected[0].count)
+        self.assertEqual(self.result(top_k, search.summary_acc), self.result(*expected))
+
+    def test_pool_failure_falls_back_to_in_process(self):
+        class BrokenExecutor:
+            def submit(self, *args, **kwargs):
+                raise BrokenProcessPool('worker died')
+
+            def shutdown(self, **kwargs):
+                pass
+
+        stats = rag_parallel.parallel_stats()
+        broken = BrokenExecutor()
+        with mock.patch.object(rag_parallel, 'PARALLEL_WORKERS', 2), mock.patch.object(rag_parallel, 'PARALLEL_MIN_ROWS', 50), \
+                mock.patch.object(rag_parallel, '_executor', broken), mock.patch.object(rag_parallel, 'get_executor', lambda: broken):
+            top_k = TopKCollector(10)
+            summary_acc = AnalysisSummaryAccumulator()
+            self.assertFalse(rag_parallel.score_rows_parallel(self.rows, self.query_analysis, top_k, summary_acc))
+            self.assertEqual((top_k.count, summary_acc.matches), (0, 0))
+            # The broken pool is dropped so the next page starts a new one
+            self.assertIsNone(rag_parallel._executor)
+            # The view helper scores the page itself when the pool fails
+            _score_page(self.rows, None, self.query_analysis, None, top_k, summary_acc)
+        self.assertEqual(rag_parallel.parallel_stats()['fallbacks'], stats['fallbacks'] + 2)
+        self.assertEqual(rag_parallel.parallel_stats()['restarts'], stats['restarts'] + 1)
+        self.assertEqual(self.result(top_k, summary_acc), self.result(*self.in_process()))
+
+
+class StreamingFetchTests(SimpleTestCase):
+
+    def test_json_array_stream_matches_json_loads(self):
+        rng = random.Random(9)
+        rows = [make_profile(rng, i) for i in range(50)]
+        rows[3]['score'] = 12345678901234567890
+        rows[4]['skills'] = ['ñandú "citado" \\ ]', 1.5e-7, None, True]
+        body = json.dumps(rows, ensure_ascii=False, indent=1).encode('utf-8')
+        for chunk_size in (1, 7, 64, 4096):
+            self.assertEqual(list(iter_json_array(io.BytesIO(body), chunk_size)), rows)
+        self.assertEqual(list(iter_json_array(io.BytesIO(b' [ ] '))), [])
+        self.assertEqual(list(iter_json_array(io.BytesIO(b''))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(body[:-40]), 64))
+
+        # Pushed in uneven chunks, as an async response body arrives
+        cuts = sorted(rng.sample(range(1, len(body)), 300))
+        decoder = JSONArrayDecoder()
+        values = []
+        for start, end in zip([0] + cuts, cuts + [len(body)]):
+            values.extend(decoder.feed(body[start:end]))
+        values.extend(decoder.close())
+        self.assertEqual(values, rows)
+        decoder = JSONArrayDecoder()
+        decoder.feed(body[:-40])
+        with self.assertRaises(ValueError):
+            decoder.close()
+
+    def test_split_id_range_covers_every_id(self):
+        for low, high, parts in [(1, 20500, 4), (5, 6, 4), (10, 10, 3), (1, 1000, 7)]:
+            ranges = split_id_range(low, high, parts)
+            self.assertIsNone(ranges[-1][1])
+            covered = []
+            for after_id, before_id in ranges:
+                stop = high + 1 if before_id is None else before_id
+                covered.extend(range(after_id + 1, stop))
+            self.assertEqual(covered, list(range(low, high + 1)))
+
+
+class FTSIndexTests(SimpleTestCase):
+
+    def test_fts_matches_the_analyzer_candidates(self):
+        index = get_fts_index('test_profile')
+        if index is None:
+            self.skipTest('SQLite without FTS5')
+        index.clear()
+        rng = random.Random(13)
+        profiles = [make_profile(rng, i) for i in range(1, 150)]
+        self.assertEqual(index.add_rows(profiles), len(profiles))
+        self.assertEqual(index.add_rows(profiles), 0)
+        for query in ('python docker', 'script', 'programacion gestion', 'ingeniero'):
+            qa = analyze_query(query)
+            positive = {p['id'] for p in profiles if score_profile_match(p, qa)['total_score'] > 0}
+            found, stats = index.search(qa, len(profiles))
+            self.assertEqual({doc_id for doc_id, _, _ in found}, positive, query)
+            self.assertEqual(stats['candidates'], len(positive))
+            scores = [score for _, score, _ in found]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            self.assertTrue(all('[' in snippet for _, _, snippet in found))
+        scope = set(range(1, 40))
+        found, _ = index.search(analyze_query('python'), 10, scope)
+        self.assertTrue({doc_id for doc_id, _, _ in found} <= scope)
+
+    def test_least_recently_loaded_documents_are_evicted(self):
+        index = FTSIndex('test_capped', sqlite3.connect(':memory:', check_same_thread=False), threading.Lock(), max_docs=50)
+        rng = random.Random(17)
+        profiles = {i: make_profile(rng, i) for i in range(1, 81)}
+        index.add_rows(profiles[i] for i in range(1, 81))
+        self.assertEqual(index.stats(), {'documents': 50, 'max_docs': 50, 'evictions': 30})
+
+        # Scanning 31 again (unchanged) keeps it; the next oldest make room for 81..90
+        self.assertEqual(index.add_rows([profiles[31]]), 0)
+        index.add_rows(make_profile(rng, i) for i in range(81, 91))
+        qa = analyze_query(' '.join(WORDS))
+        found, stats = index.search(qa, 100)
+        self.assertEqual({doc_id for doc_id, _, _ in found}, {31} | set(range(42, 91)))
+        self.assertEqual((stats['candidates'], index.evictions), (50, 40))
+
+
+class StreamEventsTests(SimpleTestCase):
+
+    def events(self, fail=False):
+        top_k = TopKCollector(2)
+        for profile_id, score in [(3, 1.0), (1, 2.0), (2, 2.0)]:
+            top_k.add(score, profile_id)
+            yield 'progress', {'scanned': profile_id}
+        if fail:
+            raise StreamAbort({'error': 'Supabase URLError'}, 502)
+        yield 'result', {'matches': [{'id': str(i), 'score': s} for i, s, _ in top_k.items()]}
+        yield 'analysis', {'total_matches': 3}
+
+    def test_collected_events_match_a_plain_response(self):
+        response = collect_response(self.events())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'matches': [{'id': '1', 'score': 2.0}, {'id': '2', 'score': 2.0}],
+            'analysis': {'total_matches': 3}
+        })
+        self.assertEqual(collect_response(self.events(fail=True)).status_code, 502)
+
+    def test_ndjson_and_sse_framing(self):
+        lines = b''.join(stream_response(self.events(), 'ndjson').streaming_content).decode().splitlines()
+        events = [json.loads(line)['event'] for line in lines]
+        self.assertEqual(events, ['progress'] * 3 + ['result', 'analysis', 'done'])
+        body = b''.join(stream_response(self.events(fail=True), 'sse').streaming_content).decode()
+        blocks = [block for block in body.split('\n\n') if block]
+        self.assertEqual(blocks[-2].split('\n')[0], 'event: error')
+        self.assertEqual(json.loads(blocks[-2].split('data: ', 1)[1])['status_code'], 502)
+        self.assertEqual(blocks[-1].split('\n')[0], 'event: done')
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+
+    def test_memory_and_disk_tiers(self):
+        messages = [{'role': 'user', 'content': 'Perfiles con python?'}]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'llm.sqlite3')
+            cache = LLMResponseCache(path, ttl=60, max_entries=1)
+            key = cache.key('gpt-4.1-mini', 0.2, messages)
+            self.assertNotEqual(key, cache.key('gpt-4.1-mini', 0.0, messages))
+            self.assertIsNone(cache.get(key))
+            cache.set(key, 'Ana (id 3)', 1200.0)
+            self.assertEqual(cache.get(key)['tier'], 'memory')
+
+            # Another process sees the SQLite tier; a disk hit is promoted
+            other = LLMResponseCache(path, ttl=60)
+            hit = other.get(key)
+            self.assertEqual((hit['content'], hit['tier'], hit['saved_ms']), ('Ana (id 3)', 'disk', 1200.0))
+            self.assertEqual(other.get(key)['tier'], 'memory')
+            self.assertEqual(other.stats()['saved_ms'], 2400.0)
+
+            # Expired entries are misses and get dropped from both tiers
+            expired = LLMResponseCache(path, ttl=0)
+            expired.entries[key] = (0.0, 1200.0, 'Ana (id 3)')
+            self.assertIsNone(expired.get(key))
+            self.assertIsNone(expired.get(key))
+            self.assertEqual(expired.stats()['expired'], 2)
+
+    def test_sqlite_tier_only_when_enabled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'llm.sqlite3')
+            with mock.patch('core.llm_cache.LLM_CACHE_PATH', path), mock.patch('core.llm_cache._llm_cache', None), \
+                    mock.patch('core.llm_cache.LLM_CACHE_ENABLED', False):
+                self.assertIsNone(get_llm_cache().stats()['path'])
+                self.assertFalse(os.path.exists(path))
+            with mock.patch('core.llm_cache.LLM_CACHE_PATH', path), mock.patch('core.llm_cache._llm_cache', None), \
+                    mock.patch('core.llm_cache.LLM_CACHE_ENABLED', True):
+                self.assertEqual(get_llm_cache().stats()['path'], path)
+                self.assertTrue(os.path.exists(path))
+
+
+class ContextPackingTests(SimpleTestCase):
+
+    def test_budget_priority_and_deduplication(self):
+        rng = random.Random(5)
+        profiles = [make_profile(rng, i) for i in range(8)]
+        profiles[1]['skills'] = profiles[0]['skills']
+        query_analysis = analyze_query('python react datos')
+        matches = []
+        for profile in profiles:
+            match_analysis = analyze_profile_match(profile, query_analysis)
+            matches.append(dict(profile, score=match_analysis['total_score'], field_scores=match_analysis['field_scores'],
+                                field_snippets=match_analysis['field_snippets']))
+        matches.sort(key=lambda m: -m['score'])
+
+        for budget in (0, 40, 150, 400, 5000):
+            contexts, stats = pack_contexts(matches, budget)
+            self.assertLessEqual(stats['tokens'], budget)
+            self.assertEqual(stats['profiles'], len(contexts))
+            self.assertEqual([c['id'] for c in contexts], [m['id'] for m in matches if m['id'] in {c['id'] for c in contexts}])
+            texts = [line for c in contexts for line in c['text'].split(' | ')[1:]]
+            self.assertEqual(len(texts), len(set(texts)))
+
+        contexts, stats = pack_contexts(matches, 5000)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertGreaterEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['tokens'], sum(estimate_tokens(c['text']) for c in contexts))
+
+        # A tight budget goes to the best matching field snippet first
+        best = max(((m['field_scores'][f]['score'], f, m) for m in matches for f in m['field_scores']), key=lambda x: x[0])
+        contexts, _ = pack_contexts(matches, 120)
+        self.assertIn(best[2]['id'], [c['id'] for c in contexts])
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible chat completions endpoint; stream=true answers are
+    sent as chunked server-sent events, one delta per chunk
+    """
+    protocol_version = 'HTTP/1.1'
+    deltas = ['Ana ', 'sabe ', 'python.', '\nMatched IDs: 3, 7']
+    requests = 0
+
+    def do_POST(self):
+        FakeOpenAIHandler.requests += 1
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if not payload.get('stream'):
+            body = json.dumps({'choices': [{'message': {'content': ''.join(self.deltas)}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunks = [{'choices': [{'delta': {'role': 'assistant'}}]}]
+        chunks += [{'choices': [{'delta': {'content': delta}}]} for delta in self.deltas]
+        events = [f'data: {json.dumps(chunk)}\n\n' for chunk in chunks] + ['data: [DONE]\n\n']
+        for event in events:
+            data = event.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenAIStreamingTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.env = mock.patch.dict(os.environ, {
+            'OPENAI_API_KEY': 'test',
+            'OPENAI_BASE_URL': f'http://127.0.0.1:{cls.server.server_port}/v1',
+        })
+        cls.env.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_tokens_are_relayed_and_the_answer_parsed_at_the_end(self):
+        events = []
+        answer = _openai_token_events([{'role': 'user', 'content': 'python'}], use_cache=False)
+        while True:
+            try:
+                events.append(next(answer))
+            except StopIteration as done:
+                status_code, content, cache_info = done.value
+                break
+        self.assertEqual([data['text'] for _, data in events], FakeOpenAIHandler.deltas)
+        self.assertEqual((status_code, content, cache_info), (200, ''.join(FakeOpenAIHandler.deltas), None))
+        self.assertEqual(_openai_chat([{'role': 'user', 'content': 'python'}]), (200, content))
+
+        search = _ProfileSearch(analyze_query('python'), 'classic', 5, False)
+        contexts = [{'id': 3, 'score': 2.0}, {'id': 7, 'score': 1.0}, {'id': 9, 'score': 0.5}]
+        data = ProfileAIAskView()._response_data(search, None, contexts, contexts, status_code, content, False)
+        self.assertEqual(data['answer'], 'Ana sabe python.')
+        self.assertEqual(data['matches'], [{'id': '3', 'score': 2.0}, {'id': '7', 'score': 1.0}])
+
+    def test_open_breaker_fails_fast(self):
+        breaker = get_breaker('openai')
+        monitor = HealthMonitor({'openai': lambda: {'ok': False, 'status_code': 0, 'latency_ms': 1.0, 'error': 'timed out'}})
+        try:
+            monitor.refresh()
+            self.assertEqual(monitor.status('openai')['breaker']['state'], 'open')
+            sent = FakeOpenAIHandler.requests
+            self.assertEqual(_openai_chat([{'role': 'user', 'content': 'python'}]), (0, ''))
+            self.assertEqual(FakeOpenAIHandler.requests, sent)
+
+            monitor.probes['openai'] = lambda: {'ok': True, 'status_code': 200, 'latency_ms': 1.0, 'error': None}
+            monitor.refresh()
+            self.assertEqual(_openai_chat([{'role': 'user', 'content': 'python'}])[0], 200)
+            self.assertEqual(FakeOpenAIHandler.requests, sent + 1)
+        finally:
+            breaker.record_success()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_open_half_open_and_close(self):
+        now = [0.0]
+        breaker = CircuitBreaker('supabase', failures=3, reset_sec=10, clock=lambda: now[0])
+        for _ in range(2):
+            breaker.record_failure('timeout')
+        self.assertTrue(breaker.allow())
+        breaker.record_failure('timeout')
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+        # One trial request once the reset timeout has passed; its failure reopens
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure('timeout')
+        self.assertEqual(breaker.state, 'open')
+        now[0] = 20.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.consecutive_failures), ('closed', 0))
+        self.assertEqual(breaker.stats()['opened'], 2)
+        self.assertEqual(breaker.stats()['rejected'], 2)
+
+
+class FakeProfileTable:
+    """fetch_rows stand-in over ids 1..rows (PostgREST id filters, order and limit)"""
+
+    def __init__(self, rows, fail_after=None, slow=None):
+        # A row count (ids 1..rows) or the ids themselves
+        self.rows = sorted(rows) if isinstance(rows, (list, set)) else list(range(1, rows + 1))
+        # Pages starting after this id fail; `slow` maps a call number to a delay
+        self.fail_after = fail_after
+        self.slow = slow or {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, headers, timeout=8):
+        from urllib.error import HTTPError
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.slow.get(call, 0))
+        params = parse_qsl(urlsplit(url).query)
+        ids = self.rows
+        after_id = None
+        for key, value in params:
+            if key == 'id' and value.startswith('gt.'):
+                after_id = int(value[3:])
+                ids = [i for i in ids if i > after_id]
+            elif key == 'id' and value.startswith('lt.'):
+                ids = [i for i in ids if i < int(value[3:])]
+        params = dict(params)
+        if params.get('order') == 'id.desc':
+            ids = ids[::-1]
+        elif self.fail_after is not None and after_id is not None and after_id >= self.fail_after:
+            raise HTTPError(url, 503, 'Service Unavailable', {}, None)
+        page = [{'id': i} for i in ids[:int(params.get('limit', len(ids)))]]
+        return page, len(ids)
+
+
+class ConcurrentFetchTests(SimpleTestCase):
+
+    def test_split_id_range_partitions_the_id_space(self):
+        rng = random.Random(12)
+        for _ in range(200):
+            low = rng.randint(-50, 500)
+            high = low + rng.randint(0, 2000)
+            ranges = split_id_range(low, high, rng.randint(1, 12))
+            self.assertEqual(ranges[0][0], low - 1)
+            self.assertIsNone(ranges[-1][1])
+            for (after_id, before_id), (next_after, _) in zip(ranges, ranges[1:]):
+                self.assertLess(after_id, next_after)
+                self.assertEqual(before_id, next_after + 1)
+            for profile_id in range(low, high + 50):
+                owners = [r for r in ranges if r[0] < profile_id and (r[1] is None or profile_id < r[1])]
+                self.assertEqual(len(owners), 1)
+
+    def test_concurrent_pages_come_in_id_order(self):
+        rng = random.Random(4)
+        ids = rng.sample(range(1, 5000), 700)
+        # Early calls are slowed down so later ranges finish first
+        slow = {call: rng.choice([0, 0.01, 0.03]) for call in range(1, 40)}
+        runs = []
+        for workers in (4, 3, 1):
+            table = FakeProfileTable(ids, slow=slow)
+            with mock.patch('core.rag_fetch.fetch_rows', table), mock.patch('core.rag_fetch.page_latency', LatencyTracker()):
+                self.assertEqual(id_bounds('http://supabase.test/rest/v1/profile?select=*', {}), (min(ids), max(ids), len(ids)))
+                pages = list(fetch_pages('http://supabase.test/rest/v1/profile?select=*', {}, page_size=50,
+                                         workers=workers))
+            scanned = [row['id'] for page in pages for row in page]
+            self.assertEqual(scanned, sorted(ids))
+            self.assertTrue(all(len(page) <= 50 for page in pages))
+            runs.append(scanned)
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(runs[0], runs[2])
+
+
+class ScanCoverageTests(SimpleTestCase):
+
+    def test_failed_range_is_skipped_and_reported(self):
+        table = FakeProfileTable(100, fail_after=70)
+        coverage = ScanCoverage()
+        with mock.patch('core.rag_fetch.fetch_rows', table), mock.patch('core.rag_fetch.page_latency', LatencyTracker()):
+            pages = list(fetch_pages('http://supabase.test/rest/v1/profile?select=*', {}, page_size=20,
+                                     workers=2, coverage=coverage))
+        ids = [row['id'] for page in pages for row in page]
+        self.assertEqual(ids, list(range(1, 71)))
+        self.assertEqual(coverage.skipped(), [{'after_id': 70, 'before_id': None, 'reason': 'HTTP 503'}])
+
+        # Without a coverage the error still reaches the caller
+        with mock.patch('core.rag_fetch.fetch_rows', table), mock.patch('core.rag_fetch.page_latency', LatencyTracker()):
+            with self.assertRaises(Exception):
+                list(fetch_pages('http://supabase.test/rest/v1/profile?select=*', {}, page_size=20, workers=2))
+
+    def test_deadline_reports_the_unscanned_ids(self):
+        table = FakeProfileTable(100)
+        coverage = ScanCoverage()
+        deadline = Deadline(60)
+        scanned = []
+        with mock.patch('core.rag_fetch.fetch_rows', table), mock.patch('core.rag_fetch.page_latency', LatencyTracker()):
+            for page in fetch_pages('http://supabase.test/rest/v1/profile?select=*', {}, page_size=20,
+                                    deadline=deadline, workers=1, coverage=coverage):
+                scanned.extend(row['id'] for row in page)
+                if len(scanned) >= 40:
+                    deadline.expires_at = time.time() - 1
+                    break
+        self.assertEqual(coverage.skipped(), [{'after_id': 40, 'before_id': None, 'reason': 'deadline'}])
+        self.assertEqual(Deadline(60).timeout(cap=8), 8)
+        self.assertLess(Deadline(0.5).timeout(), 0.6)
+
+    def test_straggler_page_is_hedged(self):
+        latency = LatencyTracker()
+        for _ in range(30):
+            latency.record(5.0)
+        # The first request hangs; the duplicate sent after the p95 delay answers
+        table = FakeProfileTable(10, slow={1: 2.0})
+        with mock.patch('core.rag_fetch.fetch_rows', table), mock.patch('core.rag_fetch.page_latency', latency), \
+                mock.patch('core.rag_fetch.HEDGE_MIN_MS', 20):
+            start = time.time()
+            rows, _ = fetch_page('http://supabase.test/rest/v1/profile?select=*&order=id&limit=5', {}, Deadline(10))
+            elapsed = time.time() - start
+        self.assertEqual([row['id'] for row in rows], [1, 2, 3, 4, 5])
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual((latency.metrics['hedged'], latency.metrics['hedge_wins']), (1, 1))
+
+
+def make_supabase_tables(profiles=300, seed=9):
+    """profile / vacant rows for FakeSupabaseHandler"""
+    rng = random.Random(seed)
+    rows = []
+    for profile_id in range(1, profiles + 1):
+        row = make_profile(rng, profile_id)
+        row.update(status=rng.choice(['pending', 'accepted']), vacant_id=rng.choice([1, 2, 3]))
+        rows.append(row)
+    vacancies = [
+        {'id': vacant_id, 'title': f'Vacante {vacant_id}', 'description': ' '.join(rng.choice(WORDS) for _ in range(10))}
+        for vacant_id in (1, 2, 3)
+    ]
+    return {'profile': rows, 'vacant': vacancies}
+
+
+class FakeSupabaseHandler(BaseHTTPRequestHandler):
+    """
+    PostgREST stand-in over `tables`: eq/gt/gte/lt/lte/in filters, or=(col.ilike.pattern),
+    order, limit, offset, select, Prefer: count=exact and gzip bodies. Every
+    answer waits `delay` seconds; `script` lists (delay, status) for the next requests.
+    """
+    protocol_version = 'HTTP/1.1'
+    tables = {}
+    paths = []
+    rows_served = 0
+    delay = 0
+    script = []
+
+    @staticmethod
+    def column_text(row, column):
+        if column == 'search_text':
+            # AI_RAG_PUSHDOWN_COLUMN as rag_fetch documents it: NFKD, non-ASCII dropped, lowercase
+            text = ' '.join(json.dumps(row.get(field), ensure_ascii=False) for field in FIELD_WEIGHTS)
+            return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+        return json.dumps(row.get(column.split('::')[0]), ensure_ascii=False).lower()
+
+    @classmethod
+    def ilike(cls, row, column, pattern):
+        regex = ''.join('.*' if c == '*' else '.' if c == '_' else re.escape(c) for c in pattern.lower())
+        return re.fullmatch(regex, cls.column_text(row, column), re.S) is not None
+
+    @staticmethod
+    def compare(value, op, operand):
+        if op == 'in':
+            return str(value) in operand.strip('()').split(',')
+        if op == 'eq':
+            return str(value) == operand
+        if value is None:
+            return False
+        operand = type(value)(operand)
+        return {'gt': value > operand, 'gte': value >= operand, 'lt': value < operand, 'lte': value <= operand}[op]
+
+    def query(self, table, params):
+        rows = self.tables.get(table, [])
+        order, limit, offset = None, None, 0
+        for key, value in params:
+            if key == 'select':
+                continue
+            elif key == 'limit':
+                limit = int(value)
+            elif key == 'offset':
+                offset = int(value)
+            elif key == 'order':
+                order = value
+            elif key == 'or':
+                conditions = [condition.split('.', 2) for condition in value.strip('()').split(',')]
+                rows = [row for row in rows if any(op == 'ilike' and self.ilike(row, column, pattern)
+                                                   for column, op, pattern in conditions)]
+            else:
+                op, operand = value.split('.', 1)
+                rows = [row for row in rows if self.compare(row.get(key), op, operand)]
+        total = len(rows)
+        if order:
+            column, _, direction = order.partition('.')
+            rows = sorted(rows, key=lambda row: row.get(column), reverse=direction == 'desc')
+        rows = rows[offset:None if limit is None else offset + limit]
+        select = dict(params).get('select', '*')
+        if select != '*':
+            rows = [{column: row.get(column) for column in select.split(',')} for row in rows]
+        return rows, total, offset
+
+    def do_GET(self):
+        FakeSupabaseHandler.paths.append(self.path)
+        try:
+            delay, status = FakeSupabaseHandler.script.pop(0)
+        except IndexError:
+            delay, status = FakeSupabaseHandler.delay, 200
+        time.sleep(delay)
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        parts = urlsplit(self.path)
+        rows, total, offset = self.query(parts.path.rsplit('/', 1)[-1], parse_qsl(parts.query))
+        FakeSupabaseHandler.rows_served += len(rows)
+        body = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        if 'count=' in (self.headers.get('Prefer') or ''):
+            self.send_header('Content-Range', f'{offset}-{offset + len(rows) - 1}/{total}' if rows else f'*/{total}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSupabaseTestCase(SimpleTestCase):
+    """Runs the views against FakeSupabaseHandler (Supabase env pointed at it)"""
+
+    @classmethod
+    def make_tables(cls):
+        return make_supabase_tables()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        FakeSupabaseHandler.tables = cls.make_tables()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSupabaseHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.env = mock.patch.dict(os.environ, {
+            'NEXT_PUBLIC_SUPABASE_URL': f'http://127.0.0.1:{cls.server.server_port}',
+            'NEXT_PUBLIC_SUPABASE_ANON_KEY': 'test',
+            'SUPABASE_SERVICE_ROLE_KEY': 'test',
+        })
+        cls.env.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        FakeSupabaseHandler.paths = []
+        FakeSupabaseHandler.rows_served = 0
+        FakeSupabaseHandler.delay = 0
+        FakeSupabaseHandler.script = []
+
+    @staticmethod
+    def without_timings(data):
+        """Response body minus the wall-clock figures that differ between runs"""
+        data = dict(data)
+        if isinstance(data.get('analysis'), dict):
+            data['analysis'] = {k: v for k, v in data['analysis'].items() if k != 'performance'}
+        return data
+
+
+class RankingBatchViewTests(FakeSupabaseTestCase):
+
+    def test_batch_matches_single_rankings(self):
+        body = {'vacant_ids': [1, 2, 99, 1], 'limit': 4, 'analysis': True}
+        response = self.client.post('/api/ranking/batch/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['vacant_ids'], ['1', '2', '99'])
+        applicants = [row for row in FakeSupabaseHandler.tables['profile'] if row['vacant_id'] in (1, 2)]
+        self.assertEqual(data['scanned'], len(applicants))
+        self.assertEqual(data['results'][2], {'error': 'Vacante no encontrada', 'vacant_id': '99', 'status_code': 404})
+
+        for vacant_id, result in zip((1, 2), data['results']):
+            single = self.client.post('/api/ranking/', {'vacant_id': vacant_id, 'limit': 4, 'analysis': True},
+                                      format='json')
+            self.assertEqual(single.status_code, 200)
+            self.assertEqual(self.without_timings(result), self.without_timings(single.json()))
+            self.assertEqual(result['used'], 4)
+
+        single = self.client.post('/api/ranking/', {'vacant_id': 99}, format='json')
+        self.assertEqual(single.status_code, 404)
+
+
+class BreakerVerdictTests(FakeSupabaseTestCase):
+    """Only outcomes that say something about Supabase move its circuit breaker"""
+
+    def setUp(self):
+        super().setUp()
+        self.breaker = CircuitBreaker('supabase', failures=3)
+        patcher = mock.patch.dict('core.circuit._breakers', {'supabase': self.breaker})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = os.environ['NEXT_PUBLIC_SUPABASE_URL'] + '/rest/v1/profile?select=id&status=eq.pending'
+        self.headers = supabase_source()[1]
+
+    def test_deadline_expired_scans_leave_the_breaker_closed(self):
+        # A healthy but slow Supabase: every page outlives the request's budget
+        FakeSupabaseHandler.delay = 0.6
+
+        async def ascan(coverage):
+            return [page async for page in afetch_pages(self.url, self.headers, deadline=Deadline(0.3),
+                                                        workers=1, coverage=coverage)]
+
+        for _ in range(3):
+            # Nothing arrived, so the timeout reaches the caller, reported as the deadline's
+            coverage = ScanCoverage()
+            with self.assertRaises(URLError):
+                list(fetch_pages(self.url, self.headers, deadline=Deadline(0.3), workers=1, coverage=coverage))
+            self.assertEqual(coverage.skipped()[0]['reason'], 'deadline')
+            coverage = ScanCoverage()
+            with self.assertRaises(URLError):
+                async_to_sync(ascan)(coverage)
+            self.assertEqual(coverage.skipped()[0]['reason'], 'deadline')
+        self.assertEqual((self.breaker.state, self.breaker.consecutive_failures), ('closed', 0))
+        self.assertEqual(len(list(fetch_pages(self.url, self.headers, workers=1))), 1)
+
+        # A timeout at the full cap still counts
+        FakeSupabaseHandler.delay = 0.4
+        with mock.patch.object(http_client, 'default_timeout', 0.2):
+            with self.assertRaises(URLError):
+                rag_fetch.fetch_rows(self.url, self.headers, timeout=0.2)
+        self.assertEqual(self.breaker.consecutive_failures, 1)
+
+    def test_abandoned_hedge_request_is_not_a_failure(self):
+        latency = LatencyTracker()
+        for _ in range(30):
+            latency.record(5.0)
+        # A pooled connection first, so the primary request reaches the server before the hedge
+        rag_fetch.fetch_rows(self.url, self.headers)
+        # The primary request answers 503 after the hedge has already won
+        FakeSupabaseHandler.script = [(0.3, 503)]
+        with mock.patch('core.rag_fetch.page_latency', latency), mock.patch('core.rag_fetch.HEDGE_MIN_MS', 20):
+            rows, _ = fetch_page(self.url + '&order=id&limit=5', self.headers, Deadline(10))
+            self.assertEqual(len(rows), 5)
+            time.sleep(0.5)
+        self.assertEqual(latency.metrics['hedge_wins'], 1)
+        self.assertEqual((self.breaker.state, self.breaker.consecutive_failures), ('closed', 0))
+
+        # Not abandoned, the same answer is a failure
+        FakeSupabaseHandler.script = [(0, 503)]
+        with self.assertRaises(HTTPError):
+            rag_fetch.fetch_rows(self.url, self.headers)
+        self.assertEqual(self.breaker.consecutive_failures, 1)
+
+    def test_release_hands_back_the_half_open_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker('supabase', failures=1, reset_sec=10, clock=lambda: now[0])
+        breaker.record_failure('down')
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # The trial timed out on the caller's deadline: another request may try
+        breaker.release()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, 'half_open')
+
+
+class FakeKeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive server for the pooled client: gzip bodies on request, records the
+    client port and request line of every request; `drop_second` closes a
+    connection on its second request without answering (a stale pooled socket)
+    """
+    protocol_version = 'HTTP/1.1'
+    body = json.dumps([{'id': i, 'text': 'fila número %d' % i} for i in range(2000)]).encode()
+    drop_second = False
+    seen = []
+
+    def do_GET(self):
+        self.served = getattr(self, 'served', 0) + 1
+        if self.drop_second and self.served > 1:
+            self.close_connection = True
+            return
+        FakeKeepAliveHandler.seen.append((self.client_address[1], self.path))
+        body = self.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPClientTests(SimpleTestCase):
+
+    def setUp(self):
+        FakeKeepAliveHandler.seen = []
+        FakeKeepAliveHandler.drop_second = False
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeKeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/rest/v1/profile'
+        self.client = HTTPClient(max_idle=2, default_timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            with self.client.request('GET', self.url, guard=False) as r:
+                self.assertEqual(r.read(), FakeKeepAliveHandler.body)
+        self.assertEqual(len({port for port, _ in FakeKeepAliveHandler.seen}), 1)
+        stats = self.client.stats()
+        self.assertEqual((stats['connections_opened'], stats['connections_reused']), (1, 2))
+
+    def test_gzip_body_is_decoded_in_small_reads(self):
+        with self.client.request('GET', self.url, guard=False) as r:
+            self.assertEqual(r.getheader('Content-Encoding'), 'gzip')
+            chunks = []
+            while True:
+                chunk = r.read(7)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), 7)
+                chunks.append(chunk)
+        self.assertEqual(b''.join(chunks), FakeKeepAliveHandler.body)
+        # A 1-byte read size still sees every row (no early b'' from the decompressor)
+        with self.client.request('GET', self.url, guard=False) as r:
+            rows = list(iter_json_array(r, chunk_size=1))
+        self.assertEqual(rows, json.loads(FakeKeepAliveHandler.body))
+
+    def test_stale_connection_is_retried_once(self):
+        FakeKeepAliveHandler.drop_second = True
+        for _ in range(2):
+            with self.client.request('GET', self.url, guard=False) as r:
+                self.assertEqual(r.read(), FakeKeepAliveHandler.body)
+        self.assertEqual(self.client.stats()['stale_retries'], 1)
+        self.assertEqual(len({port for port, _ in FakeKeepAliveHandler.seen}), 2)
+
+    def test_proxy_from_environment(self):
+        proxy = f'http://127.0.0.1:{self.server.server_port}'
+        client = HTTPClient()
+        try:
+            with mock.patch.dict(os.environ, {'HTTP_PROXY': proxy, 'NO_PROXY': ''}):
+                with client.urlopen('http://supabase.test/rest/v1/profile?select=id') as r:
+                    r.read()
+        finally:
+            client.close()
+        self.assertEqual(FakeKeepAliveHandler.seen[-1][1], 'http://supabase.test/rest/v1/profile?select=id')
+
+
+class AIAskViewTests(FakeSupabaseTestCase):
+
+    def test_keyset_scan_stops_at_limit(self):
+        with mock.patch('core.views._cached_openai_chat', return_value=(200, 'Tres perfiles.', None)):
+            response = self.client.get('/api/ai/ask/', {'q': 'python', 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        pending = [row['id'] for row in FakeSupabaseHandler.tables['profile'] if row['status'] == 'pending']
+        self.assertEqual((data['scanned'], data['partial'], data['skipped']), (3, False, []))
+        # No ids in the answer: the matches are the profiles sent as context
+        self.assertEqual(sorted(int(m['id']) for m in data['matches']), pending[:3])
+        profile_requests = [path for path in FakeSupabaseHandler.paths if '/profile?' in path]
+        self.assertEqual(len(profile_requests), 1)
+        self.assertIn('&order=id&limit=3', profile_requests[0])
+        self.assertNotIn('offset=', profile_requests[0])
+
+        # Fewer pending rows than the limit: the keyset walk ends on a short page
+        FakeSupabaseHandler.paths = []
+        with mock.patch('core.views._cached_openai_chat', return_value=(200, 'Nada', None)):
+            data = self.client.get('/api/ai/ask/', {'q': 'python', 'limit': 1000, 'status': 'accepted'}).json()
+        accepted = [row for row in FakeSupabaseHandler.tables['profile'] if row['status'] == 'accepted']
+        self.assertEqual((data['scanned'], data['skipped']), (len(accepted), []))
+
+
+class CompanySearchViewTests(FakeSupabaseTestCase):
+
+    @classmethod
+    def make_tables(cls):
+        tables = make_supabase_tables()
+        rng = random.Random(13)
+        tables['company'] = [
+            {'id': company_id, 'legal_name': f'{rng.choice(WORDS)} {rng.choice(WORDS)} sa',
+             'trade_name': rng.choice(WORDS), 'company_type': rng.choice(WORDS),
+             'legal_representative': f'{rng.choice(WORDS)} {rng.choice(WORDS)}', 'tax_id': str(1000 + company_id)}
+            for company_id in range(1, 121)
+        ]
+        return tables
+
+    def test_fts_summary_covers_every_match(self):
+        if get_fts_index('company') is None:
+            self.skipTest('SQLite without FTS5')
+        params = {'q': 'script developer', 'limit': 3, 'cache': 'false'}
+        classic = self.client.get('/api/rag/search/', dict(params, scorer='classic')).json()
+        fts = self.client.get('/api/rag/search/', dict(params, scorer='fts')).json()
+        self.assertEqual(fts['scorer'], 'fts')
+        self.assertEqual(len(fts['matches']), 3)
+        self.assertGreater(classic['analysis']['total_matches'], 3)
+        self.assertEqual(self.without_timings(fts)['analysis'], self.without_timings(classic)['analysis'])
+
+
+class PushdownParityTests(FakeSupabaseTestCase):
+    """Pushed-down scans must rank exactly what a full scan ranks, accented text included"""
+    accented = [
+        'Français', 'straße', 'ﬁnanzas', 'cœur', 'Ýngrid', 'Ångström', 'niño', 'garçon', 'Ærø', 'façade',
+    ]
+    query = 'francais strae finanzas cur yngrid angstrom nino garcon facade'
+
+    @classmethod
+    def make_tables(cls):
+        tables = make_supabase_tables()
+        rng = random.Random(15)
+        for row in tables['profile'][::7]:
+            row['experience'][0]['description'] += ' ' + rng.choice(cls.accented)
+            row['personal_information']['summary'] = rng.choice(cls.accented) + ' ' + row['personal_information']['summary']
+        return tables
+
+    def ask(self, **params):
+        response = self.client.get('/api/rag/ask/', dict({'q': self.query, 'limit': 50, 'scorer': 'classic'}, **params))
+        self.assertEqual(response.status_code, 200)
+        data = self.without_timings(response.json())
+        return data, {k: v for k, v in data.items() if k not in ('scanned', 'pushdown')}
+
+    def test_pushdown_matches_full_scan(self):
+        with mock.patch.object(rag_fetch, 'PUSHDOWN_COLUMN', 'search_text'):
+            full, full_body = self.ask(pushdown='false')
+            full_rows, FakeSupabaseHandler.rows_served = FakeSupabaseHandler.rows_served, 0
+            pushed, pushed_body = self.ask(pushdown='true')
+        self.assertTrue(pushed['pushdown'])
+        self.assertTrue(any('search_text.ilike' in path for path in FakeSupabaseHandler.paths))
+        self.assertLess(FakeSupabaseHandler.rows_served, full_rows / 2)
+        self.assertGreater(len(full['matches']), 10)
+        self.assertEqual(pushed_body, full_body)
+
+    def test_no_pushdown_without_the_normalized_column(self):
+        with mock.patch.object(rag_fetch, 'PUSHDOWN_COLUMN', ''):
+            self.assertEqual(rag_fetch.pushdown_filter(['francais']), '')
+            data, _ = self.ask(pushdown='true')
+        self.assertFalse(data['pushdown'])
+        self.assertFalse(any('or=' in path for path in FakeSupabaseHandler.paths))
+
+
+class ProfileReplicaTests(FakeSupabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeSupabaseHandler.tables = self.make_tables()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.replica = ProfileReplica(os.path.join(self.tmp.name, 'replica.sqlite3'))
+        self.base, self.headers = supabase_source()
+
+    def tearDown(self):
+        self.replica.sync_lock.release()
+        self.tmp.cleanup()
+
+    def replica_rows(self, filters=None):
+        return [row for page in self.replica.pages(filters, page_size=40) for row in page]
+
+    @staticmethod
+    def selected(rows):
+        """Table rows as the sync selects them"""
+        return [{column: row.get(column) for column in PROFILE_SELECT.split(',')} for row in rows]
+
+    def test_delta_sync_fetches_rows_past_the_watermark(self):
+        table = FakeSupabaseHandler.tables['profile']
+        self.assertEqual(self.replica.sync(self.base, self.headers, full=True), len(table))
+        self.assertEqual(self.replica_rows(), self.selected(table))
+
+        rng = random.Random(3)
+        added = [dict(make_profile(rng, profile_id), status='pending', vacant_id=1) for profile_id in (301, 305, 340)]
+        table.extend(added)
+        FakeSupabaseHandler.paths = []
+        self.assertEqual(self.replica.sync(self.base, self.headers), len(added))
+        self.assertTrue(all('id=gt.300' in path for path in FakeSupabaseHandler.paths))
+        self.assertEqual(self.replica_rows(), self.selected(table))
+        self.assertEqual(self.replica.status()['watermark_id'], 340)
+        pending = [row for row in table if row['status'] == 'pending']
+        self.assertEqual(self.replica_rows({'status': 'pending'}), self.selected(pending))
+        self.assertEqual(self.replica.version({'status': 'pending'}), (len(pending), 340))
+
+    def test_full_resync_drops_deleted_rows(self):
+        table = FakeSupabaseHandler.tables['profile']
+        self.replica.sync(self.base, self.headers, full=True)
+        del table[10:20]
+        table[0] = dict(table[0], status='accepted', vacant_id=3)
+
+        # A delta sync only looks past the watermark
+        self.assertEqual(self.replica.sync(self.base, self.headers), 0)
+        self.assertEqual(len(self.replica_rows()), len(table) + 10)
+
+        self.replica.sync(self.base, self.headers, full=True)
+        self.assertEqual(self.replica_rows(), self.selected(table))
+        self.assertEqual(self.replica.version({'vacant_id': 3})[0], sum(row['vacant_id'] == 3 for row in table))
+
+    def test_ready_and_staleness(self):
+        self.assertFalse(self.replica.ready())
+        status = self.replica.status()
+        self.assertEqual((status['rows'], status['synced_at'], status['staleness_sec']), (0, None, None))
+
+        # A delta sync alone does not make the replica ready: deletions were never checked
+        self.replica.sync(self.base, self.headers)
+        self.assertFalse(self.replica.ready())
+        self.replica.sync(self.base, self.headers, full=True)
+        self.assertTrue(self.replica.ready())
+        synced_at = self.replica.status()['synced_at']
+        with mock.patch('core.rag_replica.time.time', return_value=synced_at + 90):
+            self.assertEqual(self.replica.status()['staleness_sec'], 90.0)
+
+        # A failed sync keeps the data and reports the error
+        with mock.patch('core.rag_replica.fetch_pages', side_effect=URLError('connection refused')):
+            with self.assertRaises(URLError):
+                self.replica.sync(self.base, self.headers)
+        status = self.replica.status()
+        self.assertTrue(self.replica.ready())
+        self.assertEqual(status['rows'], len(FakeSupabaseHandler.tables['profile']))
+        self.assertTrue(status['last_error'])
+
+    def test_status_reads_meta_at_most_once_per_ttl(self):
+        self.replica.sync(self.base, self.headers, full=True)
+        rows = len(FakeSupabaseHandler.tables['profile'])
+        with mock.patch.object(self.replica, '_connect', wraps=self.replica._connect) as connect:
+            for _ in range(20):
+                self.assertTrue(self.replica.ready())
+                self.assertEqual(self.replica.status()['rows'], rows)
+            self.assertEqual(connect.call_count, 1)
+            with mock.patch('core.rag_replica.REPLICA_STATUS_TTL_SEC', 0):
+                self.replica.status()
+            self.assertEqual(connect.call_count, 2)
+
+        # Another process' sync shows up once the TTL has passed
+        other = ProfileReplica(self.replica.path)
+        FakeSupabaseHandler.tables['profile'].append(dict(make_profile(random.Random(8), 400), status='pending', vacant_id=1))
+        other.sync(self.base, self.headers)
+        self.assertEqual(self.replica.status()['rows'], rows)
+        with mock.patch('core.rag_replica.REPLICA_STATUS_TTL_SEC', 0):
+            self.assertEqual(self.replica.status()['rows'], rows + 1)
+
+    def test_only_the_lock_holder_syncs(self):
+        other = ProfileReplica(self.replica.path)
+        try:
+            self.assertTrue(sync_turn(self.replica))
+            self.assertTrue(self.replica.ready())
+            self.assertTrue(self.replica.status()['sync_leader'])
+            FakeSupabaseHandler.paths = []
+            self.assertFalse(sync_turn(other))
+            self.assertEqual(FakeSupabaseHandler.paths, [])
+            self.assertFalse(other.status()['sync_leader'])
+
+            # The lock is released when the leader goes away
+            self.replica.sync_lock.release()
+            self.assertTrue(sync_turn(other))
+            self.assertFalse(SyncLock(self.replica.path).acquire())
+        finally:
+            other.sync_lock.release()
+
+
+class RAGResultCacheTests(FakeSupabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        FakeSupabaseHandler.tables = self.make_tables()
+        caches['rag'].clear()
+        self.cache = RAGResultCache()
+        self.base, self.headers = supabase_source()
+        patcher = mock.patch('core.rag_cache.VERSION_TTL_SEC', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pending(self):
+        return [row for row in FakeSupabaseHandler.tables['profile'] if row['status'] == 'pending']
+
+    def version(self):
+        return self.cache.version(self.base, self.headers, 'profile', {'status': 'pending'})
+
+    def test_version_changes_with_count_and_max_id(self):
+        pending = self.pending()
+        version = self.version()
+        self.assertEqual(version, f'{len(pending)}:{pending[-1]["id"]}')
+        key = self.cache.key('ask', analyze_query('python'), limit=5)
+        self.cache.set(key, version, {'matches': [1]})
+        hit = self.cache.get(key, self.version())
+        self.assertEqual((hit['matches'], hit['cached']), ([1], True))
+
+        # A new row changes the count
+        table = FakeSupabaseHandler.tables['profile']
+        table.append(dict(make_profile(random.Random(1), 500), status='pending', vacant_id=1))
+        self.assertIsNone(self.cache.get(key, self.version()))
+        self.assertEqual(self.cache.metrics['invalidations'], 1)
+
+        # One row deleted and one added: same count, new max id
+        self.cache.set(key, self.version(), {'matches': [2]})
+        count = len(self.pending())
+        table.remove(self.pending()[0])
+        table.append(dict(make_profile(random.Random(2), 501), status='pending', vacant_id=1))
+        version = self.version()
+        self.assertEqual(version, f'{count}:501')
+        self.assertIsNone(self.cache.get(key, version))
+        self.assertEqual(self.cache.metrics['invalidations'], 2)
+        # Unreadable version: never served from the cache
+        self.assertIsNone(self.cache.get(key, None))
+
+    def test_ask_responses_carry_the_cached_flag(self):
+        params = {'q': 'python docker', 'limit': 5, 'analysis': 'false'}
+        with mock.patch('core.rag_cache.CACHE_ENABLED', True):
+            first = self.client.get('/api/rag/ask/', params).json()
+            FakeSupabaseHandler.paths = []
+            second = self.client.get('/api/rag/ask/', params).json()
+            # A hit costs the version probe only
+            self.assertEqual(len(FakeSupabaseHandler.paths), 1)
+            self.assertIn('order=id.desc&limit=1', FakeSupabaseHandler.paths[0])
+            bypass = self.client.get('/api/rag/ask/', dict(params, cache='false')).json()
+            FakeSupabaseHandler.tables['profile'].append(
+                dict(make_profile(random.Random(3), 600), status='pending', vacant_id=2)
+            )
+            after_insert = self.client.get('/api/rag/ask/', params).json()
+        self.assertIs(first['cached'], False)
+        self.assertIs(second['cached'], True)
+        self.assertNotIn('cached', bypass)
+        self.assertIs(after_insert['cached'], False)
+        second.pop('cache_age_sec')
+        self.assertEqual(dict(second, cached=False), first)
+
+
+# URLconf of AsyncViewTests: the async views on the paths rag_urls gives them with AI_ASYNC_VIEWS=true
+urlpatterns = [
+    path('api/rag/health/', AsyncSupabaseRagHealthView.as_view()),
+    path('api/rag/ask/', AsyncSupabaseAskView.as_view()),
+    path('api/profile/ask/', csrf_exempt(AsyncProfileAIAskView.as_view())),
+    path('api/ranking/', csrf_exempt(AsyncRankingView.as_view())),
+]
+
+
+class AsyncViewTests(FakeSupabaseTestCase):
+    """Every async view answers like its sync counterpart (AsyncClient against the fake Supabase)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.openai = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+        threading.Thread(target=cls.openai.serve_forever, daemon=True).start()
+        cls.openai_env = mock.patch.dict(os.environ, {
+            'OPENAI_API_KEY': 'test',
+            'OPENAI_BASE_URL': f'http://127.0.0.1:{cls.openai.server_port}/v1',
+        })
+        cls.openai_env.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.openai_env.stop()
+        cls.openai.shutdown()
+        cls.openai.server_close()
+        super().tearDownClass()
+
+    def both(self, method, path, data):
+        """(sync, async) responses to the same request"""
+        if method == 'get':
+            sync = self.client.get(path, data)
+            with override_settings(ROOT_URLCONF='core.tests'):
+                asynchronous = async_to_sync(self.async_client.get)(path, data)
+        else:
+            sync = self.client.post(path, data, format='json')
+            with override_settings(ROOT_URLCONF='core.tests'):
+                asynchronous = async_to_sync(self.async_client.post)(path, json.dumps(data), content_type='application/json')
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        return sync.json(), json.loads(asynchronous.content)
+
+    def test_health(self):
+        sync, asynchronous = self.both('get', '/api/rag/health/', {})
+        keys = ('ok', 'env', 'supabase', 'company_total', 'profile_total', 'total')
+        self.assertEqual({k: asynchronous[k] for k in keys}, {k: sync[k] for k in keys})
+        self.assertEqual(sync['profile_total'], len(FakeSupabaseHandler.tables['profile']))
+        self.assertIn('async', asynchronous)
+
+    def test_ask(self):
+        for params in ({'q': 'python developer', 'limit': 5}, {'q': 'react sql', 'limit': 4, 'scorer': 'bm25f'},
+                       {'q': 'docker', 'limit': 3, 'scorer': 'fts', 'analysis': 'false'}):
+            sync, asynchronous = self.both('get', '/api/rag/ask/', params)
+            self.assertTrue(sync['matches'])
+            self.assertEqual(self.without_timings(asynchronous), self.without_timings(sync))
+
+    def test_profile_ask(self):
+        sync, asynchronous = self.both('post', '/api/profile/ask/', {'message': 'react sql', 'limit': 2, 'llm_cache': False})
+        self.assertEqual(sync['answer'], 'Ana sabe python.')
+        self.assertEqual(self.without_timings(asynchronous), self.without_timings(sync))
+
+    def test_ranking(self):
+        for body in ({'vacant_id': 2, 'limit': 3, 'analysis': True}, {'vacant_id': 99}):
+            sync, asynchronous = self.both('post', '/api/ranking/', body)
+            self.assertEqual(self.without_timings(asynchronous), self.without_timings(sync))
+
+    def test_streamed_scans_match(self):
+        # AI_RAG_STREAM_JSON batches: the async scan decodes the body with the same parser
+        url = os.environ['NEXT_PUBLIC_SUPABASE_URL'] + '/rest/v1/profile?select=id,skills&status=eq.pending'
+        headers = supabase_source()[1]
+
+        async def collect():
+            return [page async for page in afetch_pages(url, headers, page_size=40, workers=2)]
+
+        with mock.patch.object(rag_fetch, 'STREAM_JSON', True), mock.patch.object(rag_fetch, 'STREAM_BATCH', 15):
+            sync = list(fetch_pages(url, headers, page_size=40, workers=2))
+            asynchronous = async_to_sync(collect)()
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(max(len(page) for page in sync), 15)
+        pending = [row['id'] for row in FakeSupabaseHandler.tables['profile'] if row['status'] == 'pending']
+        self.assertEqual([row['id'] for page in sync for row in page], pending)
@@ -5,8 +5,7 @@ from core.models import persons
 from .serializers import PersonSerializer
 import os
 import json
-from pathlib import Path
-from urllib.request import Request, urlopen
+from urllib.request import Request
 from urllib.error import HTTPError, URLError
 import time
 import re
@@ -15,8 +14,39 @@ from .rag_analyzer import (
     analyze_profile_match, 
     generate_analysis_summary,
     normalize_text,
-    tokenize_text
+    tokenize_text,
+    rank_profile_index,
+    QueryMatcher,
+    tokenized_profile_cache,
+    bm25f_rank,
+    resolve_scorer,
+    TopKCollector,
+    AnalysisSummaryAccumulator,
+    score_profile_match
 )
+from .rag_index import profile_index
+from .rag_sparse import get_sparse_scorer
+from .rag_parallel import score_rows_parallel, parallel_batch_size, parallel_stats
+from .http_client import load_env, urlopen, http_client
+from .rag_fetch import (
+    PAGE_SIZE,
+    ScanCoverage,
+    fetch_pages,
+    fetch_stats,
+    iter_keyset,
+    pushdown_filter,
+    rag_deadline,
+    resolve_pushdown,
+    track_pages
+)
+from .rag_replica import get_replica
+from .rag_fts import get_fts_index
+from .rag_cache import rag_result_cache, resolve_cache
+from .llm_cache import get_llm_cache, resolve_llm_cache
+from .rag_context import estimate_prompt_tokens, pack_contexts
+from .rag_health import get_health_monitor
+from .circuit import breaker_stats
+from .rag_stream import STREAM_RENDERER_CLASSES, StreamAbort, progress_payload, resolve_stream, respond, result_events
 
 class GetAllPersonsView(APIView):
     def get(self, request):
@@ -60,22 +90,6 @@ class DeletePersonView(APIView):
             return Response({"error": "Person not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-def _load_env():
-    cur = Path(__file__).resolve()
-    for i in range(1, 8):
-        base = cur.parents[i]
-        p = base / '.env'
-        if p.exists():
-            for line in p.read_text(encoding='utf-8').splitlines():
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    k, v = line.split('=', 1)
-                    os.environ.setdefault(k.strip(), v.strip())
-            break
-
-
 def _flatten_text(obj):
     parts = []
     def walk(x):
@@ -91,9 +105,152 @@ def _flatten_text(obj):
     return ' '.join(parts)
 
 
+def _index_page(rows):
+    """Add a fetched page to the shared index and return its ids"""
+    page_ids = set()
+    for row in rows:
+        if row.get('id') is not None:
+            profile_index.add(row)
+            page_ids.add(row['id'])
+    return page_ids
+
+
+def _index_candidates(rows, query_analysis, matcher=None, page_ids=None):
+    """Index a fetched page and return the ids worth scoring (None = score all)"""
+    if page_ids is None:
+        page_ids = _index_page(rows)
+    if not query_analysis['tokens']:
+        return None
+    return {profile_id for profile_id, _ in rank_profile_index(profile_index, query_analysis, page_ids, matcher)}
+
+
+def _skip_row(row, candidate_ids):
+    return candidate_ids is not None and row.get('id') is not None and row['id'] not in candidate_ids
+
+
+PROFILE_SELECT = 'id,personal_information,experience,education,skills,projects'
+
+
+def _profile_pages(base, headers, select, filters, deadline=None, pushdown='', coverage=None):
+    """
+    Pages of profile rows matching `filters` ({column: value or list}): from the
+    local replica once it is synced, otherwise from Supabase. Returns
+    (pages, replica status or None); id ranges left out go to `coverage`.
+    """
+    replica = get_replica()
+    if replica is not None and replica.ready():
+        return track_pages(replica.pages(filters), coverage), replica.status()
+    return fetch_pages(_profile_url(base, select, filters, pushdown), headers, deadline=deadline, coverage=coverage), None
+
+
+def _profile_url(base, select, filters, pushdown=''):
+    """PostgREST profile query for fetch_pages (filters: {column: value or list})"""
+    params = f'?select={select}'
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple)):
+            params += f'&{column}=in.({",".join(str(v) for v in value)})'
+        else:
+            params += f'&{column}=eq.{value}'
+    return base.rstrip('/') + '/rest/v1/profile' + params + pushdown
+
+
+def _supabase_http_error(e):
+    """Error body for a failed Supabase request"""
+    try:
+        err_body = e.read().decode('utf-8')
+    except Exception:
+        err_body = ''
+    return {"error": "Supabase HTTPError", "status": e.code, "detail": err_body}
+
+
+def _score_page(rows, candidate_ids, query_analysis, matcher, top_k, summary_acc=None, keep_all=False):
+    """
+    Classic scoring of a fetched page into top_k (payload: the row), on the
+    process pool when it is enabled and the page is large enough
+    """
+    rows = [row for row in rows if not _skip_row(row, candidate_ids)]
+    if score_rows_parallel(rows, query_analysis, top_k, summary_acc, keep_all):
+        return
+    for row in rows:
+        # Cheap scoring pass; detailed analysis only for the winners
+        match_score = score_profile_match(row, query_analysis, matcher, tokenized_profile_cache)
+        if match_score['total_score'] > 0 or keep_all:
+            if summary_acc is not None:
+                summary_acc.add(match_score)
+            top_k.add(match_score['total_score'], row.get('id'), row)
+
+
+def _detail_top_k(top_k, query_analysis, matcher, build_entry):
+    """
+    Second phase of a ranking: full analyze_profile_match (snippets, token lists)
+    for the rows that made the top-k, turned into response entries
+    """
+    detailed = TopKCollector(top_k.k)
+    for profile_id, score, row in top_k.items():
+        match_analysis = analyze_profile_match(row, query_analysis, matcher, tokenized_profile_cache)
+        detailed.add(score, profile_id, build_entry(row, match_analysis))
+    detailed.count = top_k.count
+    return detailed
+
+
+def _collect_top_k_rows(rows, query_analysis, rows_by_id, page_ids=None, scorer=None):
+    """
+    Index a fetched page and keep the rows sharing a token with the query
+    (the 'fts' scorer also loads the whole page into its FTS5 table).
+    Returns the rows kept from this page.
+    """
+    if page_ids is None:
+        page_ids = _index_page(rows)
+    if scorer == 'fts':
+        fts_index = get_fts_index('profile')
+        if fts_index is not None:
+            fts_index.add_rows(rows)
+    candidate_ids = profile_index.candidates(query_analysis['tokens'], page_ids)
+    kept = [row for row in rows if row.get('id') in candidate_ids]
+    for row in kept:
+        rows_by_id[row['id']] = row
+    return kept
+
+
+def _rank_top_k(scorer, rows_by_id, query_analysis, limit, matcher=None):
+    """
+    Top-`limit` over the scanned rows with an index-backed scorer ('bm25f',
+    'sparse' or 'fts'), with the usual profile analysis attached to the winners only
+    """
+    scanned_ids = set(rows_by_id)
+    snippets = {}
+    fts_index = get_fts_index('profile') if scorer == 'fts' else None
+    if scorer == 'bm25f':
+        ranked, stats = bm25f_rank(profile_index, query_analysis, limit, scanned_ids)
+    elif fts_index is not None:
+        found, stats = fts_index.search(query_analysis, limit, scanned_ids)
+        ranked = [(profile_id, score) for profile_id, score, _ in found]
+        snippets = {profile_id: snippet for profile_id, _, snippet in found}
+    else:
+        sparse_scorer = get_sparse_scorer(profile_index) if scorer == 'sparse' else None
+        if sparse_scorer is not None:
+            ranked, stats = sparse_scorer.top_k(query_analysis, limit, scanned_ids)
+        else:
+            # numpy/scipy (or FTS5) not available: classic scores from the pure Python index path
+            ranked = rank_profile_index(profile_index, query_analysis, scanned_ids, matcher)
+            stats = {'scorer': 'classic', 'candidates': len(ranked), 'scored': len(ranked)}
+            ranked = ranked[:limit]
+    results = []
+    for profile_id, score in ranked:
+        row = rows_by_id[profile_id]
+        match_analysis = analyze_profile_match(row, query_analysis, matcher, tokenized_profile_cache)
+        if scorer == 'bm25f' or profile_id in snippets:
+            match_analysis['classic_score'] = match_analysis['total_score']
+            match_analysis['total_score'] = score
+        if profile_id in snippets:
+            match_analysis['fts_snippet'] = snippets[profile_id]
+        results.append((row, match_analysis))
+    return results, stats
+
+
 class SupabaseRagSearchView(APIView):
     def get(self, request):
-        _load_env()
+        load_env()
         base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
         key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
         q = (request.GET.get('q') or '').strip()
@@ -112,96 +269,133 @@ class SupabaseRagSearchView(APIView):
         
         # Analyze query first
         query_analysis = analyze_query(q)
+        # scorer=fts ranks the scanned companies in the company FTS5 table instead
+        fts_index = None
+        if resolve_scorer(request.GET.get('scorer')) == 'fts' and query_analysis['tokens']:
+            fts_index = get_fts_index('company')
+        fts_companies = {}
+        
+        # Same query and parameters against an unchanged company table: cached response
+        cache_key = version = None
+        if resolve_cache(request.GET.get('cache')):
+            cache_key = rag_result_cache.key('search', query_analysis, status=status_f, limit=limit,
+                                             analysis=include_analysis, scorer=bool(fts_index))
+            version = rag_result_cache.version(base, headers, 'company')
+            cached = rag_result_cache.get(cache_key, version)
+            if cached is not None:
+                return Response(cached)
         
         # Enhanced RAG search with company data
         url_base = base.rstrip('/') + '/rest/v1/company'
-        params = '?select=*&limit=1000&offset='
-        offset = 0
-        all_matches = []
+        top_k = TopKCollector(limit)
+        summary_acc = AnalysisSummaryAccumulator()
         total = 0
-        deadline = time.time() + float(os.environ.get('AI_RAG_BUDGET_SEC', '8'))
+        deadline = rag_deadline()
+        coverage = ScanCoverage()
         start_time = time.time()
         
-        while True:
-            url = url_base + params + str(offset)
-            req = Request(url, headers=headers)
-            try:
-                with urlopen(req, timeout=8) as r:
-                    body = r.read().decode('utf-8')
-                    companies = json.loads(body)
-                    if not isinstance(companies, list) or not companies:
-                        break
+        try:
+            for companies in fetch_pages(url_base + '?select=*', headers, deadline=deadline, coverage=coverage):
+                for company in companies:
+                    # Convert company data to profile format for analysis
+                    profile_data = self._convert_company_to_profile(company)
+                    if fts_index is not None:
+                        fts_companies[company.get('id')] = (company, profile_data)
+                        if not include_analysis:
+                            continue
                     
-                    for company in companies:
-                        # Convert company data to profile format for analysis
-                        profile_data = self._convert_company_to_profile(company)
-                        
-                        # Use enhanced analyzer for detailed matching
-                        match_analysis = analyze_profile_match(profile_data, query_analysis)
-                        
-                        if match_analysis['total_score'] > 0 or not q:  # Include all if no query
-                            enhanced_match = {
-                                'id': company.get('id'),
-                                'score': match_analysis['total_score'],
-                                'company': company,
-                                'personal_information': profile_data.get('personal_information', {}),
-                                'skills': profile_data.get('skills', []),
-                                'experience': profile_data.get('experience', []),
-                                'education': profile_data.get('education', []),
-                                'projects': profile_data.get('projects', []),
-                                'overall_coverage': match_analysis.get('overall_coverage', 0),
-                                'field_scores': match_analysis.get('field_scores', {}),
-                                'matched_tokens': match_analysis.get('matched_tokens', []),
-                                'missing_tokens': match_analysis.get('missing_tokens', []),
-                                'field_snippets': match_analysis.get('field_snippets', {})
-                            }
-                            
-                            if include_analysis:
-                                enhanced_match['analysis'] = match_analysis
-                            
-                            all_matches.append(enhanced_match)
+                    # Cheap scoring pass; detailed analysis only for the winners
+                    match_score = score_profile_match(profile_data, query_analysis)
                     
-                    total += len(companies)
-                    offset += len(companies)
-                    if len(companies) < 1000:
-                        break
-                    if time.time() > deadline:
-                        break
-                        
-            except HTTPError as e:
-                try:
-                    err_body = e.read().decode('utf-8')
-                except Exception:
-                    err_body = ''
-                return Response({"error": "Supabase HTTPError", "status": e.code, "detail": err_body}, status=502)
-            except URLError:
-                return Response({"error": "Supabase URLError"}, status=502)
+                    if match_score['total_score'] > 0 or not q:  # Include all if no query
+                        if include_analysis:
+                            # Every matching company, whichever scorer ranks them
+                            summary_acc.add(match_score)
+                        if fts_index is None:
+                            top_k.add(match_score['total_score'], company.get('id'), (company, profile_data))
+                
+                if fts_index is not None:
+                    fts_index.add_many((company.get('id'), fts_companies[company.get('id')][1]) for company in companies)
+                total += len(companies)
+                if deadline.expired():
+                    break
+                    
+        except HTTPError as e:
+            try:
+                err_body = e.read().decode('utf-8')
+            except Exception:
+                err_body = ''
+            return Response({"error": "Supabase HTTPError", "status": e.code, "detail": err_body}, status=502)
+        except URLError:
+            return Response({"error": "Supabase URLError"}, status=502)
         
-        # Sort by score (descending) and then by ID
-        all_matches.sort(key=lambda x: (-x['score'], x['id'] or 0))
-        timed_out = time.time() > deadline
+        scorer_stats = None
+        if fts_index is not None:
+            found, scorer_stats = fts_index.search(query_analysis, limit, fts_companies)
+            for company_id, score, snippet in found:
+                company, profile_data = fts_companies[company_id]
+                match_analysis = analyze_profile_match(profile_data, query_analysis)
+                match_analysis.update(classic_score=match_analysis['total_score'], total_score=score, fts_snippet=snippet)
+                top_k.add(score, company_id, (company, profile_data, match_analysis))
+        
+        # Winners come out sorted by score (descending) and then by ID
+        timed_out = deadline.expired()
+        skipped = coverage.skipped()
         elapsed_time = time.time() - start_time
         
-        # Prepare response
-        top_matches = all_matches[:limit]
+        # Prepare response, with the detailed analysis for the returned companies only
+        top_matches = []
+        for company, profile_data, *ranked in top_k.payloads():
+            match_analysis = ranked[0] if ranked else analyze_profile_match(profile_data, query_analysis)
+            top_matches.append(self._match_entry(company, profile_data, match_analysis, include_analysis))
         
         response_data = {
             "answer": f"Found {len(top_matches)} relevant companies",
             "matches": top_matches,
             "scanned": total,
             "query": q,
-            "partial": timed_out,
+            "partial": timed_out or bool(skipped),
+            "skipped": skipped,
             "used": len(top_matches),
-            "status_code": 200
+            "status_code": 200,
+            "scorer": 'fts' if fts_index is not None else 'classic'
         }
+        if scorer_stats:
+            response_data['scorer_stats'] = scorer_stats
         
         # Include comprehensive analysis if requested
         if include_analysis:
-            analysis_summary = generate_analysis_summary(all_matches, query_analysis, total, elapsed_time)
+            analysis_summary = summary_acc.summary(query_analysis, total, elapsed_time)
             response_data['analysis'] = analysis_summary
         
+        if cache_key:
+            response_data['cached'] = False
+            if not response_data['partial']:
+                rag_result_cache.set(cache_key, version, response_data)
+        
         return Response(response_data)
     
+    def _match_entry(self, company, profile_data, match_analysis, include_analysis):
+        enhanced_match = {
+            'id': company.get('id'),
+            'score': match_analysis['total_score'],
+            'company': company,
+            'personal_information': profile_data.get('personal_information', {}),
+            'skills': profile_data.get('skills', []),
+            'experience': profile_data.get('experience', []),
+            'education': profile_data.get('education', []),
+            'projects': profile_data.get('projects', []),
+            'overall_coverage': match_analysis.get('overall_coverage', 0),
+            'field_scores': match_analysis.get('field_scores', {}),
+            'matched_tokens': match_analysis.get('matched_tokens', []),
+            'missing_tokens': match_analysis.get('missing_tokens', []),
+            'field_snippets': match_analysis.get('field_snippets', {})
+        }
+        
+        if include_analysis:
+            enhanced_match['analysis'] = match_analysis
+        return enhanced_match
+    
     def _convert_company_to_profile(self, company):
         """Convert company data to profile format for RAG analysis"""
         return {
@@ -222,7 +416,7 @@ class SupabaseRagSearchView(APIView):
 
 class SupabaseRagHealthView(APIView):
     def get(self, request):
-        _load_env()
+        load_env()
         base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
         key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
         if not base or not key:
@@ -261,21 +455,32 @@ class SupabaseRagHealthView(APIView):
                 "supabase": True, 
                 "company_total": total,
                 "profile_total": profile_total,
-                "total": total + profile_total
+                "total": total + profile_total,
+                "token_cache": tokenized_profile_cache.stats(),
+                "profile_index": profile_index.stats(),
+                "parallel": parallel_stats(),
+                "http": http_client.stats(),
+                "breakers": breaker_stats(),
+                "fetch": fetch_stats(),
+                "result_cache": rag_result_cache.stats()
             })
         except Exception as e:
             return Response({"ok": False, "env": True, "supabase": False, "error": str(e)}, status=502)
 
 
 class SupabaseAskView(APIView):
+    renderer_classes = STREAM_RENDERER_CLASSES
+    
     def get(self, request):
-        _load_env()
+        load_env()
         base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
         key = os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
         q = (request.GET.get('q') or '').strip()
         limit = int(request.GET.get('limit') or 5)
         status_f = request.GET.get('status') or 'pending'
         include_analysis = request.GET.get('analysis', 'true').lower() == 'true'
+        scorer = resolve_scorer(request.GET.get('scorer'))
+        stream = resolve_stream(request, request.GET.get('stream'))
         
         if not base or not key:
             return Response({"error": "Missing Supabase env"}, status=500)
@@ -285,59 +490,64 @@ class SupabaseAskView(APIView):
             'Authorization': 'Bearer ' + key,
         }
         
-        # Analyze query first
+        # Analyze query first; a query without tokens lists every profile
         query_analysis = analyze_query(q)
+        search = _ProfileSearch(query_analysis, scorer, limit, include_analysis, keep_all=not q)
+        if resolve_pushdown(request.GET.get('pushdown')):
+            search.pushdown = pushdown_filter(query_analysis['tokens'])
         
-        url_base = base.rstrip('/') + '/rest/v1/profile'
-        params = f'?select=id,personal_information,experience,education,skills,projects&status=eq.{status_f}&limit=1000&offset='
-        offset = 0
-        all_matches = []
-        start_time = time.time()
+        # Same query and parameters against unchanged profiles: cached response
+        cache_key = version = None
+        if resolve_cache(request.GET.get('cache')):
+            cache_key = self._cache_key(search, status_f)
+            version = rag_result_cache.version(base, headers, 'profile', {'status': status_f})
+            cached = rag_result_cache.get(cache_key, version)
+            if cached is not None:
+                return respond(result_events(cached), stream)
         
-        while True:
-            url = url_base + params + str(offset)
-            req = Request(url, headers=headers)
+        def events():
+            deadline = rag_deadline()
+            start_time = time.time()
             try:
-                with urlopen(req, timeout=8) as r:
-                    rows = json.loads(r.read().decode('utf-8'))
-                    if not rows:
-                        break
-                    
-                    for row in rows:
-                        # Use enhanced analyzer for detailed matching
-                        match_analysis = analyze_profile_match(row, query_analysis)
-                        
-                        if match_analysis['total_score'] > 0 or not q:  # Include all if no query
-                            # Create enhanced match with snippets
-                            text = ''
-                            for k in ('personal_information','experience','education','skills','projects'):
-                                if k in row and row[k] is not None:
-                                    text += ' ' + _flatten_text(row[k])
-                            
-                            enhanced_match = {
-                                'id': row.get('id'),
-                                'score': match_analysis['total_score'],
-                                'snippet': text[:600],
-                                'personal_information': row.get('personal_information'),
-                                'skills': row.get('skills'),
-                                'projects': row.get('projects'),
-                            }
-                            
-                            if include_analysis:
-                                enhanced_match['analysis'] = match_analysis
-                            
-                            all_matches.append(enhanced_match)
-                    
-                    offset += len(rows)
-                    if len(rows) < 1000:
+                pages, search.replica = _profile_pages(base, headers, PROFILE_SELECT, {'status': status_f}, deadline,
+                                                       search.pushdown, search.coverage)
+                if search.replica:
+                    search.pushdown = ''
+                for rows in pages:
+                    search.feed(rows)
+                    if stream:
+                        yield 'progress', search.progress()
+                    if deadline.expired():
                         break
-            except Exception:
-                break
+            except Exception as e:
+                # Reported in `skipped`; the ranking covers the pages that did arrive
+                search.coverage.fail(e, deadline)
+            
+            top_k, scorer_stats = search.rank(lambda row, ma: self._match_entry(row, ma, include_analysis))
+            response_data = self._response_data(search, top_k, scorer_stats, q, deadline.expired())
+            if cache_key:
+                response_data['cached'] = False
+            yield 'result', response_data
+            
+            # Include comprehensive analysis if requested
+            if include_analysis:
+                analysis_summary = search.summary_acc.summary(query_analysis, top_k.count, time.time() - start_time)
+                yield 'analysis', analysis_summary
+                response_data = dict(response_data, analysis=analysis_summary)
+            
+            if cache_key and not response_data['partial']:
+                rag_result_cache.set(cache_key, version, response_data)
         
-        # Sort by score (descending) and then by ID
-        all_matches.sort(key=lambda x: (-x['score'], x['id'] or 0))
-        top_matches = all_matches[:limit]
-        elapsed_time = time.time() - start_time
+        return respond(events(), stream)
+    
+    @staticmethod
+    def _cache_key(search, status_f):
+        return rag_result_cache.key('ask', search.query, status=status_f, limit=search.limit, analysis=search.include_analysis,
+                                    scorer=search.top_k_scorer, pushdown=bool(search.pushdown))
+    
+    def _response_data(self, search, top_k, scorer_stats, q, timed_out=False):
+        # Winners come out sorted by score (descending) and then by ID
+        top_matches = top_k.payloads()
         
         # Create answer from top matches
         answer = ' '.join([x['snippet'] for x in top_matches])[:1000]
@@ -347,39 +557,95 @@ class SupabaseAskView(APIView):
             "matches": [{'id': str(match['id']), 'score': match['score'], 'snippet': match['snippet']} for match in top_matches],
             "query": q,
             "used": len(top_matches),
-            "scanned": len(all_matches),
+            "scanned": top_k.count,
             "status_code": 200,
-            "partial": False
+            **search.scan_report(timed_out),
+            "scorer": search.top_k_scorer or 'classic',
+            "pushdown": bool(search.pushdown)
         }
+        if search.replica:
+            response_data['replica'] = search.replica
+        if scorer_stats:
+            response_data['scorer_stats'] = scorer_stats
+        return response_data
+    
+    def _match_entry(self, row, match_analysis, include_analysis):
+        """Create enhanced match with snippets"""
+        text = ''
+        for k in ('personal_information','experience','education','skills','projects'):
+            if k in row and row[k] is not None:
+                text += ' ' + _flatten_text(row[k])
         
-        # Include comprehensive analysis if requested
-        if include_analysis:
-            analysis_summary = generate_analysis_summary(all_matches, query_analysis, len(all_matches), elapsed_time)
-            response_data['analysis'] = analysis_summary
+        enhanced_match = {
+            'id': row.get('id'),
+            'score': match_analysis['total_score'],
+            'snippet': match_analysis.get('fts_snippet') or text[:600],
+            'personal_information': row.get('personal_information'),
+            'skills': row.get('skills'),
+            'projects': row.get('projects'),
+        }
         
-        return Response(response_data)
+        if include_analysis:
+            enhanced_match['analysis'] = match_analysis
+        return enhanced_match
 
 
-def _openai_chat(messages, model='gpt-4.1-mini', temperature=0.2):
-    _load_env()
+def _openai_request(messages, model='gpt-4.1-mini', temperature=0.2, stream=False):
+    """
+    (url, body, headers) of a chat completion call; None without OPENAI_API_KEY.
+    OPENAI_BASE_URL points it at any OpenAI-compatible server.
+    """
+    load_env()
     key = os.environ.get('OPENAI_API_KEY')
     if not key:
-        return 500, ''
-    url = 'https://api.openai.com/v1/chat/completions'
-    body = json.dumps({
+        return None
+    url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/') + '/chat/completions'
+    payload = {
         'model': model,
         'messages': messages,
         'temperature': temperature,
-    }).encode('utf-8')
+    }
+    if stream:
+        payload['stream'] = True
+    body = json.dumps(payload).encode('utf-8')
     headers = {
         'Authorization': 'Bearer ' + key,
         'Content-Type': 'application/json',
     }
+    return url, body, headers
+
+
+def _openai_content(resp):
+    return resp.get('choices', [{}])[0].get('message', {}).get('content', '')
+
+
+def _openai_stream_delta(line):
+    """Content delta carried by one line of a stream=true completion ('' if none)"""
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    line = line.strip()
+    if not line.startswith('data:'):
+        return ''
+    data = line[5:].strip()
+    if data == '[DONE]':
+        return ''
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return ''
+    choices = chunk.get('choices') or [{}]
+    return (choices[0].get('delta') or {}).get('content') or ''
+
+
+def _openai_chat(messages, model='gpt-4.1-mini', temperature=0.2):
+    openai_request = _openai_request(messages, model, temperature)
+    if openai_request is None:
+        return 500, ''
+    url, body, headers = openai_request
     try:
         with urlopen(Request(url, data=body, headers=headers), timeout=15) as r:
             resp = json.loads(r.read().decode('utf-8'))
-            content = resp.get('choices', [{}])[0].get('message', {}).get('content', '')
-            return r.status, content
+            return r.status, _openai_content(resp)
     except HTTPError as e:
         try:
             err = e.read().decode('utf-8')
@@ -390,16 +656,87 @@ def _openai_chat(messages, model='gpt-4.1-mini', temperature=0.2):
         return 0, ''
 
 
+def _cached_openai_chat(messages, use_cache, model='gpt-4.1-mini', temperature=0.2):
+    """
+    _openai_chat through the LLM response cache. Returns (status, content,
+    cache info for the response or None when the cache is off or bypassed).
+    """
+    if not use_cache:
+        status_code, content = _openai_chat(messages, model, temperature)
+        return status_code, content, None
+    llm_cache = get_llm_cache()
+    key = llm_cache.key(model, temperature, messages)
+    hit = llm_cache.get(key)
+    if hit is not None:
+        return 200, hit.pop('content'), dict(hit, hit=True)
+    start = time.time()
+    status_code, content = _openai_chat(messages, model, temperature)
+    latency_ms = (time.time() - start) * 1000
+    if status_code == 200 and content:
+        llm_cache.set(key, content, latency_ms)
+    return status_code, content, {'hit': False, 'latency_ms': round(latency_ms, 1)}
+
+
+def _openai_token_events(messages, use_cache, model='gpt-4.1-mini', temperature=0.2):
+    """
+    Streamed _cached_openai_chat: yields a `token` event per content delta as
+    OpenAI generates it and returns (status, content, cache info) like it.
+    A cached answer is relayed as a single token.
+    """
+    llm_cache = key = None
+    if use_cache:
+        llm_cache = get_llm_cache()
+        key = llm_cache.key(model, temperature, messages)
+        hit = llm_cache.get(key)
+        if hit is not None:
+            content = hit.pop('content')
+            yield 'token', {'text': content}
+            return 200, content, dict(hit, hit=True)
+    openai_request = _openai_request(messages, model, temperature, stream=True)
+    if openai_request is None:
+        return 500, '', None
+    url, body, headers = openai_request
+    start = time.time()
+    parts = []
+    try:
+        with urlopen(Request(url, data=body, headers=headers), timeout=15) as r:
+            for line in r.iter_lines():
+                delta = _openai_stream_delta(line)
+                if delta:
+                    parts.append(delta)
+                    yield 'token', {'text': delta}
+            status_code = r.status
+    except HTTPError as e:
+        try:
+            err = e.read().decode('utf-8')
+        except Exception:
+            err = ''
+        return e.code, err, None
+    except OSError:
+        # Unreachable host, or the stream broke off midway
+        return 0, ''.join(parts), None
+    content = ''.join(parts)
+    latency_ms = (time.time() - start) * 1000
+    if llm_cache is None:
+        return status_code, content, None
+    if status_code == 200 and content:
+        llm_cache.set(key, content, latency_ms)
+    return status_code, content, {'hit': False, 'latency_ms': round(latency_ms, 1)}
+
+
 class AIHealthView(APIView):
     def get(self, request):
-        status_code, content = _openai_chat([
-            {'role': 'system', 'content': 'You are a health check bot.'},
-            {'role': 'user', 'content': 'Reply with OK.'},
-        ])
-        ok = status_code in (200,) and ('OK' in content or content.strip())
+        # Last background probe (no completion per poll); see rag_health
+        monitor = get_health_monitor()
+        openai_status = monitor.status('openai')
+        ok = openai_status['ok']
         return Response({
             'ok': bool(ok),
-            'status_code': status_code,
+            'status_code': openai_status['status_code'],
+            'checked_at': openai_status.get('checked_at'),
+            'age_sec': openai_status.get('age_sec'),
+            'dependencies': monitor.snapshot(),
+            'llm_cache': get_llm_cache().stats(),
         }, status=200 if ok else 502)
 
 
@@ -411,51 +748,58 @@ class AIAskView(APIView):
         if not q:
             return Response({'error': 'Missing q'}, status=400)
         # Reuse Supabase retrieval
-        _load_env()
+        load_env()
         base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
         key = os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
         headers = {
             'apikey': key,
             'Authorization': 'Bearer ' + key,
         }
-        url_base = base.rstrip('/') + '/rest/v1/profile'
-        params = f'?select=id,personal_information,experience,education,skills,projects&status=eq.{status_f}&limit=1000&offset='
-        offset = 0
+        url = base.rstrip('/') + f'/rest/v1/profile?select=id,personal_information,experience,education,skills,projects&status=eq.{status_f}'
         contexts = []
-        deadline = time.time() + float(os.environ.get('AI_RAG_BUDGET_SEC', '8'))
-        while len(contexts) < limit:
-            url = url_base + params + str(offset)
-            try:
-                with urlopen(Request(url, headers=headers), timeout=8) as r:
-                    rows = json.loads(r.read().decode('utf-8'))
-                    if not rows:
-                        break
-                    for row in rows:
-                        ctx = {
-                            'id': row.get('id'),
-                            'personal_information': row.get('personal_information'),
-                            'skills': row.get('skills'),
-                            'projects': row.get('projects'),
-                            'experience': row.get('experience'),
-                            'education': row.get('education'),
-                        }
-                        contexts.append(ctx)
-                        if len(contexts) >= limit:
-                            break
-                    offset += len(rows)
-                    if len(rows) < 1000:
-                        break
-                    if time.time() > deadline:
+        deadline = rag_deadline()
+        coverage = ScanCoverage()
+        span = coverage.add_span()
+        try:
+            # Keyset pages no larger than the number of profiles the prompt takes
+            for rows in iter_keyset(url, headers, max(1, min(limit, PAGE_SIZE)), deadline=deadline, span=span):
+                span.last_id = rows[-1].get('id')
+                for row in rows:
+                    ctx = {
+                        'id': row.get('id'),
+                        'personal_information': row.get('personal_information'),
+                        'skills': row.get('skills'),
+                        'projects': row.get('projects'),
+                        'experience': row.get('experience'),
+                        'education': row.get('education'),
+                    }
+                    contexts.append(ctx)
+                    if len(contexts) >= limit:
                         break
-            except Exception:
-                break
+                if len(contexts) >= limit:
+                    break
+        except Exception as e:
+            coverage.fail(e, deadline)
+        # Enough profiles for the prompt: the rest was not needed, not skipped
+        span.consumed = span.fetched_all or len(contexts) >= limit
+        # Best field snippets of the profiles within the token budget, not their raw JSON
+        query_analysis = analyze_query(q)
+        matches = []
+        for ctx in contexts:
+            match_analysis = analyze_profile_match(ctx, query_analysis, cache=tokenized_profile_cache)
+            matches.append(dict(ctx, score=match_analysis['total_score'], field_scores=match_analysis['field_scores'],
+                                field_snippets=match_analysis['field_snippets']))
+        scanned = len(contexts)
+        contexts, packing = pack_contexts(sorted(matches, key=lambda m: -m['score']))
         ctx_text = json.dumps({'query': q, 'contexts': contexts})
         messages = [
             {'role': 'system', 'content': 'You are an assistant that answers about candidate profiles. Use the provided JSON context only.'},
             {'role': 'user', 'content': f'Question: {q}\nContext JSON: {ctx_text}\nReturn a concise answer and list matched ids.'},
         ]
-        status_code, content = _openai_chat(messages)
-        timed_out = time.time() > deadline
+        packing['prompt_tokens'] = estimate_prompt_tokens(messages)
+        timed_out = deadline.expired()
+        skipped = coverage.skipped()
+        status_code, content, llm_cache_info = _cached_openai_chat(messages, resolve_llm_cache(request.GET.get('llm_cache')))
         
         # Parse the OpenAI response to extract structured information
         answer_text = "No se encontró información relevante."
@@ -494,24 +838,34 @@ class AIAskView(APIView):
             if not matched_ids:
                 matched_ids = [c['id'] for c in contexts]
         
-        return Response({
+        response_data = {
             'answer': answer_text,
             'matches': [{'id': str(mid), 'score': 1.0} for mid in matched_ids],
             'used': len(contexts),
-            'scanned': len(contexts),
+            'scanned': scanned,
             'status_code': status_code,
-            'partial': timed_out
-        })
+            'partial': timed_out or bool(skipped),
+            'skipped': skipped,
+            'context': packing
+        }
+        if llm_cache_info:
+            response_data['llm_cache'] = llm_cache_info
+        return Response(response_data)
 
 
 class ProfileAIAskView(APIView):
+    renderer_classes = STREAM_RENDERER_CLASSES
+    
     def post(self, request):
-        _load_env()
+        load_env()
         body = request.data or {}
         q = (body.get('message') or '').strip()
         status_f = body.get('status') or 'pending'
         limit = int(body.get('limit') or 5)
         include_analysis = body.get('analysis', True)
+        scorer = resolve_scorer(body.get('scorer'))
+        stream = resolve_stream(request, body.get('stream') or request.GET.get('stream'))
+        use_llm_cache = resolve_llm_cache(body.get('llm_cache'))
         
         if not q and not vacant_id:
             return Response({'error': 'Missing message'}, status=400)
@@ -529,93 +883,79 @@ class ProfileAIAskView(APIView):
         
         # Analyze query first using enhanced RAG analyzer
         query_analysis = analyze_query(q)
+        search = _ProfileSearch(query_analysis, scorer, limit, include_analysis, keep_all=not q)
         
         # Enhanced RAG search with detailed analysis
-        url_base = base.rstrip('/') + '/rest/v1/profile'
-        params = f'?select=id,personal_information,experience,education,skills,projects&status=eq.{status_f}&limit=1000&offset='
-        offset = 0
-        all_matches = []
-        total = 0
-        deadline = time.time() + float(os.environ.get('AI_RAG_BUDGET_SEC', '8'))
-        start_time = time.time()
+        if resolve_pushdown(body.get('pushdown')):
+            search.pushdown = pushdown_filter(query_analysis['tokens'])
         
-        while True:
-            url = url_base + params + str(offset)
+        def events():
+            deadline = rag_deadline()
+            start_time = time.time()
             try:
-                with urlopen(Request(url, headers=headers), timeout=8) as r:
-                    body = r.read().decode('utf-8')
-                    rows = json.loads(body)
-                    if not isinstance(rows, list) or not rows:
-                        break
-                    
-                    for row in rows:
-                        # Use enhanced analyzer for detailed matching
-                        match_analysis = analyze_profile_match(row, query_analysis)
-                        
-                        if match_analysis['total_score'] > 0 or not q:  # Include all if no query
-                            enhanced_match = {
-                                'id': row.get('id'),
-                                'score': match_analysis['total_score'],
-                                'personal_information': row.get('personal_information'),
-                                'skills': row.get('skills'),
-                                'projects': row.get('projects'),
-                                'education': row.get('education'),
-                                'experience': row.get('experience'),
-                                'overall_coverage': match_analysis.get('overall_coverage', 0),
-                                'field_scores': match_analysis.get('field_scores', {}),
-                                'matched_tokens': match_analysis.get('matched_tokens', []),
-                                'missing_tokens': match_analysis.get('missing_tokens', []),
-                                'field_snippets': match_analysis.get('field_snippets', {})
-                            }
-                            
-                            if include_analysis:
-                                enhanced_match['analysis'] = match_analysis
-                            
-                            all_matches.append(enhanced_match)
-                    
-                    total += len(rows)
-                    offset += len(rows)
-                    if len(rows) < 1000:
+                pages, search.replica = _profile_pages(base, headers, PROFILE_SELECT, {'status': status_f}, deadline,
+                                                       search.pushdown, search.coverage)
+                if search.replica:
+                    search.pushdown = ''
+                for rows in pages:
+                    search.feed(rows)
+                    if stream:
+                        yield 'progress', search.progress()
+                    if deadline.expired():
                         break
-                    if time.time() > deadline:
-                        break
-                        
             except HTTPError as e:
-                try:
-                    err_body = e.read().decode('utf-8')
-                except Exception:
-                    err_body = ''
-                return Response({"error": "Supabase HTTPError", "status": e.code, "detail": err_body}, status=502)
+                raise StreamAbort(_supabase_http_error(e), 502)
             except URLError:
-                return Response({"error": "Supabase URLError"}, status=502)
-        
-        # Sort by score (descending) and then by ID
-        all_matches.sort(key=lambda x: (-x['score'], x['id'] or 0))
-        timed_out = time.time() > deadline
-        elapsed_time = time.time() - start_time
-        
-        # Take top matches for context
-        top_matches = all_matches[:limit]
-        
-        # Prepare context for AI
-        contexts = []
-        for match in top_matches:
-            context_text = self._build_context_text(match)
-            contexts.append({
-                'id': match['id'],
-                'text': context_text[:1200],
-                'score': match['score'],
-                'name': match.get('personal_information', {}).get('name', 'Unknown')
-            })
+                raise StreamAbort({"error": "Supabase URLError"}, 502)
+            
+            top_k, scorer_stats = search.rank(lambda row, ma: self._match_entry(row, ma, include_analysis))
+            timed_out = deadline.expired()
+            elapsed_time = time.time() - start_time
+            
+            # Take top matches for context (sorted by score, then ID)
+            top_matches = top_k.payloads()
+            contexts, packing = self._contexts(top_matches)
+            messages = self._messages(q, contexts)
+            packing['prompt_tokens'] = estimate_prompt_tokens(messages)
+            
+            # The ranking is final: clients get the contexts while the answer is generated
+            if stream:
+                yield 'ranked', {'matches': [{'id': str(c['id']), 'score': c['score'], 'name': c['name']} for c in contexts]}
+            
+            # Generate AI answer (same question and contexts: cached answer);
+            # streamed requests get the tokens as they are generated
+            if stream:
+                status_code, content, llm_cache_info = yield from _openai_token_events(messages, use_llm_cache)
+            else:
+                status_code, content, llm_cache_info = _cached_openai_chat(messages, use_llm_cache)
+            response_data = self._response_data(search, scorer_stats, top_matches, contexts, status_code, content, timed_out)
+            response_data['context'] = packing
+            if llm_cache_info:
+                response_data['llm_cache'] = llm_cache_info
+            yield 'result', response_data
+            
+            # Include comprehensive analysis if requested
+            if include_analysis:
+                yield 'analysis', search.summary_acc.summary(query_analysis, search.total, elapsed_time)
         
-        # Generate AI answer
+        return respond(events(), stream)
+    
+    def _contexts(self, top_matches):
+        """
+        Prompt contexts: the best field snippets of the top matches within the
+        AI_LLM_CONTEXT_TOKENS budget. Returns (contexts, packing stats).
+        """
+        return pack_contexts(top_matches)
+    
+    @staticmethod
+    def _messages(q, contexts):
         ctx_json = json.dumps({'query': q, 'contexts': contexts})
-        messages = [
+        return [
             {'role': 'system', 'content': 'You answer questions about candidate profiles using only the provided context. Be specific and mention names when available.'},
             {'role': 'user', 'content': f'{q}\nContext: {ctx_json}\nReturn a concise answer and list matched profile IDs.'},
         ]
-        status_code, content = _openai_chat(messages)
-        
+    
+    def _response_data(self, search, scorer_stats, top_matches, contexts, status_code, content, timed_out):
         # Parse the OpenAI response
         answer_text = "No se encontró información relevante en los perfiles."
         matched_ids = []
@@ -632,7 +972,6 @@ class ProfileAIAskView(APIView):
                     
                 # Look for ID list patterns
                 if any(keyword in line.lower() for keyword in ['matched ids:', 'ids:', 'id:', 'matched:']):
-                    import re
                     id_matches = re.findall(r'\b\d+\b', line)
                     if id_matches:
                         matched_ids = [int(id_str) for id_str in id_matches]
@@ -652,108 +991,185 @@ class ProfileAIAskView(APIView):
             'answer': answer_text,
             'matches': [{'id': str(mid), 'score': next((m['score'] for m in top_matches if m['id'] == mid), 0.0)} for mid in matched_ids],
             'used': len(contexts),
-            'scanned': total,
+            'scanned': search.total,
             'status_code': status_code,
-            'partial': timed_out,
-            'query_analysis': query_analysis if include_analysis else None
+            **search.scan_report(timed_out),
+            'query_analysis': search.query if search.include_analysis else None,
+            'scorer': search.top_k_scorer or 'classic',
+            'pushdown': bool(search.pushdown)
+        }
+        if search.replica:
+            response_data['replica'] = search.replica
+        if scorer_stats:
+            response_data['scorer_stats'] = scorer_stats
+        return response_data
+    
+    def _match_entry(self, row, match_analysis, include_analysis):
+        enhanced_match = {
+            'id': row.get('id'),
+            'score': match_analysis['total_score'],
+            'personal_information': row.get('personal_information'),
+            'skills': row.get('skills'),
+            'projects': row.get('projects'),
+            'education': row.get('education'),
+            'experience': row.get('experience'),
+            'overall_coverage': match_analysis.get('overall_coverage', 0),
+            'field_scores': match_analysis.get('field_scores', {}),
+            'matched_tokens': match_analysis.get('matched_tokens', []),
+            'missing_tokens': match_analysis.get('missing_tokens', []),
+            'field_snippets': match_analysis.get('field_snippets', {})
         }
         
-        # Include comprehensive analysis if requested
         if include_analysis:
-            analysis_summary = generate_analysis_summary(all_matches, query_analysis, total, elapsed_time)
-            response_data['analysis'] = analysis_summary
-        
-        return Response(response_data)
-    
-    def _build_context_text(self, match):
-        """Build context text from profile match"""
-        parts = []
-        
-        # Personal information
-        pi = match.get('personal_information', {})
-        if pi:
-            name = pi.get('name', 'Unknown')
-            email = pi.get('email', '')
-            phone = pi.get('phone', '')
-            summary = pi.get('summary', '')
-            location = pi.get('location', '')
-            
-            personal_text = f"Profile: {name}"
-            if email:
-                personal_text += f", Email: {email}"
-            if phone:
-                personal_text += f", Phone: {phone}"
-            if location:
-                personal_text += f", Location: {location}"
-            if summary:
-                personal_text += f", Summary: {summary}"
-            parts.append(personal_text)
-        
-        # Experience
-        exp = match.get('experience', [])
-        if exp and isinstance(exp, list):
-            for i, job in enumerate(exp[:3]):  # Limit to first 3 jobs
-                if isinstance(job, dict):
-                    title = job.get('title', '')
-                    company = job.get('company', '')
-                    desc = job.get('description', '')[:100]  # Limit description
-                    exp_text = f"Experience {i+1}: {title}"
-                    if company:
-                        exp_text += f" at {company}"
-                    if desc:
-                        exp_text += f", {desc}"
-                    parts.append(exp_text)
-        
-        # Skills
-        skills = match.get('skills', {})
-        if skills and isinstance(skills, dict):
-            languages = skills.get('languages', [])
-            technical = skills.get('technical', [])
-            
-            skill_parts = []
-            if languages:
-                skill_parts.append(f"Languages: {', '.join(languages[:5])}")
-            if technical:
-                skill_parts.append(f"Technical: {', '.join(technical[:5])}")
-            
-            if skill_parts:
-                parts.append("Skills: " + "; ".join(skill_parts))
-        
-        # Education
-        edu = match.get('education', [])
-        if edu and isinstance(edu, list):
-            for i, school in enumerate(edu[:2]):  # Limit to first 2
-                if isinstance(school, dict):
-                    degree = school.get('degree', '')
-                    institution = school.get('institution', '')
-                    edu_text = f"Education {i+1}: {degree}"
-                    if institution:
-                        edu_text += f" from {institution}"
-                    parts.append(edu_text)
-        
-        # Projects
-        projects = match.get('projects', [])
-        if projects and isinstance(projects, list):
-            for i, proj in enumerate(projects[:2]):  # Limit to first 2
-                if isinstance(proj, dict):
-                    title = proj.get('title', '')
-                    desc = proj.get('description', '')[:80]  # Limit description
-                    proj_text = f"Project {i+1}: {title}"
-                    if desc:
-                        proj_text += f", {desc}"
-                    parts.append(proj_text)
-        
-        return ' | '.join(parts)
+            enhanced_match['analysis'] = match_analysis
+        return enhanced_match
+
+
+class _ProfileSearch:
+    """
+    Scan state of one profile query: every fetched page is scored (or collected,
+    for an index-backed scorer) as it arrives and rank() runs the second phase.
+    Shared by the sync views and their async counterparts.
+    """
+
+    def __init__(self, query_analysis, scorer, limit, include_analysis, keep_all=False):
+        self.query = query_analysis
+        self.matcher = QueryMatcher(self.query['tokens'], profile_index)
+        self.top_k_scorer = scorer if scorer != 'classic' and self.query['tokens'] else None
+        self.top_k_rows = {}
+        self.limit = limit
+        self.include_analysis = include_analysis
+        # Keep zero-score rows too (queries without tokens list everything)
+        self.keep_all = keep_all
+        self.top_k = TopKCollector(limit)
+        self.summary_acc = AnalysisSummaryAccumulator()
+        self.total = 0
+        # PostgREST prefilter the profiles were fetched with ('' = full scan)
+        self.pushdown = ''
+        # Replica status when the profiles came from the local replica
+        self.replica = None
+        # Id ranges of the scan and the ones that never arrived
+        self.coverage = ScanCoverage()
+        # Classic-scored rows held back until a batch is big enough for the pool
+        self.pending = []
+
+    def feed(self, rows, page_ids=None):
+        """Score a page of profiles"""
+        if page_ids is None:
+            page_ids = _index_page(rows)
+        if self.top_k_scorer:
+            kept = _collect_top_k_rows(rows, self.query, self.top_k_rows, page_ids, self.top_k_scorer)
+            if self.include_analysis:
+                # The summary covers every matching row, whichever scorer ranks them
+                for row in kept:
+                    match_score = score_profile_match(row, self.query, self.matcher, tokenized_profile_cache)
+                    if match_score['total_score'] > 0:
+                        self.summary_acc.add(match_score)
+        else:
+            candidate_ids = _index_candidates(rows, self.query, self.matcher, page_ids)
+            batch_size = parallel_batch_size()
+            if batch_size:
+                # Pages can be far smaller than the pool threshold (streamed
+                # batches), so the threshold applies to the rows accumulated
+                self.pending.extend(row for row in rows if not _skip_row(row, candidate_ids))
+                if len(self.pending) >= batch_size:
+                    self.flush()
+            else:
+                _score_page(rows, candidate_ids, self.query, self.matcher, self.top_k,
+                            self.summary_acc if self.include_analysis else None, keep_all=self.keep_all)
+        self.total += len(rows)
+
+    def flush(self):
+        """Score the rows held back for the process pool"""
+        rows, self.pending = self.pending, []
+        if rows:
+            _score_page(rows, None, self.query, self.matcher, self.top_k,
+                        self.summary_acc if self.include_analysis else None, keep_all=self.keep_all)
+
+    def progress(self):
+        """
+        Progress event payload: the classic ranking is known while scanning
+        (minus the rows still held back for the pool)
+        """
+        if self.top_k_scorer:
+            return progress_payload(self.total, len(self.top_k_rows))
+        return progress_payload(self.total, self.top_k.count, self.top_k)
+
+    def scan_report(self, timed_out):
+        """
+        'partial' and 'skipped' response fields: the scan is partial when the
+        budget ran out or any id range was not scanned
+        """
+        skipped = self.coverage.skipped()
+        return {'partial': timed_out or bool(skipped), 'skipped': skipped}
+
+    def rank(self, match_entry):
+        """
+        Second phase over the scanned pages: (top-k of match_entry(row, analysis)
+        payloads, scorer stats or None). The top-k's count is the number of
+        matching profiles, whichever scorer ranked them.
+        """
+        self.flush()
+        if not self.top_k_scorer:
+            return _detail_top_k(self.top_k, self.query, self.matcher, match_entry), None
+        ranked, scorer_stats = _rank_top_k(self.top_k_scorer, self.top_k_rows, self.query, self.limit, self.matcher)
+        for row, match_analysis in ranked:
+            self.top_k.add(match_analysis['total_score'], row.get('id'), match_entry(row, match_analysis))
+        self.top_k.count = scorer_stats['candidates']
+        return self.top_k, scorer_stats
+
+
+class _VacancyRanking(_ProfileSearch):
+    """
+    Ranking state of one vacancy while its applicants are scanned; shared by
+    RankingView and RankingBatchView so both return the same shape
+    """
+
+    def __init__(self, vacant_id, vacancy, scorer, limit, include_analysis):
+        super().__init__(analyze_query(_flatten_text(vacancy)), scorer, limit, include_analysis)
+        self.vacant_id = vacant_id
+
+    def response(self, match_entry, timed_out, elapsed_time, coverage=None):
+        """
+        Ranking response; `coverage` is the scan's when several rankings
+        share one (RankingBatchView)
+        """
+        if coverage is not None:
+            self.coverage = coverage
+        top_k, scorer_stats = self.rank(match_entry)
+        top_matches = top_k.payloads()
+        response = {
+            'answer': f'Se encontraron {top_k.count} perfiles aptos para la vacante {self.vacant_id}.',
+            'matches': [{'id': str(m['id']), 'score': m['score']} for m in top_matches],
+            'used': len(top_matches),
+            'scanned': self.total,
+            'status_code': 200,
+            **self.scan_report(timed_out),
+            'vacant_id': str(self.vacant_id),
+            'scorer': self.top_k_scorer or 'classic',
+            'pushdown': bool(self.pushdown)
+        }
+        if self.replica:
+            response['replica'] = self.replica
+        if scorer_stats:
+            response['scorer_stats'] = scorer_stats
+        if self.include_analysis:
+            response['analysis'] = self.summary_acc.summary(self.query, self.total, elapsed_time)
+        return response
 
 
 class RankingView(APIView):
+    renderer_classes = STREAM_RENDERER_CLASSES
+    
     def post(self, request):
-        _load_env()
+        load_env()
         body = request.data or {}
         status_f = body.get('status') or 'pending'
         limit = int(body.get('limit') or 5)
         include_analysis = bool(body.get('analysis', False))
         vacant_id = body.get('vacant_id')
+        scorer = resolve_scorer(body.get('scorer'))
+        stream = resolve_stream(request, body.get('stream') or request.GET.get('stream'))
         if not vacant_id:
             return Response({'error': 'Missing vacant_id'}, status=400)
         base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
@@ -766,8 +1182,10 @@ class RankingView(APIView):
         }
         sel_v = '*'
         url_v = base.rstrip('/') + f'/rest/v1/vacant?id=eq.{vacant_id}&select={sel_v}&limit=1'
+        # One budget for the vacancy lookup and the applicant scan
+        deadline = rag_deadline()
         try:
-            with urlopen(Request(url_v, headers=headers), timeout=8) as r:
+            with urlopen(Request(url_v, headers=headers), timeout=deadline.timeout()) as r:
                 vrows = json.loads(r.read().decode('utf-8'))
                 vacancy = vrows[0] if isinstance(vrows, list) and vrows else None
         except HTTPError as e:
@@ -780,57 +1198,29 @@ class RankingView(APIView):
             return Response({'error': 'Supabase URLError'}, status=502)
         if not vacancy:
             return Response({'error': 'Vacante no encontrada', 'vacant_id': str(vacant_id)}, status=404)
-        vtext = _flatten_text(vacancy)
-        vquery = analyze_query(vtext)
-        url_base = base.rstrip('/') + '/rest/v1/profile'
-        params = f'?select=id,personal_information,experience,education,skills,projects&vacant_id=eq.{vacant_id}&limit=1000&offset='
-        offset = 0
-        all_matches = []
-        total = 0
-        deadline = time.time() + float(os.environ.get('AI_RAG_BUDGET_SEC', '8'))
-        start_time = time.time()
-        while True:
-            url = url_base + params + str(offset)
+        ranking = _VacancyRanking(vacant_id, vacancy, scorer, limit, include_analysis)
+        if resolve_pushdown(body.get('pushdown')):
+            ranking.pushdown = pushdown_filter(ranking.query['tokens'])
+        
+        def events():
+            start_time = time.time()
             try:
-                with urlopen(Request(url, headers=headers), timeout=8) as r:
-                    rows = json.loads(r.read().decode('utf-8'))
-                    if not isinstance(rows, list) or not rows:
-                        break
-                    for row in rows:
-                        ma = analyze_profile_match(row, vquery)
-                        if ma['total_score'] > 0:
-                            all_matches.append({
-                                'id': row.get('id'),
-                                'score': ma['total_score'],
-                                'overall_coverage': ma.get('overall_coverage', 0),
-                                'field_scores': ma.get('field_scores', {}),
-                                'matched_tokens': ma.get('matched_tokens', []),
-                                'analysis_time_ms': ma.get('analysis_time_ms', 0)
-                            })
-                    total += len(rows)
-                    offset += len(rows)
-                    if len(rows) < 1000:
-                        break
-                    if time.time() > deadline:
+                pages, ranking.replica = _profile_pages(base, headers, PROFILE_SELECT, {'vacant_id': vacant_id},
+                                                        deadline, ranking.pushdown, ranking.coverage)
+                if ranking.replica:
+                    ranking.pushdown = ''
+                for rows in pages:
+                    ranking.feed(rows)
+                    if stream:
+                        yield 'progress', ranking.progress()
+                    if deadline.expired():
                         break
-            except Exception:
-                break
-        all_matches.sort(key=lambda x: (-x['score'], x['id'] or 0))
-        top_matches = all_matches[:limit]
-        timed_out = time.time() > deadline
-        elapsed_time = time.time() - start_time
-        response = {
-            'answer': f'Se encontraron {len(all_matches)} perfiles aptos para la vacante {vacant_id}.',
-            'matches': [{'id': str(m['id']), 'score': m['score']} for m in top_matches],
-            'used': len(top_matches),
-            'scanned': total,
-            'status_code': 200,
-            'partial': timed_out,
-            'vacant_id': str(vacant_id)
-        }
-        if include_analysis:
-            response['analysis'] = generate_analysis_summary(all_matches, vquery, total, elapsed_time)
-        return Response(response)
+            except Exception as e:
+                ranking.coverage.fail(e, deadline)
+            timed_out = deadline.expired()
+            yield from result_events(ranking.response(self._match_entry, timed_out, time.time() - start_time))
+        
+        return respond(events(), stream)
         is_count = (('cuantos' in ql or 'cuántos' in ql or 'how many' in ql or 'count' in ql or 'cantidad' in ql or 'total' in ql)
                     and ('registros' in ql or 'records' in ql or 'perfiles' in ql or 'profiles' in ql or 'usuarios' in ql or 'users' in ql or 'candidatos' in ql))
         if is_count:
@@ -950,4 +1340,115 @@ class RankingView(APIView):
                 } for m in all_matches
             ], query_analysis, total, elapsed_time)
         return Response(response)
+    
+    @staticmethod
+    def _match_entry(row, ma):
+        return {
+            'id': row.get('id'),
+            'score': ma['total_score'],
+            'overall_coverage': ma.get('overall_coverage', 0),
+            'field_scores': ma.get('field_scores', {}),
+            'matched_tokens': ma.get('matched_tokens', []),
+            'analysis_time_ms': ma.get('analysis_time_ms', 0)
+        }
+
 
+class RankingBatchView(APIView):
+    """
+    Ranking for several vacancies in one pass: the vacancies come from a single
+    id=in.(...) query and their applicants from one paged scan, each profile
+    scored against the query of the vacancy it applied to
+    """
+    max_vacancies = 100
+
+    def post(self, request):
+        load_env()
+        body = request.data or {}
+        limit = int(body.get('limit') or 5)
+        include_analysis = bool(body.get('analysis', False))
+        scorer = resolve_scorer(body.get('scorer'))
+        vacant_ids = body.get('vacant_ids')
+        if not isinstance(vacant_ids, list) or not vacant_ids:
+            return Response({'error': 'Missing vacant_ids'}, status=400)
+        vacant_ids = list(dict.fromkeys(str(v).strip() for v in vacant_ids))
+        if len(vacant_ids) > self.max_vacancies:
+            return Response({'error': f'Too many vacant_ids (max {self.max_vacancies})'}, status=400)
+        if not all(re.fullmatch(r'[\w-]+', v) for v in vacant_ids):
+            return Response({'error': 'Invalid vacant_ids'}, status=400)
+        base = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        if not base or not key:
+            return Response({'error': 'Missing Supabase env'}, status=500)
+        headers = {
+            'apikey': key,
+            'Authorization': 'Bearer ' + key,
+        }
+        id_list = ','.join(vacant_ids)
+        url_v = base.rstrip('/') + f'/rest/v1/vacant?id=in.({id_list})&select=*'
+        deadline = rag_deadline()
+        try:
+            with urlopen(Request(url_v, headers=headers), timeout=deadline.timeout()) as r:
+                vrows = json.loads(r.read().decode('utf-8'))
+        except HTTPError as e:
+            try:
+                err = e.read().decode('utf-8')
+            except Exception:
+                err = ''
+            return Response({'error': 'Supabase HTTPError', 'status': e.code, 'detail': err}, status=502)
+        except URLError:
+            return Response({'error': 'Supabase URLError'}, status=502)
+        vacancies = {str(v.get('id')): v for v in vrows if isinstance(v, dict)} if isinstance(vrows, list) else {}
+
+        rankings = {
+            vacant_id: _VacancyRanking(vacant_id, vacancies[vacant_id], scorer, limit, include_analysis)
+            for vacant_id in vacant_ids if vacant_id in vacancies
+        }
+        total = 0
+        replica = None
+        coverage = ScanCoverage()
+        start_time = time.time()
+        try:
+            pages = ()
+            if rankings:
+                pages, replica = _profile_pages(base, headers, 'id,vacant_id,personal_information,experience,education,skills,projects',
+                                                {'vacant_id': list(rankings)}, deadline, coverage=coverage)
+            for rows in pages:
+                # Index the page once, then hand every vacancy its own applicants
+                _index_page(rows)
+                by_vacancy = {}
+                for row in rows:
+                    by_vacancy.setdefault(str(row.get('vacant_id')), []).append(row)
+                for vacant_id, vacancy_rows in by_vacancy.items():
+                    ranking = rankings.get(vacant_id)
+                    if ranking is not None:
+                        page_ids = {row['id'] for row in vacancy_rows if row.get('id') is not None}
+                        ranking.feed(vacancy_rows, page_ids)
+                total += len(rows)
+                if deadline.expired():
+                    break
+        except Exception as e:
+            coverage.fail(e, deadline)
+        timed_out = deadline.expired()
+        skipped = coverage.skipped()
+        elapsed_time = time.time() - start_time
+
+        results = []
+        for vacant_id in vacant_ids:
+            ranking = rankings.get(vacant_id)
+            if ranking is None:
+                results.append({'error': 'Vacante no encontrada', 'vacant_id': vacant_id, 'status_code': 404})
+            else:
+                results.append(ranking.response(RankingView._match_entry, timed_out, elapsed_time, coverage))
+        response = {
+            'results': results,
+            'vacant_ids': vacant_ids,
+            'scanned': total,
+            'status_code': 200,
+            'partial': timed_out or bool(skipped),
+            'skipped': skipped,
+            'scorer': scorer,
+            'elapsed_ms': round(elapsed_time * 1000, 2)
+        }
+        if replica:
+            response['replica'] = replica
+        return Response(response)